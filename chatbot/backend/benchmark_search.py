@@ -0,0 +1,146 @@
+"""Benchmark ProductSearchTool on synthetic catalogs.
+
+For each catalog size this measures index build time, snapshot load time,
+memory (arrays held by the tool, and the process's peak RSS) and the
+p50/p99 latency of text, dimension, SKU and mixed queries. Results are
+written as JSON so runs can be diffed between versions. Everything runs
+offline; catalogs come from synthetic_catalog.generate_catalog.
+
+    python benchmark_search.py --sizes 10000 100000 1000000 --output bench_results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+import numpy as np
+from product_search_tool import ProductSearchTool
+from synthetic_catalog import WORDS, generate_catalog
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_QUERIES = 200
+QUERY_KINDS = ["text", "dimension", "sku", "mixed"]
+
+
+def make_queries(df, kind, count, rng):
+    """get_response keyword arguments for count queries of one kind"""
+    if kind == "mixed":
+        kinds = [rng.choice(QUERY_KINDS[:-1]) for _ in range(count)]
+        return [make_queries(df, k, 1, rng)[0] for k in kinds]
+
+    queries = []
+    for _ in range(count):
+        row = df.iloc[rng.randrange(len(df))]
+        text = " ".join(rng.sample(WORDS, rng.randint(1, 3)))
+        if kind == "text":
+            queries.append({"query": text})
+        elif kind == "dimension":
+            queries.append({"query": text, "weight": float(row["Weight (lbs)"]),
+                            "width": float(row["Width (in)"])})
+        else:
+            queries.append({"query": "", "sku": str(row["SKU"])})
+    return queries
+
+
+def latency_stats(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)),
+            "mean_ms": float(ms.mean()), "count": len(ms)}
+
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def benchmark_size(size, num_queries, seed):
+    df = generate_catalog(size, seed=seed)
+
+    start_time = time.perf_counter()
+    tool = ProductSearchTool.from_frame(df)
+    build_seconds = time.perf_counter() - start_time
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot_file = os.path.join(tmp_dir, "search_index.snap")
+        tool.save_snapshot(snapshot_file)
+        snapshot_bytes = os.path.getsize(snapshot_file)
+        start_time = time.perf_counter()
+        ProductSearchTool(csv_file=None, snapshot_file=snapshot_file)
+        load_seconds = time.perf_counter() - start_time
+
+    rng = random.Random(seed)
+    latencies = {}
+    for kind in QUERY_KINDS:
+        queries = make_queries(df, kind, num_queries, rng)
+        timings = []
+        # the dimension path prints its parameters on every call
+        with contextlib.redirect_stdout(io.StringIO()):
+            for query in queries:
+                start_time = time.perf_counter()
+                tool.get_response(**query)
+                timings.append(time.perf_counter() - start_time)
+        latencies[kind] = latency_stats(timings)
+
+    tool_bytes = tool.nbytes
+    return {
+        "products": size,
+        "build_seconds": build_seconds,
+        "snapshot_load_seconds": load_seconds,
+        "snapshot_bytes": snapshot_bytes,
+        "memory": {
+            "tool_bytes": tool_bytes,
+            "bytes_per_product": tool_bytes / size,
+            "peak_rss_bytes": peak_rss_bytes(),
+        },
+        "latency": latencies,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES,
+                        help="queries per kind and size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "queries_per_kind": args.queries, "runs": []}
+    for size in args.sizes:
+        run = benchmark_size(size, args.queries, args.seed)
+        results["runs"].append(run)
+        latency = " ".join(f"{kind} {stats['p50_ms']:.2f}/{stats['p99_ms']:.2f}"
+                           for kind, stats in run["latency"].items())
+        print(f"{size:>9} products: build {run['build_seconds']:.1f}s, "
+              f"load {run['snapshot_load_seconds'] * 1000:.1f}ms, "
+              f"{run['memory']['bytes_per_product']:.0f} B/product, p50/p99 ms: {latency}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import threading
+import time
+from product_search_tool import (ProductSearchTool, UnsupportedCatalogOperation, TOKENIZER, normalize_sku,
+                                 normalize_ranges)
+from result_cache import ResultCache
+from sharded_search import ShardedSearchTool
+
+
+class CatalogManager:
+    """Holds the live ProductSearchTool and swaps in updated copies.
+
+    Updates are applied copy-on-write: a new tool is built next to the live
+    one and the reference is swapped, so searches that already started keep
+    using the catalog they started with. Full rebuilds and compactions run on
+    a background thread; updates that arrive meanwhile are replayed onto the
+    rebuilt catalog before it goes live.
+
+    get_response results are cached per catalog version, so a swap
+    invalidates them. With num_shards > 1 the catalog is served by a
+    ShardedSearchTool, which is rebuilt on reload rather than updated. An
+    embedder turns on hybrid search, which is not available sharded.
+    """
+
+    def __init__(self, csv_file="data.csv", snapshot_file=None, cache_size=1024, cache_ttl=300,
+                 num_shards=1, embedder=None):
+        if embedder is not None and num_shards > 1:
+            raise ValueError("Hybrid search is not supported on a sharded catalog")
+        self.csv_file = csv_file
+        self.snapshot_file = snapshot_file
+        self.num_shards = num_shards
+        self.embedder = embedder
+        self.search_tool = self._build(csv_file, snapshot_file)
+        # bumped on every swap; cached search results carry the version they came from
+        self.version = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._rebuild = None
+        self._pending = []
+        self.cache = ResultCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def get_response(self, query, weight=None, height=None, width=None, length=None, sku=None,
+                     ranges=None):
+        key = self.cache_key(query, weight, height, width, length, sku, ranges)
+        # read the version before the tool: a result computed on a newer
+        # catalog than its version says is never served, the reverse could be
+        version = self.version
+        response = self.cache.get(key, version)
+        if response is None:
+            response = self.search_tool.get_response(
+                query, weight=weight, height=height, width=width, length=length, sku=sku,
+                ranges=ranges)
+            response = self.cache.put(key, version, response)
+        return response
+
+    @staticmethod
+    def cache_key(query, weight=None, height=None, width=None, length=None, sku=None,
+                  ranges=None):
+        """Queries with the same tokens and arguments get the same response"""
+        dims = tuple(None if value is None else float(value)
+                     for value in (weight, height, width, length))
+        sku = None if sku is None else normalize_sku(sku)
+        ranges = tuple(sorted(normalize_ranges(ranges).items()))
+        return (' '.join(TOKENIZER.split(query)),) + dims + (sku, ranges)
+
+    def search(self, query, **kwargs):
+        return self.search_tool.search(query, **kwargs)
+
+    def search_many(self, queries, **kwargs):
+        return self.search_tool.search_many(queries, **kwargs)
+
+    def suggest(self, prefix, **kwargs):
+        return self.search_tool.suggest(prefix, **kwargs)
+
+    def apply_updates(self, upserts=(), deletes=()):
+        """Upsert and delete products (by SKU) and swap in the updated catalog"""
+        if self.num_shards > 1:
+            raise UnsupportedCatalogOperation("Sharded catalogs are updated by reloading them")
+        upserts, deletes = list(upserts), list(deletes)
+        with self._lock:
+            self.search_tool = self.search_tool.with_updates(upserts, deletes)
+            self.version += 1
+            if self.rebuilding:
+                self._pending.append((upserts, deletes))
+            return self.version
+
+    @property
+    def rebuilding(self):
+        return self._rebuild is not None and self._rebuild.is_alive()
+
+    def reload(self, csv_file=None, snapshot_file=None):
+        """Rebuild the catalog from a CSV or snapshot in the background.
+
+        Returns False when a rebuild or compaction is already running.
+        """
+        csv_file = csv_file or self.csv_file
+        return self._start(lambda search_tool: self._build(csv_file, snapshot_file))
+
+    def _build(self, csv_file, snapshot_file):
+        if self.num_shards > 1:
+            return ShardedSearchTool(csv_file=csv_file, num_shards=self.num_shards)
+        return ProductSearchTool(csv_file=csv_file, snapshot_file=snapshot_file,
+                                 embedder=self.embedder)
+
+    def compact(self):
+        """Fold applied updates back into packed arrays in the background"""
+        return self._start(lambda search_tool: search_tool.compacted())
+
+    def _start(self, build):
+        """Run build(live search tool) on a background thread and swap in its result"""
+        with self._lock:
+            if self.rebuilding:
+                return False
+            # the tool is taken under the same lock that starts collecting
+            # updates, so every update is either in it or replayed onto the result
+            self._pending = []
+            self._rebuild = threading.Thread(
+                target=self._run, args=(build, self.search_tool), daemon=True)
+            self._rebuild.start()
+            return True
+
+    def _run(self, build, live_tool):
+        start_time = time.time()
+        try:
+            search_tool = build(live_tool)
+        except Exception as e:
+            print(f"Catalog rebuild failed: {e}")
+            self.last_error = str(e)
+            return
+
+        with self._lock:
+            for upserts, deletes in self._pending:
+                search_tool = search_tool.with_updates(upserts, deletes)
+            self._pending = []
+            previous, self.search_tool = self.search_tool, search_tool
+            self.version += 1
+            self.last_error = None
+        if previous is not search_tool:
+            self._close(previous)
+        print(f"Catalog rebuilt in {time.time() - start_time:.2f} seconds")
+
+    @staticmethod
+    def _close(search_tool):
+        # sharded catalogs own worker processes; close() waits for running searches
+        close = getattr(search_tool, 'close', None)
+        if close is not None:
+            close()
+
+    def close(self):
+        self._close(self.search_tool)
+
+    def wait(self, timeout=None):
+        """Block until the running rebuild (if any) has finished"""
+        rebuild = self._rebuild
+        if rebuild is not None:
+            rebuild.join(timeout)
+        return not self.rebuilding
+
+    def stats(self):
+        search_tool = self.search_tool
+        return {
+            'version': self.version,
+            'products': search_tool.num_products,
+            'pending_compaction': search_tool.has_updates,
+            'hybrid': search_tool.dense is not None,
+            'rebuilding': self.rebuilding,
+            'last_error': self.last_error,
+            'cache': self.cache.stats(),
+        }
@@ -0,0 +1,146 @@
+"""Bounded model input for long chat sessions.
+
+ConversationWindow is the agent's pre-model hook. The checkpointed history
+is never changed; what the model sees each step is
+
+- a rolling summary of the turns that fell out of the window,
+- the last `turns` turns verbatim, except that tool outputs of earlier
+  turns are collapsed into short references (what was found, not the
+  whole payload).
+
+Turns leaving the window are folded into the summary batch_turns at a
+time, so the summarizer runs once every few turns rather than on every
+message. The prompt therefore stays bounded by the summary plus at most
+turns + batch_turns - 1 turns, however long the session gets.
+"""
+from typing import Optional
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.prebuilt.chat_agent_executor import AgentState
+from tool_payloads import render_for_llm, truncate_text
+
+HISTORY_TURNS = 6
+SUMMARY_BATCH_TURNS = 4
+SUMMARY_MAX_WORDS = 200
+# products named in a collapsed product lookup
+REFERENCE_PRODUCTS = 5
+REFERENCE_CHARS = 200
+SUMMARY_PROMPT = (
+    "You keep the running summary of a conversation between a shopper and an e-commerce assistant. "
+    "Update the summary with the new messages. Keep what the shopper is looking for, the products and SKUs "
+    "discussed, cart and order changes, and open questions. Reply with the summary only, "
+    f"in at most {SUMMARY_MAX_WORDS} words."
+)
+
+
+class ChatState(AgentState, total=False):
+    """Agent state with the rolling summary of the turns outside the window"""
+    summary: str
+    # id of the last message folded into the summary
+    summarized_through: Optional[str]
+
+
+def split_turns(messages):
+    """Messages grouped into turns, each starting at a user message"""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def tool_reference(message):
+    """Short stand-in for an earlier tool output"""
+    payload = message.artifact
+    if isinstance(payload, dict) and isinstance(payload.get('products'), list):
+        products = payload['products']
+        names = [f"{product.get('Name', '')} (SKU {product.get('SKU', '')})"
+                 for product in products[:REFERENCE_PRODUCTS]]
+        more = f" and {len(products) - REFERENCE_PRODUCTS} more" if len(products) > REFERENCE_PRODUCTS else ""
+        reference = f"{payload.get('status', '')}: {'; '.join(names)}{more}"
+    elif isinstance(payload, dict):
+        reference = render_for_llm(payload)
+    else:
+        reference = str(message.content)
+    return f"[earlier result] {truncate_text(reference, REFERENCE_CHARS)}"
+
+
+def collapse_tool_outputs(messages):
+    return [ToolMessage(content=tool_reference(message), name=message.name, id=message.id,
+                        tool_call_id=message.tool_call_id)
+            if isinstance(message, ToolMessage) else message
+            for message in messages]
+
+
+def transcript(messages):
+    """Plain text of messages for the summarizer, with tool outputs collapsed"""
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"Shopper: {message.content}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Tool {message.name}: {tool_reference(message)}")
+        elif isinstance(message, AIMessage):
+            if message.content:
+                lines.append(f"Assistant: {message.content}")
+            for call in message.tool_calls:
+                lines.append(f"Assistant called {call['name']} with {render_for_llm(call['args'])}")
+    return '\n'.join(lines)
+
+
+class ConversationWindow:
+    """Pre-model hook keeping the model input to a summary plus the last turns"""
+
+    def __init__(self, llm, turns=HISTORY_TURNS, batch_turns=SUMMARY_BATCH_TURNS):
+        if turns < 1 or batch_turns < 1:
+            raise ValueError("turns and batch_turns must be at least 1")
+        # the summarizer's tokens are not part of the reply, so keep them out of streams
+        self.llm = llm.with_config(tags=["nostream"])
+        self.turns = turns
+        self.batch_turns = batch_turns
+
+    def as_hook(self):
+        return RunnableLambda(self.update, afunc=self.aupdate, name="conversation_window")
+
+    def _plan(self, state):
+        """(messages to summarize, messages to show) for the state"""
+        messages = list(state['messages'])
+        through = state.get('summarized_through')
+        start = 0
+        if through is not None:
+            start = next((i + 1 for i, message in enumerate(messages) if message.id == through), 0)
+        turns = split_turns(messages[start:])
+        outside = turns[:-self.turns]
+        if len(outside) < self.batch_turns:
+            return [], turns
+        return [message for turn in outside for message in turn], turns[-self.turns:]
+
+    def _update(self, summarized, turns, summary):
+        visible = [message for turn in turns[:-1] for message in collapse_tool_outputs(turn)]
+        visible += turns[-1] if turns else []
+        if summary:
+            visible.insert(0, SystemMessage(f"Summary of the earlier conversation: {summary}"))
+        update = {'llm_input_messages': visible}
+        if summarized:
+            update['summary'] = summary
+            update['summarized_through'] = summarized[-1].id
+        return update
+
+    def _summary_prompt(self, summary, messages):
+        return [SystemMessage(SUMMARY_PROMPT),
+                HumanMessage(f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript(messages)}")]
+
+    def update(self, state):
+        summarized, turns = self._plan(state)
+        summary = state.get('summary', '')
+        if summarized:
+            summary = self.llm.invoke(self._summary_prompt(summary, summarized)).content
+        return self._update(summarized, turns, summary)
+
+    async def aupdate(self, state):
+        summarized, turns = self._plan(state)
+        summary = state.get('summary', '')
+        if summarized:
+            summary = (await self.llm.ainvoke(self._summary_prompt(summary, summarized))).content
+        return self._update(summarized, turns, summary)
@@ -0,0 +1,194 @@
+"""Retention for the Postgres checkpointer's tables.
+
+The checkpointer writes a checkpoint for every step of every turn and never
+deletes one, so checkpoints, checkpoint_blobs and checkpoint_writes grow for
+as long as the service runs. CheckpointRetention prunes them on a background
+thread:
+
+- threads whose latest checkpoint is older than ttl seconds are deleted,
+- every other thread keeps only its latest `keep` checkpoints (and their
+  pending writes),
+- channel blobs no kept checkpoint refers to are deleted with them.
+
+Deletes run in batches of batch_size threads, one short transaction each,
+so a pass never holds locks on much of the tables at once. Only the latest
+checkpoint is needed to continue a conversation; pruning only shortens what
+get_state_history can go back to.
+"""
+import threading
+import time
+import psycopg
+
+# threads idle for longer than ttl; the checkpoint's ts is when it was written
+DELETE_IDLE_THREADS_SQL = """
+with idle as (
+    select thread_id from checkpoints
+    group by thread_id
+    having max((checkpoint ->> 'ts')::timestamptz) < now() - make_interval(secs => %(ttl)s)
+    limit %(batch_size)s
+), writes as (
+    delete from checkpoint_writes where thread_id in (select thread_id from idle)
+), blobs as (
+    delete from checkpoint_blobs where thread_id in (select thread_id from idle)
+), deleted as (
+    delete from checkpoints where thread_id in (select thread_id from idle)
+    returning thread_id
+)
+select count(distinct thread_id), count(*) from deleted
+"""
+
+SELECT_LONG_THREADS_SQL = """
+select distinct thread_id from (
+    select thread_id from checkpoints
+    group by thread_id, checkpoint_ns
+    having count(*) > %(keep)s
+) long_threads
+limit %(batch_size)s
+"""
+
+# checkpoint ids are time ordered, so a thread's latest checkpoints sort last
+DELETE_OLD_CHECKPOINTS_SQL = """
+with ranked as (
+    select thread_id, checkpoint_ns, checkpoint_id,
+           row_number() over (partition by thread_id, checkpoint_ns order by checkpoint_id desc) as position
+    from checkpoints
+    where thread_id = any(%(thread_ids)s)
+), old as (
+    select thread_id, checkpoint_ns, checkpoint_id from ranked where position > %(keep)s
+), writes as (
+    delete from checkpoint_writes w using old
+    where w.thread_id = old.thread_id and w.checkpoint_ns = old.checkpoint_ns
+      and w.checkpoint_id = old.checkpoint_id
+)
+delete from checkpoints c using old
+where c.thread_id = old.thread_id and c.checkpoint_ns = old.checkpoint_ns
+  and c.checkpoint_id = old.checkpoint_id
+"""
+
+# A blob is written before the checkpoint that refers to it, so a blob no
+# checkpoint refers to may belong to a checkpoint being written. Versions of a
+# channel only grow: one older than every kept checkpoint's version of its
+# channel can't be referred to again.
+DELETE_UNREFERENCED_BLOBS_SQL = """
+with kept as (
+    select c.thread_id, c.checkpoint_ns, v.key as channel, min(v.value) as oldest_version
+    from checkpoints c, jsonb_each_text(c.checkpoint -> 'channel_versions') v
+    where c.thread_id = any(%(thread_ids)s)
+    group by c.thread_id, c.checkpoint_ns, v.key
+)
+delete from checkpoint_blobs b using kept
+where b.thread_id = kept.thread_id and b.checkpoint_ns = kept.checkpoint_ns
+  and b.channel = kept.channel and b.version < kept.oldest_version
+"""
+
+
+class CheckpointRetention:
+    """Background job pruning the checkpointer's tables every interval seconds.
+
+    It uses its own connection, opened for each pass, so pruning never takes
+    connections from the pool chat turns use.
+    """
+
+    def __init__(self, conninfo, keep=20, ttl=30 * 86400, interval=600, batch_size=200,
+                 batch_pause=0.05, connect_kwargs=None):
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+        self.conninfo = conninfo
+        self.keep = keep
+        self.ttl = ttl
+        self.interval = interval
+        self.batch_size = batch_size
+        # seconds between batches, so a long pass leaves room for chat writes
+        self.batch_pause = batch_pause
+        self.connect_kwargs = connect_kwargs or {}
+        self.passes = 0
+        self.threads_deleted = 0
+        self.checkpoints_deleted = 0
+        self.blobs_deleted = 0
+        self.last_run = None
+        self.last_seconds = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background job; False when it is already running"""
+        if self.running:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="checkpoint-retention", daemon=True)
+        self._thread.start()
+        return True
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self, timeout=None):
+        """Stop the job after the running batch"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Checkpoint retention failed: {e}")
+                self.last_error = str(e)
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        """One pruning pass; returns (threads, checkpoints, blobs) deleted"""
+        start_time = time.perf_counter()
+        threads = checkpoints = blobs = 0
+        with psycopg.connect(self.conninfo, autocommit=True, **self.connect_kwargs) as conn:
+            while not self._stop.is_set():
+                with conn.transaction():
+                    deleted_threads, deleted_checkpoints = conn.execute(
+                        DELETE_IDLE_THREADS_SQL, {'ttl': self.ttl, 'batch_size': self.batch_size}).fetchone()
+                if not deleted_threads:
+                    break
+                threads += deleted_threads
+                checkpoints += deleted_checkpoints
+                self._stop.wait(self.batch_pause)
+
+            done = set()
+            while not self._stop.is_set():
+                thread_ids = [row[0] for row in conn.execute(
+                    SELECT_LONG_THREADS_SQL, {'keep': self.keep, 'batch_size': self.batch_size})]
+                thread_ids = [thread_id for thread_id in thread_ids if thread_id not in done]
+                if not thread_ids:
+                    break
+                with conn.transaction():
+                    params = {'thread_ids': thread_ids, 'keep': self.keep}
+                    checkpoints += conn.execute(DELETE_OLD_CHECKPOINTS_SQL, params).rowcount
+                    blobs += conn.execute(DELETE_UNREFERENCED_BLOBS_SQL, params).rowcount
+                # threads written to meanwhile can come back over keep; they wait for the next pass
+                done.update(thread_ids)
+                self._stop.wait(self.batch_pause)
+
+        self.passes += 1
+        self.threads_deleted += threads
+        self.checkpoints_deleted += checkpoints
+        self.blobs_deleted += blobs
+        self.last_run = time.time()
+        self.last_seconds = time.perf_counter() - start_time
+        self.last_error = None
+        return threads, checkpoints, blobs
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'keep': self.keep,
+            'ttl': self.ttl,
+            'interval': self.interval,
+            'passes': self.passes,
+            'threads_deleted': self.threads_deleted,
+            'checkpoints_deleted': self.checkpoints_deleted,
+            'blobs_deleted': self.blobs_deleted,
+            'last_run': self.last_run,
+            'last_seconds': self.last_seconds,
+            'last_error': self.last_error,
+        }
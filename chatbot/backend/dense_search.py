@@ -0,0 +1,196 @@
+"""Dense product vectors for hybrid (lexical + semantic) search.
+
+An embedder is anything with LangChain's Embeddings interface,
+embed_documents(texts) and embed_query(text): OpenAIEmbeddings pointed at
+the proxy's embeddings model, or HashingEmbedder, which needs no network
+and always gives the same vectors, for offline use and tests.
+
+VectorIndex keeps the unit-length product vectors in an inverted file
+(IVF) index: k-means centroids partition the vectors, and a query only
+scans the lists of its nprobe closest centroids.
+"""
+import re
+import zlib
+import numpy as np
+
+HASHING_DIMENSIONS = 256
+# weight of a character trigram relative to a whole word
+HASHING_NGRAM_WEIGHT = 0.5
+EMBEDDING_BATCH_SIZE = 256
+
+# catalogs smaller than this are scanned exactly
+IVF_MIN_VECTORS = 4096
+IVF_MAX_LISTS = 1024
+IVF_TRAINING_ITERATIONS = 10
+IVF_TRAINING_SAMPLE = 64
+DEFAULT_NPROBE = 16
+# rows per block when scoring vectors against centroids
+ASSIGN_BLOCK_SIZE = 65536
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class HashingEmbedder:
+    """Deterministic embedder hashing words and character trigrams into a fixed-size vector.
+
+    Trigrams make inflections of a word ("burying", "burial") land close
+    together; there is no notion of synonyms.
+    """
+
+    def __init__(self, dimensions=HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    @property
+    def name(self):
+        return f"hashing-{self.dimensions}"
+
+    def _features(self, text):
+        for word in WORD_PATTERN.findall(text.lower()):
+            yield word, 1.0
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], HASHING_NGRAM_WEIGHT
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, weight in self._features(text):
+            # crc32 is stable across processes, unlike hash()
+            h = zlib.crc32(feature.encode('utf-8'))
+            vector[h % self.dimensions] += weight if h & 0x80000000 else -weight
+        return vector
+
+    def embed_documents(self, texts):
+        return np.array([self.embed_query(text) for text in texts], dtype=np.float32).reshape(
+            len(texts), self.dimensions)
+
+
+def embedder_name(embedder):
+    """Identifier of an embedder, recorded in snapshots so vectors from another model aren't mixed in"""
+    for attribute in ('name', 'model'):
+        value = getattr(embedder, attribute, None)
+        if isinstance(value, str):
+            return value
+    return type(embedder).__name__
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def embed_documents(embedder, texts, batch_size=EMBEDDING_BATCH_SIZE):
+    """Unit-length float32 vectors of texts, embedded in batches"""
+    batches = [np.asarray(embedder.embed_documents(texts[start:start + batch_size]), dtype=np.float32)
+               for start in range(0, len(texts), batch_size)]
+    if not batches:
+        return np.zeros((0, 0), dtype=np.float32)
+    return normalize_rows(np.concatenate(batches))
+
+
+def embed_query(embedder, text):
+    return normalize_rows(embedder.embed_query(text))
+
+
+def _assign(vectors, centroids):
+    """Closest centroid (by inner product) of every vector"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        block = vectors[start:start + ASSIGN_BLOCK_SIZE]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors, num_lists, seed=0):
+    """Spherical k-means centroids, trained on a sample of the vectors"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), num_lists * IVF_TRAINING_SAMPLE)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    centroids = sample[rng.choice(len(sample), num_lists, replace=False)]
+    for _ in range(IVF_TRAINING_ITERATIONS):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        # a list that lost all its vectors keeps its old centroid
+        empty = np.bincount(assignments, minlength=num_lists) == 0
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class VectorIndex:
+    """IVF index over unit-length document vectors, scored by inner product.
+
+    Vectors added with with_vectors() are scanned exactly until compaction.
+    """
+
+    def __init__(self, vectors, centroids, indptr, order, size=None):
+        self.vectors = vectors
+        self.centroids = centroids
+        # CSR: order[indptr[c]:indptr[c + 1]] are the ids in list c
+        self.indptr = indptr
+        self.order = order
+        # vectors covered by the lists; later ones are scanned exactly
+        self.size = len(vectors) if size is None else size
+
+    @classmethod
+    def build(cls, vectors, num_lists=None, seed=0, centroids=None):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if centroids is None:
+            if num_lists is None:
+                num_lists = 1 if len(vectors) < IVF_MIN_VECTORS else min(
+                    IVF_MAX_LISTS, int(np.sqrt(len(vectors))))
+            if num_lists > 1:
+                centroids = train_centroids(vectors, num_lists, seed)
+            else:
+                centroids = np.zeros((1, vectors.shape[1]), dtype=np.float32)
+        if len(centroids) > 1:
+            assignments = _assign(vectors, centroids)
+        else:
+            assignments = np.zeros(len(vectors), dtype=np.int32)
+        order = np.argsort(assignments, kind='stable').astype(np.int64)
+        indptr = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=len(centroids)), out=indptr[1:])
+        return cls(vectors, centroids, indptr, order)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, query, k, nprobe=DEFAULT_NPROBE):
+        """Ids and similarities of the (approximately) k most similar vectors, best first"""
+        nprobe = min(nprobe, len(self.centroids))
+        if nprobe < len(self.centroids):
+            lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        else:
+            lists = np.arange(len(self.centroids))
+        doc_ids = np.concatenate([self.order[self.indptr[c]:self.indptr[c + 1]] for c in lists.tolist()]
+                                 + [np.arange(self.size, len(self.vectors))])
+        scores = self.vectors[doc_ids] @ query
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            doc_ids, scores = doc_ids[best], scores[best]
+        ranked = np.lexsort((doc_ids, -scores))
+        return doc_ids[ranked], scores[ranked]
+
+    def similarity(self, query, doc_ids):
+        """Exact similarities of the given documents to the query"""
+        return self.vectors[doc_ids] @ query
+
+    def with_vectors(self, vectors):
+        """Copy with vectors appended as new documents; they are scanned exactly"""
+        return VectorIndex(np.concatenate([self.vectors, vectors]), self.centroids,
+                           self.indptr, self.order, self.size)
+
+    def take(self, doc_ids):
+        """Index over the given documents only, keeping the trained centroids"""
+        return VectorIndex.build(self.vectors[doc_ids], centroids=self.centroids)
+
+    def to_arrays(self):
+        if self.size != len(self.vectors):
+            raise ValueError("compact the vector index before serializing it")
+        return {'vectors': self.vectors, 'centroids': self.centroids,
+                'indptr': self.indptr, 'order': self.order}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['vectors'], arrays['centroids'], arrays['indptr'], arrays['order'])
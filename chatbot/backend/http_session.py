@@ -0,0 +1,48 @@
+import asyncio
+import contextlib
+import aiohttp
+
+# seconds before an API call gives up
+REQUEST_TIMEOUT = 30
+
+
+class HttpSession:
+    """aiohttp session shared by a tool's API calls.
+
+    A ClientSession belongs to the event loop it was created on, so a call on
+    another loop gets a new one, and the previous session is closed rather
+    than left holding its connections.
+    """
+
+    def __init__(self, timeout=REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self._session = None
+        self._loop = None
+
+    async def get(self):
+        """The session for the running event loop, created on first use"""
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._loop is loop:
+            return self._session
+        previous, previous_loop = self._session, self._loop
+        # replaced before anything is awaited, so concurrent calls share the new session
+        session = self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self._loop = loop
+        if previous is not None and not previous.closed:
+            await self._close(previous, previous_loop)
+        return session
+
+    @staticmethod
+    async def _close(session, loop):
+        if loop is not asyncio.get_running_loop() and loop.is_running():
+            # its connections belong to that loop; close them there
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), loop))
+            return
+        # the transports of a closed loop are already gone; this releases the connector
+        with contextlib.suppress(RuntimeError):
+            await session.close()
+
+    async def close(self):
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            await self._close(session, self._loop)
@@ -0,0 +1,38 @@
+"""Async Postgres checkpointer for a connection pool.
+
+AsyncPostgresSaver serializes every read and write behind one saver-wide
+lock, in case its single connection is shared between coroutines. On a
+pool each operation checks out its own connection, so the lock would only
+make chat sessions wait on each other. PooledAsyncPostgresSaver opens its
+cursors the same way, minus the lock.
+
+_cursor is the saver's internal hook for every database operation, so
+langgraph-checkpoint-postgres is pinned in requirements.txt, and
+test_postgres_checkpointer.py fails when an upgrade changes the hook.
+"""
+from contextlib import asynccontextmanager
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+
+class PooledAsyncPostgresSaver(AsyncPostgresSaver):
+    """AsyncPostgresSaver whose operations run concurrently, each on its own pooled connection"""
+
+    def __init__(self, pool, serde=None):
+        if not isinstance(pool, AsyncConnectionPool):
+            raise TypeError("PooledAsyncPostgresSaver needs an AsyncConnectionPool")
+        super().__init__(pool, serde=serde)
+
+    @asynccontextmanager
+    async def _cursor(self, *, pipeline=False):
+        async with self.conn.connection() as conn:
+            if not pipeline:
+                async with conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            elif self.supports_pipeline:
+                async with conn.pipeline(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            else:
+                async with conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
@@ -1,9 +1,16 @@
+import copy
 import pandas as pd
+import os
 import re
-from rank_bm25 import BM25Okapi
 import numpy as np
 import time
+from functools import lru_cache
 from nltk.stem import PorterStemmer
+from dense_search import VectorIndex, embed_documents, embed_query, embedder_name
+from product_store import ProductStore
+from search_index import (InvertedIndex, PrefixIndex, RangeIndex, TermTable, TrigramIndex, top_k,
+                          largest_score_drop, drop_cutoff)
+from search_snapshot import SnapshotError, read_snapshot, write_snapshot
 
 """
 def _lookup_product_info(
@@ -35,32 +42,222 @@ DIMENSION_SCORE_MULTIPLIER = 3.0
 SKU_MATCH_SCORE = 10.0
 LOW_DIMENSION_SCORE_PENALTY = 0.25
 DIMENSION_SCORE_THRESHOLD_FACTOR = 0.5
+# hybrid search: semantic similarity is added to the BM25 score like the dimension score
+DENSE_SCORE_MULTIPLIER = 3.0
+DENSE_CANDIDATES = 100
+GTIN_COLUMN = "GTIN, UPC, EAN, or ISBN"
+# autocomplete: featured products come first, then the most popular by the
+# first of these columns the catalog has
+FEATURED_COLUMN = "Is featured?"
+POPULARITY_COLUMNS = ["Total sales", "Stock"]
+DEFAULT_SUGGESTIONS = 10
+SUGGEST_KEY_BYTES = 32
+WORD_START_PATTERN = re.compile(r'\b\w')
+NAME_SKU_PATTERN = re.compile(r'\(([\w\-/.]+)\)\s*$')
+VARIANT_PATTERN = re.compile(r'[?&]variant=([^&#\s]+)')
+
+# search parameter -> catalog column, in the order the scores are summed
+DIMENSION_COLUMNS = {
+    'weight': "Weight (lbs)",
+    'length': "Length (in)",
+    'width': "Width (in)",
+    'height': "Height (in)",
+}
+
+
+# a hyphenated pair ("4-conductor") or a plain word, matched on lowercased text
+TOKEN_PATTERN = re.compile(r'\w+-\w+|\w+')
+# bump whenever tokens change, so snapshots built with older tokens are rebuilt
+TOKENIZER_VERSION = 2
+# misspelled query words are matched to vocabulary words: shorter words are
+# left alone, longer ones allow one edit and the longest two
+FUZZY_TERM_PATTERN = re.compile(r'[a-z]+(?:-[a-z]+)*')
+FUZZY_MIN_LENGTH = 5
+FUZZY_TWO_EDIT_LENGTH = 9
+STEM_CACHE_SIZE = 200_000
+QUERY_CACHE_SIZE = 4096
+
+
+def normalize_ranges(ranges):
+    """{dim: (low, high)} with float bounds, low <= high and open ranges dropped.
+
+    A bound of None is open. Raises ValueError for unknown dimensions.
+    """
+    normalized = {}
+    for dim, bounds in (ranges or {}).items():
+        if dim not in DIMENSION_COLUMNS:
+            raise ValueError(f"Unknown dimension for a range: {dim}")
+        low, high = (None if bound is None else float(bound) for bound in bounds)
+        if low is None and high is None:
+            continue
+        if low is not None and high is not None and low > high:
+            low, high = high, low
+        normalized[dim] = (low, high)
+    return normalized
+
+
+def range_targets(ranges, weight=None, height=None, width=None, length=None):
+    """Dimension targets with the middle of each closed range filled in where none was given"""
+    targets = {'weight': weight, 'height': height, 'width': width, 'length': length}
+    for dim, (low, high) in ranges.items():
+        if targets[dim] is None and low is not None and high is not None:
+            targets[dim] = (low + high) / 2
+    return targets['weight'], targets['height'], targets['width'], targets['length']
+
+
+class Tokenizer:
+    """Tokenizer that preserves hyphenated words and applies Porter stemming.
+
+    Stems are memoized per word since catalog vocabulary repeats heavily, and
+    whole query strings are memoized since the agent repeats its searches.
+    """
+
+    def __init__(self, stem_cache_size=STEM_CACHE_SIZE, query_cache_size=QUERY_CACHE_SIZE):
+        self.stemmer = PorterStemmer()
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+        self._tokenize_query = lru_cache(
+            maxsize=query_cache_size)(self._tokenize_tuple)
+
+    def split(self, text):
+        """Lowercase word tokens in text order"""
+        return TOKEN_PATTERN.findall(text.lower())
+
+    def analyze(self, text):
+        """Tokens in text order together with their stems"""
+        tokens = self.split(text)
+        stem = self.stem
+        return tokens, [stem(token) for token in tokens]
+
+    def tokenize(self, text):
+        """Unique stemmed and unstemmed tokens, as indexed by BM25"""
+        tokens, stemmed_tokens = self.analyze(text)
+        return list(set(stemmed_tokens + tokens))
+
+    def _tokenize_tuple(self, text):
+        return tuple(self.tokenize(text))
+
+    def tokenize_query(self, text):
+        """tokenize() for query strings, served from an LRU cache"""
+        return list(self._tokenize_query(text))
+
+
+TOKENIZER = Tokenizer()
 
 
 def custom_tokenizer(text):
     """Custom tokenizer that preserves hyphenated words and special patterns and applies stemming"""
-    text = re.sub(r'(\d+[-]\w+|\w+[-]\w+)',
-                  lambda m: m.group().replace('-', '_HYPHEN_'), text)
+    return TOKENIZER.tokenize_query(text)
+
+
+def normalize_sku(value):
+    """Canonical form of a SKU, GTIN or variant code used for exact lookups"""
+    # pandas reads numeric SKU columns with gaps as floats (230025.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip().lower()
+
+
+def compact_sku(value):
+    """Normalized SKU without separators, so 23-0025 also finds 230025"""
+    return re.sub(r'[^0-9a-z]', '', normalize_sku(value))
+
+
+def sku_aliases(df):
+    """Map normalized SKUs and their aliases to row positions of a catalog frame.
+
+    Real SKUs always win; GTINs, the "(SKU)" suffix of product names and the
+    variant of the product link only fill in keys that are still free.
+    """
+    aliases = {}
+
+    def add(value, row):
+        for key in (normalize_sku(value), compact_sku(value)):
+            if key:
+                aliases.setdefault(key, row)
+
+    def column(name):
+        if name in df.columns:
+            return df[name].tolist()
+        return [''] * len(df)
 
-    # Extract tokens, preserving specific patterns
-    tokens = re.findall(r'\b\w+(?:_HYPHEN_\w+)*\b', text.lower())
-    tokens = [token.replace('_HYPHEN_', '-') for token in tokens]
+    for i, sku in enumerate(column('SKU')):
+        add(sku, i)
 
-    # Stemming
-    stemmer = PorterStemmer()
-    stemmed_tokens = [stemmer.stem(token) for token in tokens]
+    for i, (gtin, name, link) in enumerate(zip(column(GTIN_COLUMN), column('Name'), column('Supabase_ID'))):
+        add(gtin, i)
+        name_sku = NAME_SKU_PATTERN.search(str(name))
+        if name_sku:
+            add(name_sku.group(1), i)
+        variant = VARIANT_PATTERN.search(str(link))
+        if variant:
+            add(variant.group(1), i)
 
-    combined_tokens = list(set(stemmed_tokens + tokens))
+    return aliases
 
-    return combined_tokens
+
+def fuzzy_max_distance(term):
+    """Edits allowed when matching term to the vocabulary; 0 for terms that aren't corrected"""
+    if len(term) < FUZZY_MIN_LENGTH or not FUZZY_TERM_PATTERN.fullmatch(term):
+        return 0
+    return 2 if len(term) >= FUZZY_TWO_EDIT_LENGTH else 1
+
+
+def fuzzy_vocabulary(terms):
+    """Vocabulary terms misspellings are corrected to (words, not numbers or codes)"""
+    return [term for term in terms if FUZZY_TERM_PATTERN.fullmatch(term)]
+
+
+def normalize_prefix(text):
+    """Lowercase text with single spaces, as autocomplete keys are stored"""
+    return ' '.join(str(text).lower().split())
+
+
+def suggestion_keys(name, sku):
+    """Autocomplete keys of a product: its name from every word on, and its SKU"""
+    name = normalize_prefix(name)
+    keys = [name[match.start():] for match in WORD_START_PATTERN.finditer(name)]
+    keys += [key for key in (normalize_sku(sku), compact_sku(sku)) if key]
+    return list(dict.fromkeys(keys))
+
+
+def _numeric_column(df, name, default=0.0):
+    if name not in df.columns:
+        return np.full(len(df), default)
+    return pd.to_numeric(df[name], errors='coerce').fillna(default).to_numpy(dtype=np.float64)
+
+
+def phrase_bigrams(stemmed_tokens):
+    """Adjacent stemmed token pairs, joined by a space"""
+    return [f"{first} {second}" for first, second in zip(stemmed_tokens, stemmed_tokens[1:])]
+
+
+def read_catalog(csv_file):
+    """Catalog frame of a product CSV export"""
+    # most rows of the shop export end in a trailing comma; without index_col=False
+    # pandas takes ID as the index and shifts every column one to the left
+    return pd.read_csv(csv_file, index_col=False)
+
+
+class UnsupportedCatalogOperation(RuntimeError):
+    """The catalog can't do this in its current setup, e.g. update a sharded catalog in place"""
 
 
 class ProductSearchTool:
-    def __init__(self, csv_file="data.csv"):
-        self.df = pd.read_csv(csv_file)
-        self.df = self.df.fillna('')
-        self.stemmer = PorterStemmer()
-        self.prepare_search_index()
+    # hybrid search is on when an embedder is given
+    embedder = None
+    dense = None
+
+    def __init__(self, csv_file="data.csv", snapshot_file=None, embedder=None):
+        self.embedder = embedder
+        if snapshot_file and os.path.exists(snapshot_file):
+            try:
+                self.load_snapshot(snapshot_file)
+                return
+            except SnapshotError as e:
+                print(f"Rebuilding search index from {csv_file}: {e}")
+
+        # the frame is only needed while indexing; the store keeps the served fields
+        self.prepare_search_index(read_catalog(csv_file).fillna(''))
 
     # Define the relevant fields to keep in the response
     RELEVANT_FIELDS = [
@@ -68,132 +265,496 @@ class ProductSearchTool:
         "In stock?", "Weight (lbs)", "Length (in)", "Width (in)",
         "Regular price", "Categories", "Supabase_ID", "search_text"
     ]
+    RELEVANT_FIELD_SET = frozenset(RELEVANT_FIELDS)
+
+    # Columns indexing reads that are not served, kept so an updated product
+    # can be indexed again from its whole record
+    SOURCE_FIELDS = [
+        "Type", "GTIN, UPC, EAN, or ISBN", "Published", "Is featured?", "Visibility in catalog", "Stock",
+        "Backorders allowed?", "Sold individually?", "Allow customer reviews?", "Position",
+        "Meta: _wp_page_template", "Height (in)", "Total sales"
+    ]
 
-    def prepare_search_index(self):
-        columns = [
-            "ID", "Type", "SKU", "GTIN, UPC, EAN, or ISBN", "Name", "Published", "Is featured?",
-            "Visibility in catalog", "Short description", "Description", "Tax status", "In stock?", "Stock",
-            "Backorders allowed?", "Sold individually?", "Weight (lbs)", "Length (in)", "Width (in)",
-            "Allow customer reviews?", "Regular price", "Categories", "Position", "Meta: _wp_page_template", "Supabase_ID"
-        ]
+    # Columns describing the product in words, which hybrid search embeds
+    EMBEDDING_COLUMNS = ["Name", "Short description", "Description", "Categories"]
 
-        existing_columns = [col for col in columns if col in self.df.columns]
+    # Columns joined into the text that BM25 indexes
+    SEARCH_COLUMNS = [
+        "ID", "Type", "SKU", "GTIN, UPC, EAN, or ISBN", "Name", "Published", "Is featured?",
+        "Visibility in catalog", "Short description", "Description", "Tax status", "In stock?", "Stock",
+        "Backorders allowed?", "Sold individually?", "Weight (lbs)", "Length (in)", "Width (in)",
+        "Allow customer reviews?", "Regular price", "Categories", "Position", "Meta: _wp_page_template", "Supabase_ID"
+    ]
 
-        self.df['search_text'] = self.df[existing_columns].astype(
+    @classmethod
+    def from_frame(cls, df, embedder=None):
+        """Index a catalog that is already loaded as a DataFrame"""
+        tool = cls.__new__(cls)
+        tool.embedder = embedder
+        tool.prepare_search_index(df.fillna(''))
+        return tool
+
+    @property
+    def num_products(self):
+        return len(self.index)
+
+    def prepare_search_index(self, df):
+        parts = self._index_frame(df)
+        self.index = InvertedIndex(parts['tokenized'])
+        self.fuzzy_terms = TrigramIndex.build(fuzzy_vocabulary(self.index.terms))
+        self.bigrams = TermTable.from_strings(parts['bigrams'])
+        self.dimensions = parts['dimensions']
+        self.ranges = self._build_ranges()
+        self.store = parts['store']
+        self.sources = parts['sources']
+        self._set_sku_table(parts['sku_aliases'])
+        self.suggestions = PrefixIndex.build(parts['suggest_keys'], parts['featured'],
+                                             parts['popularity'], SUGGEST_KEY_BYTES)
+        if self.embedder is not None:
+            self.dense = VectorIndex.build(
+                embed_documents(self.embedder, parts['embedding_text']))
+
+    def _build_ranges(self):
+        return {dim: RangeIndex.build(values) for dim, values in self.dimensions.items()}
+
+    def _index_frame(self, df):
+        """Search text, tokens, bigrams, dimension arrays, product columns and SKU aliases of a catalog frame"""
+        existing_columns = [
+            col for col in self.SEARCH_COLUMNS if col in df.columns]
+
+        # empty numeric fields of updated products are NaN; they add no text, as in a fresh build
+        df['search_text'] = df[existing_columns].fillna('').astype(
             str).agg(' '.join, axis=1)
 
-        self.tokenized = [custom_tokenizer(text)
-                          for text in self.df['search_text']]
-        self.bm25 = BM25Okapi(self.tokenized)
+        # tokenize every document once, collecting the stemmed bigrams used by
+        # get_matched_terms alongside the BM25 tokens
+        tokenized = []
+        bigrams = set()
+        for text in df['search_text']:
+            tokens, stemmed_tokens = TOKENIZER.analyze(text)
+            tokenized.append(list(set(stemmed_tokens + tokens)))
+            bigrams.update(phrase_bigrams(stemmed_tokens))
+
+        # float arrays for vectorized dimension scoring; missing values are NaN
+        dimensions = {}
+        for dim, col in DIMENSION_COLUMNS.items():
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+                dimensions[dim] = df[col].to_numpy(dtype=np.float64)
+            else:
+                dimensions[dim] = np.full(len(df), np.nan)
+
+        return {
+            'tokenized': tokenized,
+            'bigrams': bigrams,
+            'dimensions': dimensions,
+            'store': ProductStore.from_frame(df, self.RELEVANT_FIELDS),
+            'sources': ProductStore.from_frame(df, self.SOURCE_FIELDS),
+            'sku_aliases': sku_aliases(df),
+            'embedding_text': self._embedding_text(df),
+            **self._suggestion_parts(df),
+        }
+
+    def _suggestion_parts(self, df):
+        names = df['Name'].tolist() if 'Name' in df.columns else [''] * len(df)
+        skus = df['SKU'].tolist() if 'SKU' in df.columns else [''] * len(df)
+        popularity = next((_numeric_column(df, col) for col in POPULARITY_COLUMNS
+                           if col in df.columns), np.zeros(len(df)))
+        return {
+            'suggest_keys': [(i, key) for i, (name, sku) in enumerate(zip(names, skus))
+                             for key in suggestion_keys(name, sku)],
+            'featured': _numeric_column(df, FEATURED_COLUMN) > 0,
+            'popularity': popularity,
+        }
+
+    def _embedding_text(self, df):
+        columns = [col for col in self.EMBEDDING_COLUMNS if col in df.columns]
+        if self.embedder is None or not columns:
+            return []
+        return df[columns].astype(str).agg(' '.join, axis=1).tolist()
+
+    def _set_sku_table(self, aliases):
+        # sorted keys + rows, so the table can be snapshotted and memory-mapped
+        self.sku_keys = TermTable.from_strings(aliases)
+        self.sku_rows = np.array([aliases[key] for key in self.sku_keys],
+                                 dtype=np.int64)
+        self.sku_overrides = {}
+        self.extra_bigrams = frozenset()
+
+    @property
+    def tokenized(self):
+        """Unique tokens of every product, read back from the forward index"""
+        return [self.index.document_terms(i) for i in range(self.index.num_docs)]
+
+    @property
+    def has_updates(self):
+        return self.index.has_updates
+
+    def with_updates(self, upserts=(), deletes=()):
+        """Copy of the tool with products upserted and deleted (by SKU).
+
+        Upserts are product records keyed by CSV column name. A record whose
+        SKU already exists replaces that product, and fields it leaves out are
+        kept from the current product, so {"SKU": ..., "Regular price": ...}
+        is enough for a price change. This tool is left untouched, so
+        searches running on it are unaffected.
+        """
+        removed = {self._product_row(sku) for sku in deletes}
+        records = {}
+        for product in upserts:
+            key = normalize_sku(product.get('SKU', ''))
+            if not key:
+                raise ValueError(f"Product update without a SKU: {product}")
+            if key not in records:
+                row = self._product_row(key)
+                removed.add(row)
+                records[key] = {**self.store.row(row), **self.sources.row(row)} if row is not None else {}
+                records[key].pop('search_text', None)
+            records[key].update(product)
+        removed.discard(None)
+
+        tool = copy.copy(self)
+        if not records:
+            tool.index = self.index.with_updates(removed=removed)
+            return tool
+
+        frame = self.sources.coerce(self.store.coerce(pd.DataFrame(list(records.values())).fillna('')))
+        parts = self._index_frame(frame)
+        first_row = self.index.num_docs
+        tool.index = self.index.with_updates(parts['tokenized'], removed)
+        tool.store = self.store.with_rows(
+            parts['store'].row(i) for i in range(len(records)))
+        tool.sources = self.sources.with_rows(
+            parts['sources'].row(i) for i in range(len(records)))
+        tool.dimensions = {dim: np.concatenate([values, parts['dimensions'][dim]])
+                           for dim, values in self.dimensions.items()}
+        tool.extra_bigrams = self.extra_bigrams | parts['bigrams']
+        tool.suggestions = self.suggestions.with_documents(
+            [(first_row + i, key) for i, key in parts['suggest_keys']],
+            parts['featured'], parts['popularity'])
+        if self.dense is not None:
+            tool.dense = self.dense.with_vectors(
+                embed_documents(self.embedder, parts['embedding_text']))
+
+        # the new rows own their SKUs; other aliases only take keys nobody uses
+        real_skus = {key for sku in records for key in (sku, compact_sku(sku))}
+        tool.sku_overrides = dict(self.sku_overrides)
+        for key, row in parts['sku_aliases'].items():
+            if key in real_skus or tool._sku_lookup(key) is None:
+                tool.sku_overrides[key] = first_row + row
+        return tool
+
+    def compacted(self):
+        """Copy of the tool with applied updates folded back into packed arrays"""
+        if not self.has_updates:
+            return self
+
+        live_ids = self.index.live_doc_ids()
+        new_rows = np.full(self.index.num_docs, -1, dtype=np.int64)
+        new_rows[live_ids] = np.arange(len(live_ids))
+
+        tool = copy.copy(self)
+        tool.index = self.index.compacted()
+        tool.fuzzy_terms = TrigramIndex.build(fuzzy_vocabulary(tool.index.terms))
+        tool.store = self.store.take(live_ids)
+        tool.sources = self.sources.take(live_ids)
+        tool.dimensions = {dim: values[live_ids]
+                           for dim, values in self.dimensions.items()}
+        tool.ranges = tool._build_ranges()
+        tool.suggestions = self.suggestions.compacted(live_ids)
+        if self.dense is not None:
+            tool.dense = self.dense.take(live_ids)
+
+        aliases = {}
+        for key, row in zip(self.sku_keys, self.sku_rows.tolist()):
+            if key not in self.sku_overrides and new_rows[row] >= 0:
+                aliases[key] = int(new_rows[row])
+        for key, row in self.sku_overrides.items():
+            if new_rows[row] >= 0:
+                aliases[key] = int(new_rows[row])
+        tool._set_sku_table(aliases)
+        tool.bigrams = TermTable.from_strings(
+            set(self.bigrams) | self.extra_bigrams)
+        return tool
+
+    def save_snapshot(self, snapshot_file):
+        """Write the tokenized corpus, postings, idf, lookup tables and product columns"""
+        if self.has_updates:
+            return self.compacted().save_snapshot(snapshot_file)
+
+        arrays, metadata = self._snapshot_contents()
+        write_snapshot(snapshot_file, arrays, metadata)
+
+    def _snapshot_contents(self):
+        index_arrays, index_metadata = self.index.to_arrays()
+        store_arrays, store_layout = self.store.to_arrays()
+        source_arrays, source_layout = self.sources.to_arrays()
+
+        arrays = {f'index.{name}': array for name, array in index_arrays.items()}
+        arrays.update({f'store.{name}': array for name,
+                      array in store_arrays.items()})
+        arrays.update({f'sources.{name}': array for name, array in source_arrays.items()})
+        arrays.update({f'dim.{dim}': values for dim,
+                      values in self.dimensions.items()})
+        arrays.update({f'fuzzy.{name}': array
+                       for name, array in self.fuzzy_terms.to_arrays().items()})
+        for dim, range_index in self.ranges.items():
+            arrays.update({f'range.{dim}.{name}': array
+                           for name, array in range_index.to_arrays().items()})
+        arrays['bigrams'] = self.bigrams.keys
+        arrays['sku.keys'] = self.sku_keys.keys
+        arrays['sku.rows'] = self.sku_rows
+        arrays.update({f'suggest.{name}': array
+                       for name, array in self.suggestions.to_arrays().items()})
+        if self.dense is not None:
+            arrays.update({f'dense.{name}': array
+                           for name, array in self.dense.to_arrays().items()})
+
+        return arrays, {
+            'tokenizer_version': TOKENIZER_VERSION,
+            'built_at': time.time(),
+            'index': index_metadata,
+            'store': store_layout,
+            'sources': source_layout,
+            'embedder': embedder_name(self.embedder) if self.dense is not None else None,
+        }
+
+    @property
+    def nbytes(self):
+        """Bytes held by the index, lookup tables and product columns"""
+        tool = self.compacted()
+        arrays, _ = tool._snapshot_contents()
+        return sum(array.nbytes for array in arrays.values())
+
+    def load_snapshot(self, snapshot_file):
+        """Serve from a snapshot written by save_snapshot, memory-mapping its arrays"""
+        arrays, metadata = read_snapshot(snapshot_file)
+        if metadata.get('tokenizer_version') != TOKENIZER_VERSION:
+            raise SnapshotError(
+                f"{snapshot_file} was built with tokenizer version {metadata.get('tokenizer_version')}")
+        if self.embedder is not None and metadata.get('embedder') != embedder_name(self.embedder):
+            raise SnapshotError(
+                f"{snapshot_file} has no vectors from embedder {embedder_name(self.embedder)}")
+
+        def section(prefix):
+            return {name[len(prefix):]: array for name, array in arrays.items()
+                    if name.startswith(prefix)}
+
+        self.index = InvertedIndex.from_arrays(
+            section('index.'), metadata['index'])
+        self.fuzzy_terms = TrigramIndex.from_arrays(section('fuzzy.'))
+        self.store = ProductStore.from_arrays(
+            section('store.'), metadata['store'])
+        self.sources = ProductStore.from_arrays(
+            section('sources.'), metadata['sources'], self.index.num_docs)
+        self.dimensions = section('dim.')
+        self.ranges = {dim: RangeIndex.from_arrays(section(f'range.{dim}.'), len(values))
+                       for dim, values in self.dimensions.items()}
+        if self.embedder is not None:
+            self.dense = VectorIndex.from_arrays(section('dense.'))
+        self.bigrams = TermTable(arrays['bigrams'])
+        self.sku_keys = TermTable(arrays['sku.keys'])
+        self.sku_rows = arrays['sku.rows']
+        self.suggestions = PrefixIndex.from_arrays(section('suggest.'))
+        self.sku_overrides = {}
+        self.extra_bigrams = frozenset()
+
+    def tokenize_query(self, query):
+        """Query tokens plus, for misspelled ones, the closest vocabulary terms"""
+        query_tokens = custom_tokenizer(query)
+        expanded = list(query_tokens)
+        for token in query_tokens:
+            max_distance = fuzzy_max_distance(token)
+            if max_distance and not self._has_term(token):
+                expanded.extend(term for term in self.fuzzy_terms.nearest(token, max_distance)
+                                if term not in expanded)
+        return expanded
 
-        for col in ["Weight (lbs)", "Length (in)", "Width (in)"]:
-            if col in self.df.columns:
-                self.df[col] = pd.to_numeric(self.df[col], errors='coerce')
+    def _has_term(self, term):
+        return term in self.index
 
     def get_matched_terms(self, query):
         """get important terms from the query that are in our vocabulary"""
-        query_tokens = custom_tokenizer(query)
+        query_tokens = self.tokenize_query(query)
 
-        all_terms = set()
-        for doc_tokens in self.tokenized:
-            all_terms.update(doc_tokens)
-
-        matched_terms = [term for term in query_tokens if term in all_terms]
+        matched_terms = [
+            term for term in query_tokens if term in self.index]
 
         # adjacent terms check
-        for i in range(len(query_tokens) - 1):
-            bigram = f"{query_tokens[i]} {query_tokens[i+1]}"
-            if any(bigram in ' '.join(doc) for doc in self.tokenized):
+        _, stemmed_tokens = TOKENIZER.analyze(query)
+        for bigram in phrase_bigrams(stemmed_tokens):
+            if bigram in self.bigrams or bigram in self.extra_bigrams:
                 matched_terms.append(bigram)
 
         return matched_terms
 
-    def calculate_dimensional_score(self, row, weight=None, height=None, width=None, length=None):
-        """Calculate proximity score for dimensional attributes"""
-        total_score = 0
-        dimensions_requested = 0
-        dimensions_found = 0
-        dimension_scores = {}
-
-        if weight is not None:
-            dimensions_requested += 1
-        if length is not None:
-            dimensions_requested += 1
-        if width is not None:
-            dimensions_requested += 1
-        if height is not None:
-            dimensions_requested += 1
-
-        if dimensions_requested == 0:
-            return 0
-
-        def proximity_score(target, actual, dimension_type='weight'):
-            # make sure we have numeric values
-            if pd.isna(actual) or actual == '' or actual == 0:
-                return None
-            try:
-                actual = float(actual)
-                target = float(target)
-                diff = abs(target - actual)
+    def calculate_dimensional_scores(self, weight=None, height=None, width=None, length=None):
+        """Calculate proximity scores for dimensional attributes of every product at once"""
+        targets = {'weight': weight, 'length': length,
+                   'width': width, 'height': height}
+        return self._dimension_scores(targets)
+
+    def _dimension_scores(self, targets, doc_ids=None):
+        """Proximity scores of the given products (all of them for None) for the dimension targets"""
+        targets = {dim: float(val)
+                   for dim, val in targets.items() if val is not None}
+
+        # a slice reads the columns in place, without gathering every row
+        rows = slice(None) if doc_ids is None else doc_ids
+        size = self.index.num_docs if doc_ids is None else len(doc_ids)
+        total_score = np.zeros(size)
+        if not targets:
+            return total_score
+
+        dimensions_found = np.zeros(size)
+        deleted = self.index.deleted[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for dim, target in targets.items():
+                actual = self.dimensions[dim][rows]
+                # products without a usable value don't count for this dimension
+                valid = ~np.isnan(actual) & (actual != 0) & ~deleted
 
                 # We score only up to the defined maximum percentage difference
-                max_percent_diff = MAX_PERCENT_DIFFERENCE
-                percent_diff = diff / max(target, actual)
-                score = max(0, 1 - (percent_diff / max_percent_diff))
-                return score
-
-            except (ValueError, TypeError) as e:
-                print(
-                    f"Error in proximity_score: {e}, target={target}, actual={actual}")
+                percent_diff = np.abs(target - actual) / \
+                    np.maximum(target, actual)
+                score = np.maximum(
+                    0, 1 - (percent_diff / MAX_PERCENT_DIFFERENCE))
+
+                total_score += np.where(valid, score, 0)
+                dimensions_found += valid
+
+        return total_score * (dimensions_found / len(targets)**2)
+
+    def _docs_in_range(self, dim, low=None, high=None, inclusive=True):
+        """Ids of products whose dim value is within [low, high], unsorted and
+        including removed products"""
+        range_index = self.ranges[dim]
+        doc_ids = range_index.between(low, high, inclusive)
+        # products added by updates since the range index was built
+        added = np.arange(range_index.size, self.index.num_docs)
+        if len(added):
+            values = self.dimensions[dim][added]
+            in_range = ~np.isnan(values) & (values != 0)
+            with np.errstate(invalid='ignore'):
+                if low is not None:
+                    in_range &= values >= low if inclusive else values > low
+                if high is not None:
+                    in_range &= values <= high if inclusive else values < high
+            doc_ids = np.concatenate([doc_ids, added[in_range]])
+        return doc_ids
+
+    def _live_union(self, id_arrays):
+        """Sorted ids of the live products in any of the arrays"""
+        num_docs = self.index.num_docs
+        if sum(len(doc_ids) for doc_ids in id_arrays) * 8 > num_docs:
+            # a mask over the catalog is cheaper than sorting large windows
+            mask = np.zeros(num_docs, dtype=bool)
+            for doc_ids in id_arrays:
+                mask[doc_ids] = True
+            doc_ids = np.flatnonzero(mask)
+        else:
+            doc_ids = np.unique(np.concatenate(id_arrays))
+        return doc_ids[~self.index.deleted[doc_ids]]
+
+    def _dimension_candidates(self, targets):
+        """Ids of every product that can score above zero for the targets,
+        or None when scoring every product is cheaper or required.
+
+        A product scores for a dimension only within MAX_PERCENT_DIFFERENCE
+        of the target, i.e. strictly between target / 2 and target * 2; the
+        window is probed inclusively so rounding can't drop a product.
+        """
+        targets = {dim: float(val) for dim, val in targets.items() if val is not None}
+        if not targets or MAX_PERCENT_DIFFERENCE >= 1:
+            return None
+        if not all(np.isfinite(target) and target > 0 for target in targets.values()):
+            return None
+        windows = [self._docs_in_range(dim, target * (1 - MAX_PERCENT_DIFFERENCE),
+                                       target / (1 - MAX_PERCENT_DIFFERENCE))
+                   for dim, target in targets.items()]
+        # wide windows are cheaper to score over the whole catalog
+        if sum(len(window) for window in windows) * 2 > self.index.num_docs:
+            return None
+        return self._live_union(windows)
+
+    def _range_filter(self, ranges):
+        """Sorted ids of the products within every explicit (low, high) range"""
+        allowed = None
+        for dim, (low, high) in ranges.items():
+            doc_ids = self._live_union([self._docs_in_range(dim, low, high)])
+            allowed = doc_ids if allowed is None else np.intersect1d(
+                allowed, doc_ids, assume_unique=True)
+        return allowed
+
+    def find_sku_row(self, sku):
+        """Row position of the product with this SKU (or alias), or None"""
+        for key in (normalize_sku(sku), compact_sku(sku)):
+            row = self._sku_lookup(key)
+            if row is not None:
+                return row
+        return None
+
+    def _sku_product(self, sku):
+        """Fields of the product with this SKU (or alias), or None"""
+        i = self.find_sku_row(sku)
+        return self.store.row(i) if i is not None else None
+
+    def _sku_lookup(self, key):
+        if key in self.sku_overrides:
+            row = self.sku_overrides[key]
+        else:
+            pos = self.sku_keys.index(key)
+            if pos < 0:
                 return None
+            row = int(self.sku_rows[pos])
+        # removed products keep their keys until the next compaction
+        if self.index.num_deleted and self.index.deleted[row]:
+            return None
+        return row
+
+    def _product_row(self, sku):
+        """Row of the live product whose own SKU (not an alias) is sku"""
+        row = self._sku_lookup(normalize_sku(sku))
+        if row is not None and normalize_sku(self.store.row(row).get('SKU', '')) == normalize_sku(sku):
+            return row
+        return None
+
+    def suggest_ids(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        """Ids of the products whose name (from any word) or SKU starts with prefix, most popular first"""
+        prefix = normalize_prefix(prefix)
+        if not prefix or limit <= 0:
+            return np.zeros(0, dtype=np.int64)
+        # "23-00" also completes SKU 230025
+        prefixes = tuple(dict.fromkeys(p for p in (prefix, compact_sku(prefix)) if p))
+        doc_ids = np.concatenate([self.suggestions.matches(p) for p in prefixes])
+        doc_ids = doc_ids[~self.index.deleted[doc_ids]]
+        if max(len(p.encode('utf-8')) for p in prefixes) > self.suggestions.width:
+            # stored keys are cut short, so check the whole prefix
+            doc_ids = np.unique(doc_ids)
+            doc_ids = np.array([i for i, product in zip(doc_ids.tolist(), self.store.rows(doc_ids))
+                                if any(key.startswith(prefixes) for key in suggestion_keys(
+                                    product.get('Name', ''), product.get('SKU', '')))],
+                               dtype=np.int64)
+        return self.suggestions.rank(doc_ids, limit)
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        """Autocomplete suggestions (name and SKU) for a search box prefix"""
+        return [{'name': product.get('Name', ''), 'sku': product.get('SKU', '')}
+                for product in self.store.rows(self.suggest_ids(prefix, limit))]
+
+    def search(self, query, weight=None, height=None, width=None, length=None, sku=None,
+               max_results=DEFAULT_MAX_RESULTS, ranges=None):
+        """Search products using BM25 ranking and dimensional parameters.
+
+        ranges maps a dimension to a (low, high) pair ("between 500 and 700
+        lbs"); only products within every range are returned. A closed range
+        without a target for the same dimension ranks by closeness to its
+        middle.
+        """
+        query_tokens = self.tokenize_query(query)
+        ranges = normalize_ranges(ranges)
+        weight, height, width, length = range_targets(ranges, weight, height, width, length)
 
-        if weight is not None:
-            i = list(self.df.columns).index("Weight (lbs)")
-            actual_weight = row[i + 1]
-            weight_score = proximity_score(weight, actual_weight, 'weight')
-            if weight_score is not None:
-                dimension_scores['weight'] = weight_score
-                total_score += weight_score
-                dimensions_found += 1
-
-        if length is not None:
-            i = list(self.df.columns).index("Length (in)")
-            actual_length = row[i + 1]
-            length_score = proximity_score(length, actual_length, 'length')
-            if length_score is not None:
-                dimension_scores['length'] = length_score
-                total_score += length_score
-                dimensions_found += 1
-
-        if width is not None:
-            i = list(self.df.columns).index("Width (in)")
-            actual_width = row[i + 1]
-            width_score = proximity_score(width, actual_width, 'width')
-            if width_score is not None:
-                dimension_scores['width'] = width_score
-                total_score += width_score
-                dimensions_found += 1
-
-        if height is not None:
-            i = list(self.df.columns).index("Height (in)")
-            actual_height = row[i + 1]
-            height_score = proximity_score(height, actual_height, 'height')
-            if height_score is not None:
-                dimension_scores['height'] = height_score
-                total_score += height_score
-                dimensions_found += 1
-
-        if dimensions_found == 0:
-            return 0
-
-        return total_score * (dimensions_found / dimensions_requested**2)
-
-    def search(self, query, weight=None, height=None, width=None, length=None, sku=None, max_results=DEFAULT_MAX_RESULTS):
-        """Search products using BM25 ranking and dimensional parameters"""
-        query_tokens = custom_tokenizer(query)
-        text_scores = self.bm25.get_scores(query_tokens)
-
-        dim_scores = np.zeros(len(self.df))
         has_dim_params = any(param is not None for param in [
                              weight, width, length, height, sku])
 
@@ -202,112 +763,191 @@ class ProductSearchTool:
             print(
                 f"Calculating dimensional scores with weight={weight}, width={width}, length={length}, height={height}")
 
-            # Calculate dimensional scores
-            for i, row in enumerate(self.df.itertuples()):
-
-                # if SKU matches then we just give it the maximum score for both categories combined
-                if sku is not None:
-                    if str(getattr(row, 'SKU', '')).lower() == str(sku).lower():
-                        product_dict = self.df.iloc[i].to_dict()
-                        product_dict.update({
-                            'score': float(SKU_MATCH_SCORE),
-                            'text_score': float(SKU_MATCH_SCORE),
-                            'dim_score': float(SKU_MATCH_SCORE),
-                            'matched_terms': custom_tokenizer(query)
-                        })
-
-                        filtered_product = self.filter_product_fields(
-                            product_dict, weight, height, width, length)
-
-                        return [{
-                            'product': filtered_product,
-                            'score': SKU_MATCH_SCORE,
-                            'text_score': SKU_MATCH_SCORE,
-                            'dim_score': SKU_MATCH_SCORE,
-                        }]
-
-                dim_score = self.calculate_dimensional_score(
-                    row, weight=weight, height=height, width=width, length=length)
-                dim_scores[i] += dim_score * DIMENSION_SCORE_MULTIPLIER
-
-        # Combine scores
-        if has_dim_params:
-            combined_scores = text_scores + dim_scores
-
-            # penalty
-            max_dim_score = np.max(dim_scores) if np.max(dim_scores) > 0 else 1
-            dim_score_threshold = max_dim_score * DIMENSION_SCORE_THRESHOLD_FACTOR
-            for i, dim_score in enumerate(dim_scores):
-                if dim_score < dim_score_threshold:
-                    combined_scores[i] *= LOW_DIMENSION_SCORE_PENALTY
-        else:
-            combined_scores = text_scores
+            # if SKU matches then we just give it the maximum score for both categories combined
+            if sku is not None:
+                product_dict = self._sku_product(sku)
+                if product_dict is not None:
+                    return [self._sku_result(product_dict, query, weight, height, width, length)]
+
+        targets = {'weight': weight, 'width': width,
+                   'length': length, 'height': height}
+        doc_ids, combined_scores, text_scores, dim_scores = self.score_products(
+            query_tokens, targets, has_dim_params, ranges=ranges,
+            query_vector=self.embed_query(query))
+        return self._rank_results(query_tokens, doc_ids, combined_scores, text_scores,
+                                  max_results, dim_scores, targets)
+
+    def _sku_result(self, product_dict, query, weight=None, height=None, width=None, length=None):
+        product_dict.update({
+            'score': float(SKU_MATCH_SCORE),
+            'text_score': float(SKU_MATCH_SCORE),
+            'dim_score': float(SKU_MATCH_SCORE),
+            'matched_terms': custom_tokenizer(query)
+        })
 
-        ranked_indices = np.argsort(combined_scores)[::-1][:max_results]
+        filtered_product = self.filter_product_fields(
+            product_dict, weight, height, width, length)
+
+        return {
+            'product': filtered_product,
+            'score': SKU_MATCH_SCORE,
+            'text_score': SKU_MATCH_SCORE,
+            'dim_score': SKU_MATCH_SCORE,
+        }
+
+    def max_dim_score(self, targets):
+        """Best dimension score of any product, which sets the low score penalty threshold"""
+        dim_scores = self._dimension_scores(targets, self._dimension_candidates(targets))
+        dim_scores *= DIMENSION_SCORE_MULTIPLIER
+        return float(np.max(dim_scores)) if len(dim_scores) else 0.0
+
+    def embed_query(self, query):
+        """Unit-length query vector for hybrid search, or None when it is off"""
+        if self.dense is None or not query.strip():
+            return None
+        return embed_query(self.embedder, query)
+
+    def dense_scores(self, doc_ids, text_scores, query_vector):
+        """Text matches fused with the documents closest to the query vector.
+
+        Every document that matched lexically or is among the
+        DENSE_CANDIDATES nearest neighbours scores its BM25 score plus
+        DENSE_SCORE_MULTIPLIER times its (positive) cosine similarity.
+        """
+        neighbours, _ = self.dense.search(query_vector, DENSE_CANDIDATES)
+        scored_ids = np.union1d(doc_ids, neighbours)
+        scores = np.zeros(len(scored_ids))
+        scores[np.searchsorted(scored_ids, doc_ids)] = text_scores
+        similarity = self.dense.similarity(query_vector, scored_ids)
+        scores += DENSE_SCORE_MULTIPLIER * np.maximum(similarity, 0)
+
+        keep = np.flatnonzero((scores > 0) & ~self.index.deleted[scored_ids])
+        return scored_ids[keep], scores[keep]
+
+    def score_products(self, query_tokens, targets, has_dim_params, max_dim_score=None,
+                       ranges=None, query_vector=None):
+        """Scores of every product the query can return.
+
+        Returns (doc_ids, combined_scores, text_scores, dim_scores), all
+        aligned with doc_ids; dim_scores is None without dimension
+        parameters. Only products the text matches or within reach of a
+        dimension target are scored. max_dim_score overrides the best
+        dimension score the penalty is relative to, for shards of a larger
+        catalog. ranges ({dim: (low, high)}) drops products outside them.
+        With a query_vector the text scores include semantic similarity.
+        """
+        doc_ids, text_scores = self.index.score(query_tokens)
+        if query_vector is not None:
+            doc_ids, text_scores = self.dense_scores(doc_ids, text_scores, query_vector)
+        allowed = self._range_filter(ranges) if ranges else None
+        if not has_dim_params:
+            if allowed is not None:
+                keep = np.isin(doc_ids, allowed, assume_unique=True)
+                doc_ids, text_scores = doc_ids[keep], text_scores[keep]
+            return doc_ids, text_scores, text_scores, None
+
+        candidates = self._dimension_candidates(targets)
+        if candidates is None:
+            scored_ids = np.arange(self.index.num_docs)
+            dim_scores = self._dimension_scores(targets)
+        else:
+            scored_ids = np.union1d(doc_ids, candidates)
+            dim_scores = self._dimension_scores(targets, scored_ids)
+        dim_scores *= DIMENSION_SCORE_MULTIPLIER
+
+        combined_scores = np.zeros(len(scored_ids))
+        combined_scores[np.searchsorted(scored_ids, doc_ids)] = text_scores
+        text_scores = combined_scores.copy()
+        combined_scores += dim_scores
+
+        # penalty; products that were not scored have a dimension score of 0
+        if max_dim_score is None:
+            max_dim_score = np.max(dim_scores) if len(dim_scores) else 0
+        max_dim_score = max_dim_score if max_dim_score > 0 else 1
+        dim_score_threshold = max_dim_score * DIMENSION_SCORE_THRESHOLD_FACTOR
+        combined_scores[dim_scores <
+                        dim_score_threshold] *= LOW_DIMENSION_SCORE_PENALTY
+
+        # only documents with a text or dimension match can be returned
+        keep = combined_scores != 0
+        if allowed is not None:
+            keep &= np.isin(scored_ids, allowed, assume_unique=True)
+        keep = np.flatnonzero(keep)
+        return scored_ids[keep], combined_scores[keep], text_scores[keep], dim_scores[keep]
+
+    def search_many(self, queries, max_results=DEFAULT_MAX_RESULTS):
+        """search() for a list of queries, returning one result list per query.
+
+        Queries are strings or dicts of search() keyword arguments. Plain text
+        queries are scored together in one pass over the index; queries with
+        dimensions or a SKU go through search().
+        """
+        queries = [{'query': query} if isinstance(query, str) else query
+                   for query in queries]
+        results = [None] * len(queries)
+
+        text_queries = [i for i, query in enumerate(queries)
+                        if set(query) <= {'query', 'max_results'}]
+        query_tokens = [self.tokenize_query(queries[i]['query']) for i in text_queries]
+        scored = self.index.score_many(query_tokens)
+        for i, tokens, (doc_ids, scores) in zip(text_queries, query_tokens, scored):
+            query_vector = self.embed_query(queries[i]['query'])
+            if query_vector is not None:
+                doc_ids, scores = self.dense_scores(doc_ids, scores, query_vector)
+            results[i] = self._rank_results(
+                tokens, doc_ids, scores, scores, queries[i].get('max_results', max_results))
+
+        for i, query in enumerate(queries):
+            if results[i] is None:
+                results[i] = self.search(**{'max_results': max_results, **query})
+        return results
 
+    def _rank_results(self, query_tokens, doc_ids, combined_scores, text_scores, max_results,
+                      dim_scores=None, targets=None):
+        """Top results for the scored documents, cut off at the largest score drop"""
+        # the posting lists only hold matching documents, so ranking and the
+        # largest_drop cutoff only look at those; the rest all score 0
+        ranked = top_k(doc_ids, combined_scores, max_results)
+        largest_drop = largest_score_drop(combined_scores, len(self.index))
+        ranked = ranked[:drop_cutoff(combined_scores[ranked], largest_drop)]
+        return self.build_results(query_tokens, doc_ids[ranked], combined_scores[ranked],
+                                  text_scores[ranked],
+                                  None if dim_scores is None else dim_scores[ranked], targets)
+
+    def build_results(self, query_tokens, doc_ids, combined_scores, text_scores,
+                      dim_scores=None, targets=None):
+        """Result dicts for ranked documents and their scores (dim_scores aligned with doc_ids)"""
         results = []
-        sorted_scores = sorted(combined_scores, reverse=True)
-        score_diffs = [sorted_scores[i] - sorted_scores[i + 1]
-                       for i in range(len(sorted_scores) - 1)]
-        largest_drop = max(score_diffs) if score_diffs else 0
-        prev_score = None
-
-        for i in ranked_indices:
-            if combined_scores[i] > 0:
-                # get rid of extra results
-                if prev_score and (prev_score - combined_scores[i]) == largest_drop:
-                    break
-
-                result = {
-                    'product': self.df.iloc[i],
-                    'score': float(combined_scores[i]),
-                    'text_score': float(text_scores[i]),
-                }
-                prev_score = combined_scores[i]
-
-                if has_dim_params:
-                    result['dim_score'] = float(dim_scores[i])
-
-                    if weight is not None:
-                        product_weight = self.df.iloc[i]['Weight (lbs)']
-                        if not pd.isna(product_weight):
-                            result['weight_diff'] = abs(
-                                weight - product_weight)
-                        else:
-                            result['weight_diff'] = 'N/A'
-
-                    if width is not None:
-                        product_width = self.df.iloc[i]['Width (in)']
-                        if not pd.isna(product_width):
-                            result['width_diff'] = abs(width - product_width)
-                        else:
-                            result['width_diff'] = 'N/A'
-
-                    if length is not None:
-                        product_length = self.df.iloc[i]['Length (in)']
-                        if not pd.isna(product_length):
-                            result['length_diff'] = abs(
-                                length - product_length)
-                        else:
-                            result['length_diff'] = 'N/A'
-
-                    if height is not None:
-                        product_height = self.df.iloc[i]['Height (in)']
-                        if not pd.isna(product_height):
-                            result['height_diff'] = abs(
-                                height - product_height)
+        # products are read column by column for all results at once
+        products = self.store.rows(doc_ids)
+        for n, (i, product, score, text_score) in enumerate(zip(
+                doc_ids.tolist(), products, combined_scores.tolist(), text_scores.tolist())):
+            result = {
+                'product': product,
+                'score': score,
+                'text_score': text_score,
+            }
+
+            if dim_scores is not None:
+                result['dim_score'] = float(dim_scores[n])
+
+                for dim, val in targets.items():
+                    if val is not None:
+                        product_val = self.dimensions[dim][i]
+                        if not np.isnan(product_val):
+                            result[f'{dim}_diff'] = abs(val - product_val)
                         else:
-                            result['height_diff'] = 'N/A'
+                            result[f'{dim}_diff'] = 'N/A'
 
-                result['matched_terms'] = query_tokens
-                results.append(result)
+            result['matched_terms'] = query_tokens
+            results.append(result)
 
         return results
 
     def filter_product_fields(self, product_dict, weight=None, height=None, width=None, length=None):
         """Filter product dictionary to only include the relevant fields"""
         filtered_dict = {k: v for k, v in product_dict.items()
-                         if k in self.RELEVANT_FIELDS}
+                         if k in self.RELEVANT_FIELD_SET}
 
         for score_field in ['score', 'text_score', 'dim_score', 'matched_terms']:
             if score_field in product_dict:
@@ -329,14 +969,15 @@ class ProductSearchTool:
 
         return filtered_dict
 
-    def get_response(self, query, weight=None, height=None, width=None, length=None, sku=None):
+    def get_response(self, query, weight=None, height=None, width=None, length=None, sku=None,
+                     ranges=None):
         """Get complete product data for the query and dimensional parameters"""
+        ranges = normalize_ranges(ranges)
+        weight, height, width, length = range_targets(ranges, weight, height, width, length)
         if sku is not None:
             # Find exact SKU match first
-            sku_match = self.df[self.df['SKU'].astype(
-                str).str.lower() == str(sku).lower()]
-            if not sku_match.empty:
-                product_dict = sku_match.iloc[0].to_dict()
+            product_dict = self._sku_product(sku)
+            if product_dict is not None:
                 product_dict.update({
                     'score': float(SKU_MATCH_SCORE),
                     'text_score': float(SKU_MATCH_SCORE),
@@ -352,14 +993,14 @@ class ProductSearchTool:
                     "products": [filtered_product]
                 }
 
-        search_results = self.search(query, weight, height, width, length, sku)
+        search_results = self.search(query, weight, height, width, length, sku, ranges=ranges)
 
         if not search_results:
-            return str({"status": "No products found", "products": []})
+            return {"status": "No products found", "products": []}
 
         products = []
         for result in search_results:
-            product_dict = result['product'].to_dict()
+            product_dict = dict(result['product'])
             product_dict.update({
                 'score': float(result['score']),
                 'text_score': float(result['text_score']),
@@ -371,10 +1012,10 @@ class ProductSearchTool:
                 product_dict, weight, height, width, length)
             products.append(filtered_product)
 
-        return str({
+        return {
             "status": f"{len(products)} products found",
             "products": products
-        })
+        }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+
+# text fields with at most this share of distinct values are stored as codes
+CATEGORICAL_MAX_RATIO = 0.5
+
+
+class StringColumn:
+    """Strings stored as one utf-8 buffer plus an offsets array.
+
+    Values are only decoded when a row is read, so a column memory-mapped from
+    a snapshot costs nothing until results are returned.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = [('' if pd.isna(value) else str(value)).encode('utf-8')
+                   for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(offsets, data)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def take(self, rows):
+        """Values of several rows as a list of str"""
+        rows = np.asarray(rows, dtype=np.int64)
+        data = memoryview(self.data)
+        return [str(data[start:end], 'utf-8') for start, end
+                in zip(self.offsets[rows].tolist(), self.offsets[rows + 1].tolist())]
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.data.nbytes
+
+
+class CategoricalColumn:
+    """Low-cardinality strings interned once, with a small integer code per row"""
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+        self._values = None
+
+    @classmethod
+    def from_values(cls, values):
+        categories, codes = np.unique(
+            ['' if pd.isna(value) else str(value) for value in values], return_inverse=True)
+        return cls(codes.astype(np.min_scalar_type(max(len(categories) - 1, 0))),
+                   StringColumn.from_values(categories))
+
+    @property
+    def values(self):
+        # the few distinct strings are decoded once, on first use
+        if self._values is None:
+            self._values = self.categories.take(np.arange(len(self.categories)))
+        return self._values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def take(self, rows):
+        values = self.values
+        return [values[code] for code in self.codes[rows].tolist()]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.categories.nbytes
+
+
+def _compact_numbers(values):
+    """Integer columns in the smallest integer type that holds them; floats as they are"""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu' and len(values):
+        dtype = np.promote_types(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+        return values.astype(dtype)
+    return values
+
+
+def _text_column(values):
+    values = list(values)
+    if len(set(map(str, values))) <= CATEGORICAL_MAX_RATIO * len(values):
+        return CategoricalColumn.from_values(values)
+    return StringColumn.from_values(values)
+
+
+class ProductStore:
+    """Product fields served in search results, held column by column.
+
+    Only the fields that are served are kept. Numeric columns are typed
+    arrays (integers in the smallest type that fits), repetitive text such as
+    categories is interned in a CategoricalColumn, and other text is a
+    StringColumn. Products added after the columns were built are kept as plain dicts in
+    extra_rows until take() packs everything into columns again.
+    """
+
+    def __init__(self, columns, extra_rows=(), base_len=None):
+        self.columns = columns
+        self.extra_rows = list(extra_rows)
+        # a store can hold none of a catalog's fields and still have its rows
+        if base_len is None:
+            base_len = next((len(column) for column in columns.values()), 0)
+        self.base_len = base_len
+
+    @classmethod
+    def from_frame(cls, df, fields):
+        columns = {}
+        for field in fields:
+            if field not in df.columns:
+                continue
+            if pd.api.types.is_numeric_dtype(df[field]):
+                columns[field] = _compact_numbers(df[field].to_numpy())
+            else:
+                columns[field] = _text_column(df[field])
+        return cls(columns, base_len=len(df))
+
+    def __len__(self):
+        return self.base_len + len(self.extra_rows)
+
+    def row(self, i):
+        """Fields of one product as plain Python values"""
+        if i >= self.base_len:
+            return dict(self.extra_rows[i - self.base_len])
+        product = {}
+        for field, column in self.columns.items():
+            value = column[i]
+            product[field] = value.item() if isinstance(value, np.generic) else value
+        return product
+
+    def rows(self, rows):
+        """row() for a list of row numbers, reading each column once"""
+        rows = [int(i) for i in rows]
+        base_len = self.base_len
+        base_rows = [i for i in rows if i < base_len]
+        values = {}
+        for field, column in self.columns.items():
+            if isinstance(column, np.ndarray):
+                values[field] = column[base_rows].tolist()
+            else:
+                values[field] = column.take(base_rows)
+
+        products, base = [], iter(range(len(base_rows)))
+        for i in rows:
+            if i < base_len:
+                j = next(base)
+                products.append({field: column_values[j]
+                                 for field, column_values in values.items()})
+            else:
+                products.append(dict(self.extra_rows[i - base_len]))
+        return products
+
+    def with_rows(self, rows):
+        """New store with rows appended; the columns are shared, not copied"""
+        return ProductStore(self.columns, self.extra_rows + list(rows), self.base_len)
+
+    def coerce(self, frame):
+        """Cast frame columns to the kinds of the matching columns of this store"""
+        for field, column in self.columns.items():
+            if field not in frame.columns:
+                continue
+            if isinstance(column, np.ndarray):
+                frame[field] = pd.to_numeric(frame[field], errors='coerce')
+            else:
+                frame[field] = frame[field].astype(str)
+        return frame
+
+    def take(self, rows):
+        """New columnar store holding only the given rows, in that order"""
+        frame = pd.DataFrame([self.row(i) for i in rows])
+        fields = list(self.columns) or list(frame.columns)
+        return ProductStore.from_frame(frame, fields)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the columns (appended rows not included)"""
+        return sum(column.nbytes for column in self.columns.values())
+
+    def to_arrays(self):
+        """Flat array mapping (and column layout) for snapshots"""
+        if self.extra_rows:
+            raise ValueError("take() the appended rows into columns before serializing")
+        arrays, layout = {}, {}
+        for i, (field, column) in enumerate(self.columns.items()):
+            if isinstance(column, CategoricalColumn):
+                arrays[f'{i}.codes'] = column.codes
+                arrays[f'{i}.offsets'] = column.categories.offsets
+                arrays[f'{i}.data'] = column.categories.data
+                layout[field] = [i, 'cat']
+            elif isinstance(column, StringColumn):
+                arrays[f'{i}.offsets'] = column.offsets
+                arrays[f'{i}.data'] = column.data
+                layout[field] = [i, 'str']
+            else:
+                arrays[f'{i}.values'] = column
+                layout[field] = [i, 'num']
+        return arrays, layout
+
+    @classmethod
+    def from_arrays(cls, arrays, layout, base_len=None):
+        columns = {}
+        for field, (i, kind) in layout.items():
+            if kind == 'cat':
+                columns[field] = CategoricalColumn(arrays[f'{i}.codes'], StringColumn(
+                    arrays[f'{i}.offsets'], arrays[f'{i}.data']))
+            elif kind == 'str':
+                columns[field] = StringColumn(
+                    arrays[f'{i}.offsets'], arrays[f'{i}.data'])
+            else:
+                columns[field] = arrays[f'{i}.values']
+        return cls(columns, base_len=base_len)
@@ -1,19 +1,26 @@
 from typing import Annotated, Optional
-import aiohttp
 from langgraph.prebuilt import create_react_agent
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import AIMessage
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langgraph.checkpoint.postgres import PostgresSaver
-from psycopg_pool import ConnectionPool
+from postgres_checkpointer import PooledAsyncPostgresSaver
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 from langchain.tools.base import StructuredTool
-from product_search_tool import ProductSearchTool
+from catalog_manager import CatalogManager
+from session_registry import SessionRegistry
+from checkpoint_retention import CheckpointRetention
+from chat_history import ChatState, ConversationWindow
+from dense_search import HashingEmbedder
 import inspect
+import functools
 from langchain_core.tools import tool 
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
 from cart_tools import CartTools
 from order_tools import OrderTools
+from tool_payloads import render_for_llm, fit_token_budget
 import asyncio
+import contextvars
 import os
-import aiohttp
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from contextvars import ContextVar
 
@@ -22,47 +29,163 @@ load_dotenv()
 PROXY_URL = os.getenv("PROXY_URL", "http://0.0.0.0:4000")
 POSTGRES_CONNINFO = os.getenv("SUPABASE_POSTGRES_URL")
 API_BASE_URL = "http://localhost:8000"
-
-# context var for auth token
+PRODUCT_INDEX_SNAPSHOT = os.getenv("PRODUCT_INDEX_SNAPSHOT")
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "300"))
+PRODUCT_SEARCH_SHARDS = int(os.getenv("PRODUCT_SEARCH_SHARDS", "1"))
+# most tokens one product lookup may add to the model's context
+PRODUCT_TOOL_TOKEN_BUDGET = int(os.getenv("PRODUCT_TOOL_TOKEN_BUDGET", "2000"))
+CHAT_MODEL = "gpt-4o-mini"
+# run chat turns with the async checkpointer and agent.astream; "false" for the synchronous pipeline
+CHAT_ASYNC = os.getenv("CHAT_ASYNC", "true").lower() not in ("0", "false", "no")
+# Postgres connections for checkpoints; async turns only hold one while reading or writing
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "4"))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "20"))
+# seconds a turn waits for a free connection before failing
+POSTGRES_POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", "30"))
+# live chat sessions kept, and seconds of inactivity after which one is dropped
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "10000"))
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "3600"))
+# turns the model sees verbatim (0 sends the whole history); older ones are summarized, a batch at a time
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "6"))
+CHAT_SUMMARY_BATCH_TURNS = int(os.getenv("CHAT_SUMMARY_BATCH_TURNS", "4"))
+# checkpoints kept per conversation (0 keeps them all), and seconds after which an idle one is deleted
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", "20"))
+CHECKPOINT_THREAD_TTL = float(os.getenv("CHECKPOINT_THREAD_TTL", str(30 * 86400)))
+# seconds between retention passes, and conversations pruned per batch
+CHECKPOINT_RETENTION_INTERVAL = float(os.getenv("CHECKPOINT_RETENTION_INTERVAL", "600"))
+CHECKPOINT_RETENTION_BATCH = int(os.getenv("CHECKPOINT_RETENTION_BATCH", "200"))
+# threads scoring product searches, so CPU-bound search never runs on the event loop
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# synchronous chat turns run at once; each holds a thread while the checkpointer is used
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "32"))
+# "hashing" for the offline embedder, or an embeddings model served by the proxy
+PRODUCT_EMBEDDER = os.getenv("PRODUCT_EMBEDDER")
+
+def make_embedder(name):
+    """Embedder for hybrid product search, or None to search lexically only"""
+    if not name:
+        return None
+    if name == "hashing":
+        return HashingEmbedder()
+    return OpenAIEmbeddings(model=name, base_url=PROXY_URL, check_embedding_ctx_length=False)
+
+AUTHENTICATED_PROMPT = (
+    "You are an e-commerce chatbot. Help users search products, manage their cart, and view or update orders. "
+    "Embed URLs when available. Do not answer unrelated questions. "
+    "Do NOT ask for the user's auth token, because all requests already have it included."
+)
+GUEST_PROMPT = "You are an e-commerce chatbot. You can only help with product search for guest users. Politely explain that login is required for cart and order actions. Do not answer unrelated questions."
+
+# auth token of the chat turn being run; the cart and order tools read it
 auth_token_var = ContextVar("auth_token", default=None)
 
+
+class StreamingUnavailable(RuntimeError):
+    """Chat turns can't be streamed with the synchronous pipeline"""
+
+
 class ChatService:
     def __init__(self):
         """Initialize the chat service with necessary configurations."""
         if not POSTGRES_CONNINFO:
             raise ValueError("need to set SUPABASE_POSTGRES_URL in .env file")
 
-        print(f"Connecting to pooler")
-
-        try:
-            self.postgres_pool = ConnectionPool(
-                conninfo=POSTGRES_CONNINFO,
-                max_size=20,
-                kwargs={"autocommit": True, "prepare_threshold": None},
-            )
-
-            with self.postgres_pool.connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT 1")
-                    print("Connection to database succesful")
-        except Exception as e:
-            print(f"Error connecting to pooler: {e}")
-            raise
+        self.async_mode = CHAT_ASYNC
+        pool_options = dict(
+            conninfo=POSTGRES_CONNINFO,
+            min_size=POSTGRES_POOL_MIN_SIZE,
+            max_size=POSTGRES_POOL_MAX_SIZE,
+            timeout=POSTGRES_POOL_TIMEOUT,
+            kwargs={"autocommit": True, "prepare_threshold": None},
+        )
+        if self.async_mode:
+            # opened by start(), on the event loop that serves the chats
+            self.postgres_pool = AsyncConnectionPool(open=False, **pool_options)
+        else:
+            print(f"Connecting to pooler")
+
+            try:
+                self.postgres_pool = ConnectionPool(**pool_options)
+
+                with self.postgres_pool.connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                        print("Connection to database succesful")
+            except Exception as e:
+                print(f"Error connecting to pooler: {e}")
+                raise
 
         self.llm = ChatOpenAI(
-            model_name="gpt-4o-mini",
+            model_name=CHAT_MODEL,
         )
-
-        self.product_search = ProductSearchTool()
-        self.memory_savers = {}
+        self.history_window = ConversationWindow(
+            self.llm, turns=CHAT_HISTORY_TURNS, batch_turns=CHAT_SUMMARY_BATCH_TURNS) if CHAT_HISTORY_TURNS > 0 else None
+
+        self.product_search = CatalogManager(
+            snapshot_file=PRODUCT_INDEX_SNAPSHOT,
+            cache_size=PRODUCT_CACHE_SIZE,
+            cache_ttl=PRODUCT_CACHE_TTL,
+            num_shards=PRODUCT_SEARCH_SHARDS,
+            embedder=make_embedder(PRODUCT_EMBEDDER))
+        self.sessions = SessionRegistry(maxsize=CHAT_SESSION_MAX, ttl=CHAT_SESSION_TTL)
+        self.checkpoint_retention = CheckpointRetention(
+            POSTGRES_CONNINFO, keep=CHECKPOINT_KEEP, ttl=CHECKPOINT_THREAD_TTL,
+            interval=CHECKPOINT_RETENTION_INTERVAL, batch_size=CHECKPOINT_RETENTION_BATCH,
+            connect_kwargs={"prepare_threshold": None}) if CHECKPOINT_KEEP > 0 else None
         self.cart_tools = CartTools()
         self.order_tools = OrderTools()
-
-        checkpointer = PostgresSaver(self.postgres_pool)
-        try:
-            checkpointer.setup()
-        except Exception as e:
-            print(f"Error: {e}")
+        self.search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="product-search")
+        self.agent_executor = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="chat-turn")
+        # event loop serving the chats; async tools called from agent threads run on it
+        self._loop = None
+
+        self._started = False
+        self._start_lock = asyncio.Lock()
+        if not self.async_mode:
+            self.checkpointer = PostgresSaver(self.postgres_pool)
+            try:
+                self.checkpointer.setup()
+            except Exception as e:
+                print(f"Error: {e}")
+            self._compile_agents()
+            self._start_retention()
+
+    def _start_retention(self):
+        # after setup(), so the checkpoint tables exist
+        if self.checkpoint_retention is not None:
+            self.checkpoint_retention.start()
+
+    def _compile_agents(self):
+        # compiled once; the auth token of each turn comes from auth_token_var
+        self.guest_agent = self.build_agent(GUEST_PROMPT)
+        self.agent = self.build_agent(AUTHENTICATED_PROMPT, authenticated=True)
+        self._started = True
+
+    async def start(self):
+        """Open the async connection pool and compile the agents; a no-op once started"""
+        if self._started:
+            return
+        async with self._start_lock:
+            if self._started:
+                return
+            print(f"Connecting to pooler")
+            try:
+                await self.postgres_pool.open(wait=True)
+                async with self.postgres_pool.connection() as conn:
+                    await conn.execute("SELECT 1")
+                    print("Connection to database succesful")
+            except Exception as e:
+                print(f"Error connecting to pooler: {e}")
+                raise
+
+            self.checkpointer = PooledAsyncPostgresSaver(self.postgres_pool)
+            try:
+                await self.checkpointer.setup()
+            except Exception as e:
+                print(f"Error: {e}")
+            self._compile_agents()
+            self._start_retention()
 
     # helper function to preserve metadata of the original function
     def _preserve_metadata(self, original, wrapped):
@@ -71,19 +194,19 @@ class ChatService:
         return wrapped
 
     # helper function to wrap cart tools with auth token
-    def _wrap_auth(self, tool, auth_token: str):
-        """Wraps a function to inject only auth_token."""
-        def wrapped_tool():
+    def _wrap_auth(self, tool):
+        """Wraps a function to inject only auth_token, read from auth_token_var."""
+        async def wrapped_tool():
             print(f"[AUTH ONLY WRAPPER] Calling {tool.__name__} with auth_token.")
-            return tool(auth_token=auth_token)
+            return await tool(auth_token=auth_token_var.get())
         return self._preserve_metadata(tool, wrapped_tool)
 
     # helper function to wrap cart tools with auth token and other args
-    def _wrap_auth_args(self, tool, auth_token: str):
-        """Wraps a function to inject auth_token while preserving other arguments."""
+    def _wrap_auth_args(self, tool):
+        """Wraps a function to inject auth_token (from auth_token_var) while preserving other arguments."""
         sig = inspect.signature(tool)
 
-        def wrapped_tool(*args, **kwargs):
+        async def wrapped_tool(*args, **kwargs):
             # parse args if they are passed as a list of dicts - LLMs fall back to this format
             if "args" in kwargs:
                 arg_list = kwargs.pop("args")
@@ -92,15 +215,20 @@ class ChatService:
 
             # bind the arguments and inject auth_token
             bound = sig.bind_partial(*args, **kwargs)
-            bound.arguments["auth_token"] = auth_token
+            bound.arguments["auth_token"] = auth_token_var.get()
             bound.apply_defaults()
 
             print(f"[TOOL CALL] {tool.__name__} with: {bound.arguments}")
-            return tool(**bound.arguments)
+            return await tool(**bound.arguments)
 
         return self._preserve_metadata(tool, wrapped_tool)
 
-    def _lookup_product_info(
+    async def _in_search_executor(self, function, *args, **kwargs):
+        """Run CPU-bound search work on the bounded search pool, off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.search_executor, functools.partial(function, *args, **kwargs))
+
+    async def _lookup_product_info(
         self,
         query: Annotated[str, "The product related question or search criteria"],
         weight: Annotated[Optional[float], "baseWeight of the product in pounds"] = None,
@@ -108,43 +236,64 @@ class ChatService:
         width: Annotated[Optional[float], "Width of the product in inches"] = None,
         length: Annotated[Optional[float], "Length of the product in inches"] = None,
         sku: Annotated[Optional[str], "Product SKU/part number"] = None,
+        weight_range: Annotated[Optional[list[Optional[float]]],
+                                "Weight range in pounds as [min, max]; use null for an open end"] = None,
+        height_range: Annotated[Optional[list[Optional[float]]],
+                                "Height range in inches as [min, max]; use null for an open end"] = None,
+        width_range: Annotated[Optional[list[Optional[float]]],
+                               "Width range in inches as [min, max]; use null for an open end"] = None,
+        length_range: Annotated[Optional[list[Optional[float]]],
+                                "Length range in inches as [min, max]; use null for an open end"] = None,
+        cursor: Annotated[Optional[int],
+                          "next_cursor from a previous result, to see more results for the same search"] = None,
     ) -> dict:
-        """Tool for querying product information with optional dimensional specifications."""
-        result = self.product_search.get_response(
-            query=query,
-            weight=weight,
-            height=height,
-            width=width,
-            length=length,
-            sku=sku,
-        )
-        return {"messages": [AIMessage(content=result)]}
+        """Tool for querying product information with optional dimensional specifications.
+        Use the *_range parameters for requests like "between 500 and 700 lbs"."""
+        ranges = {dim: bounds for dim, bounds in {
+            'weight': weight_range,
+            'height': height_range,
+            'width': width_range,
+            'length': length_range,
+        }.items() if bounds}
+        for dim, bounds in ranges.items():
+            if len(bounds) != 2:
+                return {"status": "error", "message": f"{dim}_range must be [min, max]"}
+
+        def search():
+            result = self.product_search.get_response(
+                query=query,
+                weight=weight,
+                height=height,
+                width=width,
+                length=length,
+                sku=sku,
+                ranges=ranges,
+            )
+            return fit_token_budget(result, PRODUCT_TOOL_TOKEN_BUDGET, cursor or 0, model=CHAT_MODEL)
+        return await self._in_search_executor(search)
 
     async def _get_product_url_by_name(self, name: str, token: str) -> dict:
         """Get product URL by name or SKU."""
+        not_found = {"status": "not found", "message": "Sorry, no product with that name or SKU was found."}
         try:
             # First try to find by SKU if the input looks like a SKU
             if name.isalnum() and len(name) >= 6:
-                result = self.product_search.get_response(query="", sku=name)
-                if isinstance(result, str):
-                    result = eval(result)
+                result = await self._in_search_executor(self.product_search.get_response, query="", sku=name)
                 if result["status"] == "SKU match found" and result["products"]:
                     product = result["products"][0]
                     if "Supabase_ID" in product:
                         url = f"http://localhost:5173/product/{product['Supabase_ID']}?variant={name}"
-                        return {"messages": [AIMessage(content=url)]}
+                        return {"status": "found", "url": url}
                 # If SKU search failed and input is just a SKU (no spaces), return error
                 if " " not in name:
-                    return {"messages": [AIMessage(content="Sorry, no product with that name or SKU was found.")]}
+                    return not_found
             
             # If SKU search failed or input doesn't look like a SKU, try to find by name
             parts = name.split()
             potential_sku = parts[-1] if parts and parts[-1].isalnum() and len(parts[-1]) >= 6 else None
             product_name = " ".join(parts[:-1]) if potential_sku else name
             
-            result = self.product_search.get_response(query=product_name)
-            if isinstance(result, str):
-                result = eval(result)
+            result = await self._in_search_executor(self.product_search.get_response, query=product_name)
             
             if result["status"] != "No products found" and result["products"]:
                 product = result["products"][0]
@@ -153,96 +302,204 @@ class ChatService:
                         url = f"http://localhost:5173/product/{product['Supabase_ID']}?variant={product['SKU']}"
                     else:
                         url = f"http://localhost:5173/product/{product['Supabase_ID']}"
-                    return {"messages": [AIMessage(content=url)]}
+                    return {"status": "found", "url": url}
             
-            return {"messages": [AIMessage(content="Sorry, no product with that name or SKU was found.")]}
+            return not_found
 
         except Exception as e:
-            return {"messages": [AIMessage(content=f"Error retrieving product info: {str(e)}")]}
-
-    def build_tools(self, auth_token: Optional[str] = None):
+            return {"status": "error", "message": f"Error retrieving product info: {str(e)}"}
+
+    # helper function to send the compact rendering of a tool's payload to the model
+    def _render_tool(self, tool):
+        """StructuredTool whose message content is render_for_llm(payload); the payload itself is the message artifact."""
+        if inspect.iscoroutinefunction(tool):
+            @functools.wraps(tool)
+            async def rendered(*args, **kwargs):
+                payload = await tool(*args, **kwargs)
+                return render_for_llm(payload), payload
+
+            # the synchronous graph runs on agent threads; hand the call back to the event loop
+            @functools.wraps(tool)
+            def rendered_sync(*args, **kwargs):
+                return self._run_on_loop(rendered(*args, **kwargs))
+            return StructuredTool.from_function(rendered_sync, coroutine=rendered,
+                                                response_format="content_and_artifact")
+
+        @functools.wraps(tool)
+        def rendered(*args, **kwargs):
+            payload = tool(*args, **kwargs)
+            return render_for_llm(payload), payload
+        return StructuredTool.from_function(rendered, response_format="content_and_artifact")
+
+    def _run_on_loop(self, coroutine):
+        """Run a coroutine on the chat event loop from an agent thread and wait for its result"""
+        if self._loop is None:
+            return asyncio.run(coroutine)
+        # tasks on the loop don't see this thread's context, so carry the auth token over
+        return asyncio.run_coroutine_threadsafe(
+            self._with_auth_token(auth_token_var.get(), coroutine), self._loop).result()
+
+    @staticmethod
+    async def _with_auth_token(auth_token, coroutine):
+        auth_token_var.set(auth_token)
+        return await coroutine
+
+    def build_tools(self, authenticated: bool = False):
         tools = [
-            StructuredTool.from_function(self._lookup_product_info),
-            StructuredTool.from_function(self._get_product_url_by_name),
+            self._lookup_product_info,
+            self._get_product_url_by_name,
         ]
 
-        if auth_token:
+        if authenticated:
             tools += [
-                self._wrap_auth(self.view_cart, auth_token),
-                self._wrap_auth_args(self.add_to_cart, auth_token),
-                self._wrap_auth_args(self.update_cart, auth_token),
-                self._wrap_auth_args(self.remove_from_cart, auth_token),
-                self._wrap_auth(self.clear_cart, auth_token),
-                self._wrap_auth(self.create_order, auth_token),
-                self._wrap_auth(self.get_orders, auth_token),
-                self._wrap_auth_args(self.get_order_details, auth_token),
-                self._wrap_auth_args(self.delete_order, auth_token),
-                self._wrap_auth(self.clear_orders, auth_token),
+                self._wrap_auth(self.view_cart),
+                self._wrap_auth_args(self.add_to_cart),
+                self._wrap_auth_args(self.update_cart),
+                self._wrap_auth_args(self.remove_from_cart),
+                self._wrap_auth(self.clear_cart),
+                self._wrap_auth(self.create_order),
+                self._wrap_auth(self.get_orders),
+                self._wrap_auth_args(self.get_order_details),
+                self._wrap_auth_args(self.delete_order),
+                self._wrap_auth(self.clear_orders),
             ]
-        return tools
+        return [self._render_tool(tool) for tool in tools]
+
+    def build_agent(self, prompt: str, authenticated: bool = False):
+        """Compiled ReAct agent, shared by every session of its kind"""
+        return create_react_agent(
+            self.llm,
+            tools=self.build_tools(authenticated),
+            prompt=prompt,
+            pre_model_hook=self.history_window.as_hook() if self.history_window else None,
+            state_schema=ChatState,
+            checkpointer=self.checkpointer,
+        )
 
     # Cart and Order methods
-    def view_cart(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
+    async def view_cart(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
         """Tool for viewing the user's current shopping cart."""
-        return self.cart_tools.view_cart(auth_token=auth_token)
+        return await self.cart_tools.view_cart(auth_token=auth_token)
 
-    def add_to_cart(self, sku: Annotated[str, "Product SKU"], quantity: Annotated[int, "Quantity"] = 1, auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
+    async def add_to_cart(self, sku: Annotated[str, "Product SKU"], quantity: Annotated[int, "Quantity"] = 1, auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
         """Tool for adding a product to the shopping cart."""
-        return self.cart_tools.add_to_cart(sku, quantity, auth_token)
+        return await self.cart_tools.add_to_cart(sku, quantity, auth_token)
 
-    def update_cart(self, sku: Annotated[str, "Product SKU"], quantity: Annotated[int, "New quantity"], auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
+    async def update_cart(self, sku: Annotated[str, "Product SKU"], quantity: Annotated[int, "New quantity"], auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
         """Tool for updating product quantity in the shopping cart."""
-        return self.cart_tools.update_cart(sku, quantity, auth_token)
+        return await self.cart_tools.update_cart(sku, quantity, auth_token)
 
-    def remove_from_cart(self, sku: Annotated[str, "Product SKU"], auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
+    async def remove_from_cart(self, sku: Annotated[str, "Product SKU"], auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
         """Tool for removing a product from the shopping cart."""
-        return self.cart_tools.remove_from_cart(sku, auth_token)
+        return await self.cart_tools.remove_from_cart(sku, auth_token)
 
-    def clear_cart(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
+    async def clear_cart(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
         """Tool for clearing all items from the shopping cart."""
-        return self.cart_tools.clear_cart(auth_token)
+        return await self.cart_tools.clear_cart(auth_token)
 
-    def create_order(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
+    async def create_order(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
         """Tool for creating a new order."""
-        return self.order_tools.create_order(auth_token)
+        return await self.order_tools.create_order(auth_token)
 
-    def get_orders(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
+    async def get_orders(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
         """Tool for retrieving the user's order history."""
-        return self.order_tools.get_orders(auth_token)
+        return await self.order_tools.get_orders(auth_token)
 
-    def get_order_details(self, order_id: Annotated[str, "Order ID"], auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
+    async def get_order_details(self, order_id: Annotated[str, "Order ID"], auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
         """Tool for retrieving order details."""
-        return self.order_tools.get_order_details(order_id, auth_token)
+        return await self.order_tools.get_order_details(order_id, auth_token)
 
-    def delete_order(self, order_id: Annotated[str, "Order ID"], auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
+    async def delete_order(self, order_id: Annotated[str, "Order ID"], auth_token: Annotated[str, "User's authentication token"] = "") -> dict:
         """Tool for deleting an order."""
-        return self.order_tools.delete_order(order_id, auth_token)
+        return await self.order_tools.delete_order(order_id, auth_token)
     
-    def clear_orders(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
+    async def clear_orders(self, auth_token: Annotated[str, "User's authentication token"]) -> dict:
         """Tool for clearing all orders."""
-        return self.order_tools.clear_orders(auth_token)
+        return await self.order_tools.clear_orders(auth_token)
 
     async def get_response(self, query: str, session_id: str, auth_token=None) -> str:
         """Get a response for authenticated users."""
         print(f"[REACT_CHAT.PY] Received query for AUTHENTICATED USERS: {query} for session: {session_id}")
-        tools = self.build_tools(auth_token)
-        
-        if session_id not in self.memory_savers:
-            self.memory_savers[session_id] = PostgresSaver(self.postgres_pool)
+        await self.start()
+        self.sessions.touch(session_id)
 
-        checkpointer = self.memory_savers[session_id]
+        reset_token = auth_token_var.set(auth_token)
+        try:
+            return await self._run_agent(self.agent, query, session_id)
+        finally:
+            auth_token_var.reset(reset_token)
 
-        agent = create_react_agent(
-            self.llm,
-            tools=tools,
-            prompt=(
-                "You are an e-commerce chatbot. Help users search products, manage their cart, and view or update orders. "
-                "Embed URLs when available. Do not answer unrelated questions. "
-                "Do NOT ask for the user's auth token, because all requests already have it included."
-            ),
-            checkpointer=checkpointer,
+    async def get_guest_response(self, query: str, session_id: str) -> str:
+        """Get a response for guest users (unauthenticated)."""
+        await self.start()
+        self.sessions.touch(session_id)
+
+        return await self._run_agent(self.guest_agent, query, session_id)
+
+    def stream_response(self, query: str, session_id: str, auth_token=None):
+        """Stream one turn as events, authenticated when auth_token is given.
+
+        Returns an async iterator yielding {"event": "token", "content": ...} for
+        every piece of the model's reply, "tool_start" (name, args) and
+        "tool_end" (name, status) around tool calls, and finally "done" with the
+        whole reply. The agent only advances when the previous event has been
+        taken, so a slow reader holds it back, and closing the stream cancels
+        the turn. Raises StreamingUnavailable right away without CHAT_ASYNC.
+        """
+        if not self.async_mode:
+            raise StreamingUnavailable("Streaming needs the async chat pipeline (CHAT_ASYNC)")
+        return self._stream_events(query, session_id, auth_token)
+
+    async def _stream_events(self, query: str, session_id: str, auth_token):
+        await self.start()
+        self.sessions.touch(session_id)
+
+        agent = self.agent if auth_token else self.guest_agent
+        config = {"configurable": {"thread_id": session_id}, "recursion_limit": 150}
+        # set in the task serving this stream only, so it isn't reset
+        auth_token_var.set(auth_token)
+        stream = agent.astream(
+            {"messages": [{"role": "user", "content": query}]},
+            config,
+            stream_mode=["messages", "updates"],
         )
-
+        result = ""
+        try:
+            async for mode, chunk in stream:
+                if mode == "messages":
+                    message, metadata = chunk
+                    # tool results come through as messages too; only the model's reply is streamed
+                    if (isinstance(message, AIMessageChunk) and message.content
+                            and metadata.get("langgraph_node") == "agent"):
+                        yield {"event": "token", "content": message.content}
+                    continue
+                for update in chunk.values():
+                    for message in (update or {}).get("messages", []):
+                        if isinstance(message, ToolMessage):
+                            status = message.artifact.get("status") if isinstance(message.artifact, dict) else None
+                            yield {"event": "tool_end", "name": message.name, "status": status}
+                        elif isinstance(message, AIMessage):
+                            for call in message.tool_calls:
+                                yield {"event": "tool_start", "name": call["name"], "args": call["args"]}
+                            result = message.content
+            yield {"event": "done", "content": result}
+        finally:
+            # stops the graph (and the model call in flight) when the reader goes away early
+            await stream.aclose()
+
+    async def _run_agent(self, agent, query: str, session_id: str) -> str:
+        """Run one turn of the agent, keeping the event loop free"""
+        if self.async_mode:
+            return await self._astream_agent(agent, query, session_id)
+
+        # the synchronous pipeline runs on an agent thread
+        self._loop = asyncio.get_running_loop()
+        # run_in_executor doesn't carry context variables (the auth token) to the thread
+        context = contextvars.copy_context()
+        return await self._loop.run_in_executor(
+            self.agent_executor, functools.partial(context.run, self._stream_agent, agent, query, session_id))
+
+    def _stream_agent(self, agent, query: str, session_id: str) -> str:
         config = {"configurable": {"thread_id": session_id}, "recursion_limit": 150}
         events = agent.stream(
             {"messages": [{"role": "user", "content": query}]},
@@ -257,43 +514,43 @@ class ChatService:
 
         return result
 
-    async def get_guest_response(self, query: str, session_id: str) -> str:
-        """Get a response for guest users (unauthenticated)."""
-        tools = self.build_tools()  # No auth token for guest users
-        
-        if session_id not in self.memory_savers:
-            self.memory_savers[session_id] = PostgresSaver(self.postgres_pool)
-
-        checkpointer = self.memory_savers[session_id]
-
-        agent = create_react_agent(
-            self.llm,
-            tools=tools,
-            prompt="You are an e-commerce chatbot. You can only help with product search for guest users. Politely explain that login is required for cart and order actions. Do not answer unrelated questions.",
-            checkpointer=checkpointer,
-        )
-
+    async def _astream_agent(self, agent, query: str, session_id: str) -> str:
         config = {"configurable": {"thread_id": session_id}, "recursion_limit": 150}
-        events = agent.stream(
+        result = ""
+        async for event in agent.astream(
             {"messages": [{"role": "user", "content": query}]},
             config,
             stream_mode="values",
-        )
-
-        result = ""
-        for event in events:
+        ):
             if "messages" in event:
                 result = event["messages"][-1].content
 
         return result
 
+    async def aclose(self):
+        """Stop checkpoint retention, close the HTTP sessions of the cart and order tools and the async connection pool"""
+        if self.checkpoint_retention is not None:
+            await asyncio.to_thread(self.checkpoint_retention.stop)
+        await self.cart_tools.close()
+        await self.order_tools.close()
+        if self.async_mode:
+            await self.postgres_pool.close()
+
     def cleanup(self):
-        if hasattr(self, "postgres_pool"):
+        if getattr(self, "checkpoint_retention", None) is not None:
+            self.checkpoint_retention.stop()
+        if hasattr(self, "postgres_pool") and not self.async_mode:
             self.postgres_pool.close()
+        if hasattr(self, "product_search"):
+            self.product_search.close()
+        for executor in ("agent_executor", "search_executor"):
+            if hasattr(self, executor):
+                getattr(self, executor).shutdown(wait=False, cancel_futures=True)
 
 
 async def main():
     chat = ChatService()
+    await chat.start()
     try:
         while True:
             user_input = input("User: ")
@@ -306,6 +563,7 @@ async def main():
                 auth_token="eyJhbGciOiJIUzI1NiIsImtpZCI6IjNiVzVGcTJNMVN2dXVkQVAiLCJ0eXAiOiJKV1QifQ.eyJpc3MiOiJodHRwczovL2NrZGRhYXdhd2x4anNpem9ib2h4LnN1cGFiYXNlLmNvL2F1dGgvdjEiLCJzdWIiOiJiZGE0MmU1Ni01ZDQ5LTQ1MzQtOThlMy0wNmU5OTQxNzQzYjkiLCJhdWQiOiJhdXRoZW50aWNhdGVkIiwiZXhwIjoxNzQ4ODI0NjMyLCJpYXQiOjE3NDg4MjEwMzIsImVtYWlsIjoidGVzdEBleGFtcGxlLmNvbSIsInBob25lIjoiIiwiYXBwX21ldGFkYXRhIjp7InByb3ZpZGVyIjoiZW1haWwiLCJwcm92aWRlcnMiOlsiZW1haWwiXX0sInVzZXJfbWV0YWRhdGEiOnsiZW1haWxfdmVyaWZpZWQiOnRydWV9LCJyb2xlIjoiYXV0aGVudGljYXRlZCIsImFhbCI6ImFhbDEiLCJhbXIiOlt7Im1ldGhvZCI6InBhc3N3b3JkIiwidGltZXN0YW1wIjoxNzQ4ODIxMDMyfV0sInNlc3Npb25faWQiOiIzNjY2YTQ3MC05MzdmLTRlMGYtYmE1OS0zODU5MmVjODgyMjYiLCJpc19hbm9ueW1vdXMiOmZhbHNlfQ.wSPSD5J3mD6D2fVGthhWngHzygYmY3b1LyMq9rqHQk0"
             )
     finally:
+        await chat.aclose()
         chat.cleanup()
 
 
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class FrozenDict(dict):
+    """dict that refuses changes, so one cached result can be handed to every caller"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("cached results are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # pickle and deepcopy rebuild it in one go rather than item by item
+        return FrozenDict, (dict(self),)
+
+
+def freeze(value):
+    """Read-only copy of a result: dicts become FrozenDicts and lists tuples"""
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class ResultCache:
+    """Bounded LRU cache with a TTL whose entries belong to a catalog version.
+
+    An entry stored under an older version is treated as a miss, so bumping
+    the version invalidates everything without walking the cache. Stale
+    entries are dropped when they are next looked up or fall off the LRU end.
+    Values are frozen once when stored, so every hit can share them.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Cached value for key at this version, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires, value = entry
+                if entry_version == version and expires > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        """Store value frozen; returns the frozen value, so a miss hands out what a hit would"""
+        value = freeze(value)
+        if self.maxsize <= 0:
+            return value
+        with self._lock:
+            self._entries[key] = (version, self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,735 @@
+import copy
+import math
+import numpy as np
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+# prefix matches up to this many are sorted, more are ranked by a scan
+PREFIX_SORT_MAX = 4096
+PREFIX_SCAN_BLOCK = 4096
+
+
+class TermTable:
+    """Sorted set of strings held in a fixed-width bytes array.
+
+    Lookups are binary searches, so a table memory-mapped from a snapshot is
+    usable straight away without rebuilding a dict of every term.
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    @classmethod
+    def from_strings(cls, strings):
+        # utf-8 byte order matches code point order, so sorting str is enough
+        encoded = [term.encode('utf-8') for term in sorted(set(strings))]
+        if not encoded:
+            return cls(np.zeros(0, dtype='S1'))
+        return cls(np.array(encoded, dtype=bytes))
+
+    def index(self, term):
+        """Position of term in the table, or -1"""
+        key = term.encode('utf-8')
+        # numpy would truncate a longer key to the column width
+        if len(key) > self.keys.dtype.itemsize or not len(self.keys):
+            return -1
+        pos = int(np.searchsorted(self.keys, key))
+        if pos < len(self.keys) and self.keys[pos] == key:
+            return pos
+        return -1
+
+    def indices(self, terms):
+        """index() for a sequence of terms at once, as an int64 array"""
+        positions = np.full(len(terms), -1, dtype=np.int64)
+        if not len(self.keys) or not len(terms):
+            return positions
+        encoded = [term.encode('utf-8') for term in terms]
+        fits = np.array([len(key) <= self.keys.dtype.itemsize for key in encoded])
+        keys = np.array(encoded, dtype=self.keys.dtype)
+        found = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        hit = fits & (self.keys[found] == keys)
+        positions[hit] = found[hit]
+        return positions
+
+    def __contains__(self, term):
+        return self.index(term) >= 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, pos):
+        return self.keys[pos].decode('utf-8')
+
+    def __iter__(self):
+        return (key.decode('utf-8') for key in self.keys.tolist())
+
+
+class InvertedIndex:
+    """BM25 (Okapi) index over posting lists.
+
+    Scores are identical to rank_bm25.BM25Okapi (same k1, b, epsilon and idf
+    floor), but a query only touches the postings of its own terms instead of
+    scoring every document in the corpus.
+
+    with_updates() returns a new index that shares the base posting lists:
+    added documents go to a small delta segment and removed ones are
+    tombstoned, until compacted() folds both back into fresh CSR arrays.
+    """
+
+    ARRAYS = ['terms', 'indptr', 'postings', 'tfs', 'doc_freq', 'idf', 'doc_len',
+              'norms', 'deleted', 'doc_indptr', 'doc_terms', 'doc_tfs']
+
+    def __init__(self, corpus, k1=BM25_K1, b=BM25_B, epsilon=BM25_EPSILON):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.build(corpus)
+
+    def build(self, corpus):
+        """Build CSR posting lists, idf table and length norms from tokenized documents"""
+        term_ids = {}
+        term_col, doc_col, tf_col = [], [], []
+        doc_len = []
+
+        for doc_id, document in enumerate(corpus):
+            doc_len.append(len(document))
+            frequencies = {}
+            for word in document:
+                frequencies[word] = frequencies.get(word, 0) + 1
+            for word, freq in frequencies.items():
+                term_col.append(term_ids.setdefault(word, len(term_ids)))
+                doc_col.append(doc_id)
+                tf_col.append(freq)
+
+        # term ids follow the sorted vocabulary so they line up with self.terms
+        vocabulary = sorted(term_ids)
+        remap = np.empty(len(term_ids), dtype=np.int64)
+        remap[[term_ids[term] for term in vocabulary]] = np.arange(len(vocabulary))
+        term_col = remap[np.asarray(term_col, dtype=np.int64)]
+
+        self._build_arrays(TermTable.from_strings(vocabulary), term_col,
+                           np.asarray(doc_col, dtype=np.int64),
+                           np.asarray(tf_col, dtype=np.float64),
+                           np.asarray(doc_len, dtype=np.float64))
+
+    def _build_arrays(self, terms, term_col, doc_col, tf_col, doc_len):
+        """Lay out (term, doc, tf) entries, given in document order, as CSR arrays"""
+        self.terms = terms
+        self.doc_len = doc_len
+        self.deleted = np.zeros(len(doc_len), dtype=bool)
+
+        # entries arrive document by document: that is the forward index
+        self.doc_terms = term_col.astype(np.int32)
+        self.doc_tfs = tf_col
+        self.doc_indptr = np.zeros(len(doc_len) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(doc_col, minlength=len(doc_len)),
+                  out=self.doc_indptr[1:])
+
+        # group postings by term; stable sort keeps doc ids ascending in each list
+        order = np.argsort(term_col, kind='stable')
+        self.postings = doc_col.astype(np.int32)[order]
+        self.tfs = tf_col[order]
+        doc_freq = np.bincount(term_col, minlength=len(terms))
+        self.indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=self.indptr[1:])
+
+        self._reset_delta()
+        self._update_statistics(doc_freq)
+
+    def _reset_delta(self):
+        self.extra_terms = {}
+        self.extra_term_names = []
+        self.extra_postings = {}
+        self.extra_doc_terms = {}
+        self.num_deleted = 0
+
+    def _update_statistics(self, doc_freq):
+        """Recompute corpus size, average length, idf and length norms over live documents"""
+        self.doc_freq = doc_freq
+        live_len = self.doc_len[~self.deleted] if self.num_deleted else self.doc_len
+        self.corpus_size = len(live_len)
+        self.avgdl = float(live_len.sum() / self.corpus_size) if self.corpus_size else 0.0
+        self.idf = self._calc_idf(doc_freq)
+        if self.corpus_size:
+            self.norms = self.k1 * (1 - self.b + self.b *
+                                    self.doc_len / self.avgdl)
+        else:
+            self.norms = np.zeros(len(self.doc_len))
+
+    def use_global_statistics(self, doc_freq, corpus_size, avgdl, average_idf):
+        """Score as one shard of a larger corpus.
+
+        doc_freq holds the corpus-wide document frequency of each of this
+        index's terms; with the corpus size, average document length and
+        average idf of the whole corpus, shard scores equal the scores a
+        single index over all documents would give.
+        """
+        self.doc_freq = np.asarray(doc_freq)
+        self.corpus_size = corpus_size
+        self.avgdl = avgdl
+        self.average_idf = average_idf
+        idf = np.log(corpus_size - self.doc_freq + 0.5) - np.log(self.doc_freq + 0.5)
+        idf[(self.doc_freq > 0) & (idf < 0)] = self.epsilon * average_idf
+        self.idf = idf
+        self.norms = self.k1 * (1 - self.b + self.b * self.doc_len / avgdl)
+
+    def _calc_idf(self, doc_freq):
+        """idf with the BM25Okapi floor of epsilon * average idf for very common terms"""
+        idf = np.log(self.corpus_size - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        # terms whose documents were all removed don't count towards the average
+        present = doc_freq > 0
+        if present.any():
+            # exactly rounded, so shards merging vocabularies in another order agree
+            self.average_idf = math.fsum(idf[present]) / int(present.sum())
+            idf[present & (idf < 0)] = self.epsilon * self.average_idf
+        else:
+            self.average_idf = 0.0
+        return idf
+
+    def to_arrays(self):
+        """Arrays and scalar metadata that fully describe the index"""
+        if self.has_updates:
+            raise ValueError("compact the index before serializing it")
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays['terms'] = self.terms.keys
+        metadata = {name: getattr(self, name) for name in
+                    ['k1', 'b', 'epsilon', 'avgdl', 'average_idf', 'corpus_size']}
+        return arrays, metadata
+
+    @classmethod
+    def from_arrays(cls, arrays, metadata):
+        """Rebuild an index from to_arrays() output without re-tokenizing"""
+        index = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(index, name, arrays[name])
+        index.terms = TermTable(arrays['terms'])
+        for name, value in metadata.items():
+            setattr(index, name, value)
+        index._reset_delta()
+        return index
+
+    def __len__(self):
+        return self.corpus_size
+
+    def __contains__(self, term):
+        return self._term_id(term) >= 0
+
+    @property
+    def num_docs(self):
+        """Size of the doc id space, including removed documents"""
+        return len(self.doc_len)
+
+    @property
+    def has_updates(self):
+        return bool(self.extra_doc_terms) or self.num_deleted > 0
+
+    def _term_id(self, term):
+        term_id = self.terms.index(term)
+        if term_id < 0:
+            term_id = self.extra_terms.get(term, -1)
+        return term_id
+
+    def _term_name(self, term_id):
+        if term_id < len(self.terms):
+            return self.terms[term_id]
+        return self.extra_term_names[term_id - len(self.terms)]
+
+    def _document_entries(self, doc_id):
+        """(term ids, tfs) of one document"""
+        if doc_id < len(self.doc_indptr) - 1:
+            start, end = self.doc_indptr[doc_id], self.doc_indptr[doc_id + 1]
+            return self.doc_terms[start:end], self.doc_tfs[start:end]
+        return self.extra_doc_terms[doc_id]
+
+    def document_terms(self, doc_id):
+        """Unique terms of a document, from the forward index"""
+        term_ids, _ = self._document_entries(doc_id)
+        return [self._term_name(term_id) for term_id in term_ids]
+
+    def _postings(self, term_id):
+        """Live (doc ids, tfs) for a term across the base and delta segments"""
+        if term_id < len(self.terms):
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs, tf = self.postings[start:end], self.tfs[start:end]
+        else:
+            docs, tf = np.zeros(0, dtype=np.int32), np.zeros(0)
+
+        extra = self.extra_postings.get(term_id)
+        if extra is not None:
+            docs = np.concatenate([docs, extra[0]])
+            tf = np.concatenate([tf, extra[1]])
+        if self.num_deleted:
+            live = ~self.deleted[docs]
+            docs, tf = docs[live], tf[live]
+        return docs, tf
+
+    def score(self, query_tokens):
+        """Score the documents containing at least one query token.
+
+        Returns a pair of arrays (doc_ids, scores) sorted by doc id; documents
+        that share no term with the query are left out (their score is 0).
+        """
+        doc_parts, score_parts = [], []
+        for token in query_tokens:
+            term_id = self._term_id(token)
+            if term_id < 0:
+                continue
+            docs, tf = self._postings(term_id)
+            doc_parts.append(docs)
+            score_parts.append(
+                self.idf[term_id] * (tf * (self.k1 + 1) / (tf + self.norms[docs])))
+
+        if not doc_parts:
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        if len(doc_parts) == 1:
+            return doc_parts[0], score_parts[0]
+
+        doc_ids, inverse = np.unique(
+            np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(
+            inverse, weights=np.concatenate(score_parts), minlength=len(doc_ids))
+        return doc_ids, scores
+
+    def score_many(self, queries):
+        """score() for a batch of token lists in one vectorized pass.
+
+        The batch is treated as a sparse query x term matrix: every
+        (query, term) entry is expanded into its term's posting slice, and
+        the contributions are summed per (query, doc) key with a single
+        unique + bincount. Returns one (doc_ids, scores) pair per query, as
+        score() would.
+        """
+        # sparse query-term matrix in coordinate form; repeated tokens count
+        # twice, like in score()
+        entry_query = np.repeat(np.arange(len(queries)),
+                                [len(query_tokens) for query_tokens in queries])
+        tokens = [token for query_tokens in queries for token in query_tokens]
+        entry_term = self.terms.indices(tokens)
+        if self.extra_terms:
+            for i in np.flatnonzero(entry_term < 0).tolist():
+                entry_term[i] = self.extra_terms.get(tokens[i], -1)
+        known = entry_term >= 0
+        entry_query, entry_term = entry_query[known], entry_term[known]
+
+        empty = (np.zeros(0, dtype=np.int32), np.zeros(0))
+        if not len(entry_term):
+            return [empty] * len(queries)
+
+        # (start, length) of each distinct term's postings in (docs, tfs)
+        unique_terms, entry_slot = np.unique(entry_term, return_inverse=True)
+        if self.has_updates:
+            doc_parts, tf_parts = zip(*[self._postings(term_id)
+                                        for term_id in unique_terms.tolist()])
+            lengths = np.array([len(part) for part in doc_parts], dtype=np.int64)
+            starts = np.cumsum(lengths) - lengths
+            docs, tfs = np.concatenate(doc_parts), np.concatenate(tf_parts)
+        else:
+            starts = self.indptr[unique_terms].astype(np.int64)
+            lengths = self.indptr[unique_terms + 1] - starts
+            docs, tfs = self.postings, self.tfs
+
+        # expand every matrix entry into the positions of its term's postings
+        entry_lengths = lengths[entry_slot]
+        entry_offsets = np.cumsum(entry_lengths) - entry_lengths
+        positions = (np.repeat(starts[entry_slot] - entry_offsets, entry_lengths)
+                     + np.arange(entry_lengths.sum()))
+        rows = np.repeat(entry_query, entry_lengths)
+        doc_ids, tf = docs[positions].astype(np.int64), tfs[positions]
+        contributions = (np.repeat(self.idf[entry_term], entry_lengths)
+                         * (tf * (self.k1 + 1) / (tf + self.norms[doc_ids])))
+
+        keys, inverse = np.unique(
+            rows * self.num_docs + doc_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions, minlength=len(keys))
+
+        # keys are sorted by query, then doc
+        key_queries, doc_ids = np.divmod(keys, self.num_docs)
+        bounds = np.searchsorted(key_queries, np.arange(len(queries) + 1))
+        return [(doc_ids[start:end], scores[start:end])
+                for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def with_updates(self, added=(), removed=()):
+        """New index with tokenized documents appended and doc ids tombstoned.
+
+        Added documents get ids from num_docs upwards. The base arrays are
+        shared with this index, which stays valid for in-flight queries.
+        """
+        index = copy.copy(self)
+        index.extra_terms = dict(self.extra_terms)
+        index.extra_term_names = list(self.extra_term_names)
+        index.extra_postings = dict(self.extra_postings)
+        index.extra_doc_terms = dict(self.extra_doc_terms)
+        index.deleted = self.deleted.copy()
+        doc_freq = self.doc_freq.copy()
+
+        for doc_id in removed:
+            if doc_id < self.num_docs and not index.deleted[doc_id]:
+                index.deleted[doc_id] = True
+                index.num_deleted += 1
+                doc_freq[self._document_entries(doc_id)[0]] -= 1
+
+        new_postings = {}
+        doc_len = []
+        for offset, document in enumerate(added):
+            doc_id = self.num_docs + offset
+            doc_len.append(len(document))
+            frequencies = {}
+            for word in document:
+                frequencies[word] = frequencies.get(word, 0) + 1
+
+            term_ids = []
+            for word, freq in frequencies.items():
+                term_id = index._term_id(word)
+                if term_id < 0:
+                    term_id = len(self.terms) + len(index.extra_term_names)
+                    index.extra_terms[word] = term_id
+                    index.extra_term_names.append(word)
+                term_ids.append(term_id)
+                docs, tfs = new_postings.setdefault(term_id, ([], []))
+                docs.append(doc_id)
+                tfs.append(freq)
+            index.extra_doc_terms[doc_id] = (np.asarray(term_ids, dtype=np.int64),
+                                             np.asarray(list(frequencies.values()), dtype=np.float64))
+
+        num_terms = len(self.terms) + len(index.extra_term_names)
+        doc_freq = np.concatenate(
+            [doc_freq, np.zeros(num_terms - len(doc_freq), dtype=doc_freq.dtype)])
+        for term_id, (docs, tfs) in new_postings.items():
+            doc_freq[term_id] += len(docs)
+            docs = np.asarray(docs, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float64)
+            extra = index.extra_postings.get(term_id)
+            if extra is not None:
+                docs = np.concatenate([extra[0], docs])
+                tfs = np.concatenate([extra[1], tfs])
+            index.extra_postings[term_id] = (docs, tfs)
+
+        index.doc_len = np.concatenate(
+            [self.doc_len, np.asarray(doc_len, dtype=np.float64)])
+        index.deleted = np.concatenate(
+            [index.deleted, np.zeros(len(doc_len), dtype=bool)])
+        index._update_statistics(doc_freq)
+        return index
+
+    def live_doc_ids(self):
+        return np.flatnonzero(~self.deleted)
+
+    def compacted(self):
+        """New index without tombstones or delta segment.
+
+        Live documents are renumbered in order, matching live_doc_ids().
+        """
+        live_ids = self.live_doc_ids()
+        new_ids = np.full(self.num_docs, -1, dtype=np.int64)
+        new_ids[live_ids] = np.arange(len(live_ids))
+
+        base_docs = len(self.doc_indptr) - 1
+        entry_doc = np.repeat(np.arange(base_docs), np.diff(self.doc_indptr))
+        keep = ~self.deleted[entry_doc]
+        doc_cols = [new_ids[entry_doc[keep]]]
+        term_cols = [self.doc_terms[keep].astype(np.int64)]
+        tf_cols = [self.doc_tfs[keep]]
+        for doc_id in sorted(self.extra_doc_terms):
+            if not self.deleted[doc_id]:
+                term_ids, tfs = self.extra_doc_terms[doc_id]
+                doc_cols.append(np.full(len(term_ids), new_ids[doc_id]))
+                term_cols.append(term_ids)
+                tf_cols.append(tfs)
+
+        keys = self.terms.keys
+        if self.extra_term_names:
+            keys = np.concatenate([keys, np.array(
+                [term.encode('utf-8') for term in self.extra_term_names], dtype=bytes)])
+
+        # keep only terms that still occur, renumbered in sorted order
+        used_ids, term_col = np.unique(
+            np.concatenate(term_cols), return_inverse=True)
+        used_keys = keys[used_ids]
+        order = np.argsort(used_keys, kind='stable')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+
+        index = copy.copy(self)
+        index._build_arrays(TermTable(used_keys[order]), rank[term_col],
+                            np.concatenate(doc_cols), np.concatenate(tf_cols),
+                            self.doc_len[live_ids])
+        return index
+
+
+class RangeIndex:
+    """Document ids sorted by one numeric column, for range probes.
+
+    Missing (NaN) and zero values, which never match a dimension, are left
+    out. Documents added after the index was built are not in it; callers
+    scan those separately.
+    """
+
+    def __init__(self, values, order, size):
+        self.values = values
+        self.order = order
+        # number of documents the index was built over
+        self.size = size
+
+    @classmethod
+    def build(cls, values):
+        values = np.asarray(values, dtype=np.float64)
+        doc_ids = np.flatnonzero(~np.isnan(values) & (values != 0))
+        order = doc_ids[np.argsort(values[doc_ids], kind='stable')]
+        return cls(values[order], order, len(values))
+
+    def between(self, low=None, high=None, inclusive=True):
+        """Ids of documents with low <= value <= high (strict if not
+        inclusive), in value order; a bound of None is open"""
+        start, end = 0, len(self.values)
+        if low is not None:
+            start = int(np.searchsorted(self.values, low, side='left' if inclusive else 'right'))
+        if high is not None:
+            end = int(np.searchsorted(self.values, high, side='right' if inclusive else 'left'))
+        return self.order[start:max(start, end)]
+
+    def to_arrays(self):
+        return {'values': self.values, 'order': self.order}
+
+    @classmethod
+    def from_arrays(cls, arrays, size):
+        return cls(arrays['values'], arrays['order'], size)
+
+
+class PrefixIndex:
+    """Sorted string keys pointing at documents, for prefix (autocomplete) lookups.
+
+    Keys are stored as fixed-width bytes cut to width bytes, so a longer
+    prefix matches every key sharing its first width bytes and callers
+    re-check those. Matches rank boosted documents first, then by weight.
+    Keys of documents added by with_documents() are kept in a list and
+    scanned until the index is rebuilt.
+    """
+
+    def __init__(self, keys, doc_ids, boost, weight, width, extra=()):
+        self.keys = keys
+        self.doc_ids = doc_ids
+        # per document, including added ones
+        self.boost = boost
+        self.weight = weight
+        self.width = width
+        self.extra = tuple(extra)
+        self._ranking = None
+
+    @classmethod
+    def build(cls, doc_keys, boost, weight, width):
+        """doc_keys holds (doc id, key) pairs"""
+        doc_keys = list(doc_keys)
+        keys = np.array([key.encode('utf-8')[:width] for _, key in doc_keys], dtype=f'S{width}')
+        doc_ids = np.array([doc_id for doc_id, _ in doc_keys], dtype=np.int64)
+        order = np.argsort(keys, kind='stable')
+        return cls(keys[order], doc_ids[order], np.asarray(boost, dtype=bool),
+                   np.asarray(weight, dtype=np.float64), width)
+
+    def matches(self, prefix):
+        """Ids of documents with a key starting with prefix (possibly repeated)"""
+        encoded = prefix.encode('utf-8')[:self.width]
+        start = int(np.searchsorted(self.keys, encoded, side='left'))
+        if len(encoded) < self.width:
+            # utf-8 never contains 0xff, so it sorts after every continuation
+            end = int(np.searchsorted(self.keys, encoded + b'\xff', side='left'))
+        else:
+            end = int(np.searchsorted(self.keys, encoded, side='right'))
+        extra = [doc_id for doc_id, key in self.extra if key.startswith(prefix)]
+        return np.concatenate([self.doc_ids[start:end], np.array(extra, dtype=np.int64)])
+
+    @property
+    def ranking(self):
+        """Every document id, best first"""
+        if self._ranking is None:
+            self._ranking = np.lexsort((np.arange(len(self.boost)), -self.weight, ~self.boost))
+        return self._ranking
+
+    def rank(self, doc_ids, limit):
+        """The limit best of doc_ids (repeats allowed): boosted first, then by weight, then by id"""
+        if len(doc_ids) <= PREFIX_SORT_MAX:
+            doc_ids = np.unique(doc_ids)
+            order = np.lexsort((doc_ids, -self.weight[doc_ids], ~self.boost[doc_ids]))
+            return doc_ids[order[:limit]]
+        # short prefixes match much of the catalog: walk the global ranking
+        # until enough of its documents are among the matches
+        matched = np.zeros(len(self.boost), dtype=bool)
+        matched[doc_ids] = True
+        found = []
+        for start in range(0, len(self.boost), PREFIX_SCAN_BLOCK):
+            block = self.ranking[start:start + PREFIX_SCAN_BLOCK]
+            found.append(block[matched[block]])
+            if sum(len(ids) for ids in found) >= limit:
+                break
+        return np.concatenate(found)[:limit]
+
+    def with_documents(self, doc_keys, boost, weight):
+        """Copy with documents appended; doc_keys are (doc id, key) pairs"""
+        return PrefixIndex(self.keys, self.doc_ids, np.concatenate([self.boost, boost]),
+                           np.concatenate([self.weight, weight]), self.width,
+                           self.extra + tuple(doc_keys))
+
+    def compacted(self, live_ids):
+        """Index over the documents in live_ids only, renumbered in that order,
+        with the keys of added documents folded in"""
+        new_ids = np.full(len(self.boost), -1, dtype=np.int64)
+        new_ids[live_ids] = np.arange(len(live_ids))
+        keys = np.concatenate([self.keys, np.array(
+            [key.encode('utf-8')[:self.width] for _, key in self.extra], dtype=self.keys.dtype)])
+        doc_ids = new_ids[np.concatenate([
+            self.doc_ids, np.array([doc_id for doc_id, _ in self.extra], dtype=np.int64)])]
+        keep = doc_ids >= 0
+        keys, doc_ids = keys[keep], doc_ids[keep]
+        order = np.argsort(keys, kind='stable')
+        return PrefixIndex(keys[order], doc_ids[order], self.boost[live_ids],
+                           self.weight[live_ids], self.width)
+
+    def to_arrays(self):
+        if self.extra:
+            raise ValueError("compact the prefix index before serializing it")
+        return {'keys': self.keys, 'doc_ids': self.doc_ids, 'boost': self.boost,
+                'weight': self.weight}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['keys'], arrays['doc_ids'], arrays['boost'], arrays['weight'],
+                   arrays['keys'].dtype.itemsize)
+
+
+class TrigramIndex:
+    """Character trigram index over a vocabulary, for typo-tolerant lookups.
+
+    Terms are padded with '$' on both ends and split into trigrams. An edit
+    changes at most three trigrams of a term (four for a transposition), so
+    only terms sharing enough trigrams with the query are checked with
+    edit_distance().
+    """
+
+    def __init__(self, terms, grams, indptr, postings, term_len):
+        self.terms = terms
+        self.grams = grams
+        # CSR: postings[indptr[g]:indptr[g + 1]] are the terms containing gram g
+        self.indptr = indptr
+        self.postings = postings
+        self.term_len = term_len
+
+    @staticmethod
+    def trigrams(term):
+        padded = f"${term}$"
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @classmethod
+    def build(cls, terms):
+        terms = TermTable.from_strings(terms)
+        pairs = sorted((gram, term_id) for term_id, term in enumerate(terms)
+                       for gram in cls.trigrams(term))
+        grams = TermTable.from_strings(gram for gram, _ in pairs)
+        gram_ids = grams.indices([gram for gram, _ in pairs])
+        indptr = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(gram_ids, minlength=len(grams)), out=indptr[1:])
+        postings = np.array([term_id for _, term_id in pairs], dtype=np.int32)
+        term_len = np.array([len(term) for term in terms], dtype=np.int16)
+        return cls(terms, grams, indptr, postings, term_len)
+
+    def nearest(self, token, max_distance):
+        """Terms closest to token by edit distance, if within max_distance"""
+        if max_distance <= 0 or not len(self.terms):
+            return []
+        grams = list(self.trigrams(token))
+        gram_ids = self.grams.indices(grams)
+        gram_ids = gram_ids[gram_ids >= 0]
+        if not len(gram_ids):
+            return []
+        term_ids = np.concatenate([self.postings[self.indptr[g]:self.indptr[g + 1]]
+                                   for g in gram_ids.tolist()])
+        shared = np.bincount(term_ids, minlength=len(self.terms))
+        candidates = np.flatnonzero(
+            (shared >= len(grams) - 4 * max_distance)
+            & (np.abs(self.term_len.astype(np.int64) - len(token)) <= max_distance))
+
+        best, matches = max_distance + 1, []
+        for term_id in candidates.tolist():
+            term = self.terms[term_id]
+            distance = edit_distance(token, term, best)
+            if distance < best:
+                best, matches = distance, [term]
+            elif distance == best:
+                matches.append(term)
+        return matches if best <= max_distance else []
+
+    def to_arrays(self):
+        return {'terms': self.terms.keys, 'grams': self.grams.keys, 'indptr': self.indptr,
+                'postings': self.postings, 'term_len': self.term_len}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(TermTable(arrays['terms']), TermTable(arrays['grams']), arrays['indptr'],
+                   arrays['postings'], arrays['term_len'])
+
+
+def edit_distance(a, b, limit=None):
+    """Levenshtein distance counting an adjacent transposition as one edit
+    (optimal string alignment). Stops early and returns limit + 1 once the
+    distance is known to exceed limit."""
+    if limit is None:
+        limit = max(len(a), len(b))
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return min(current[-1], limit + 1)
+
+
+def top_k(doc_ids, scores, k):
+    """Return positions of the k best scores, best first (ties keep doc order)"""
+    if k <= 0 or len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if len(scores) > k:
+        # take every document tied with the k-th score, so the lowest doc ids
+        # win the tie instead of whichever argpartition happened to pick
+        kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        candidates = np.flatnonzero(scores >= kth_score)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((doc_ids[candidates], -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def largest_score_drop(scores, corpus_size, num_scored=None):
+    """Largest gap between consecutive scores in the full descending ranking.
+
+    Documents without a score rank last with 0, so the drop from the lowest
+    scored document to 0 counts whenever some documents were not matched.
+    num_scored is the number of scored documents when scores was
+    deduplicated (repeated scores don't change the gaps).
+    """
+    ranked = np.sort(scores)[::-1]
+    if num_scored is None:
+        num_scored = len(scores)
+    if num_scored < corpus_size:
+        ranked = np.append(ranked, 0.0)
+    if len(ranked) < 2:
+        return 0
+    return float(np.max(ranked[:-1] - ranked[1:]))
+
+
+def drop_cutoff(ranked_scores, largest_drop):
+    """How many of the ranked scores to keep: the positive ones, up to the
+    first gap between neighbours that equals the largest drop"""
+    prev_score = None
+    for n, score in enumerate(ranked_scores.tolist()):
+        if score <= 0:
+            return n
+        # get rid of extra results
+        if prev_score and (prev_score - score) == largest_drop:
+            return n
+        prev_score = score
+    return len(ranked_scores)
@@ -0,0 +1,105 @@
+"""Versioned binary snapshots of the product search index.
+
+Layout: an 8 byte magic, a little-endian uint32 format version and uint64
+header length, a JSON header, then every array as raw bytes aligned to
+ALIGNMENT. The header records dtype, shape and offset for each array, so
+the loader can memory-map them instead of reading and re-indexing the CSV.
+
+Build one with:
+    python search_snapshot.py data.csv search_index.snap
+"""
+import json
+import os
+import struct
+import sys
+import time
+import numpy as np
+
+SNAPSHOT_MAGIC = b"PSTSNAP\0"
+SNAPSHOT_VERSION = 7
+ALIGNMENT = 64
+_PREFIX = struct.Struct('<8sIQ')
+
+
+class SnapshotError(ValueError):
+    """The file is not a snapshot this code can read"""
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(path, arrays, metadata):
+    """Write named arrays and JSON metadata to path, replacing it atomically"""
+    arrays = {name: np.ascontiguousarray(array)
+              for name, array in arrays.items()}
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str,
+                        'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({'metadata': metadata, 'arrays': layout}).encode('utf-8')
+    data_start = _align(_PREFIX.size + len(header))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path, mmap=True):
+    """Return (arrays, metadata); arrays are read-only memory maps by default"""
+    with open(path, 'rb') as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise SnapshotError(f"{path} is too short to be a search snapshot")
+        magic, version, header_len = _PREFIX.unpack(prefix)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{path} is not a search snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotError(
+                f"{path} has snapshot version {version}, expected {SNAPSHOT_VERSION}")
+        header = json.loads(f.read(header_len))
+        data_start = _align(_PREFIX.size + header_len)
+
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype, shape = np.dtype(spec['dtype']), tuple(spec['shape'])
+            offset = data_start + spec['offset']
+            if not np.prod(shape, dtype=np.int64):
+                # mmap refuses empty regions
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            elif mmap:
+                arrays[name] = np.memmap(
+                    path, dtype=dtype, mode='r', offset=offset, shape=shape)
+            else:
+                f.seek(offset)
+                count = int(np.prod(shape, dtype=np.int64))
+                arrays[name] = np.fromfile(
+                    f, dtype=dtype, count=count).reshape(shape)
+    return arrays, header['metadata']
+
+
+if __name__ == "__main__":
+    from product_search_tool import ProductSearchTool
+
+    if len(sys.argv) != 3:
+        print("usage: python search_snapshot.py <catalog.csv> <snapshot file>")
+        sys.exit(1)
+
+    csv_file, snapshot_file = sys.argv[1:]
+    start_time = time.time()
+    search_service = ProductSearchTool(csv_file=csv_file)
+    search_service.save_snapshot(snapshot_file)
+    print(f"Indexed {len(search_service.index)} products into {snapshot_file} "
+          f"in {time.time() - start_time:.2f} seconds")
+
+    start_time = time.time()
+    ProductSearchTool(snapshot_file=snapshot_file)
+    print(f"Snapshot loads in {(time.time() - start_time) * 1000:.1f} ms")
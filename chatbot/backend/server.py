@@ -1,11 +1,17 @@
+import asyncio
+import hmac
 import os
+from contextlib import asynccontextmanager
 from typing import Optional
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
 from pydantic import BaseModel
-from react_chat import ChatService
+from react_chat import ChatService, StreamingUnavailable
+from product_search_tool import UnsupportedCatalogOperation
+from tool_payloads import dumps
 import atexit
 from supabase import create_client, Client
 import uvicorn
@@ -14,12 +20,22 @@ load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+CATALOG_ADMIN_TOKEN = os.getenv("CATALOG_ADMIN_TOKEN")
+# /catalog/reload only reads catalogs and snapshots from this directory
+CATALOG_DIR = os.path.realpath(os.getenv("CATALOG_DIR", "."))
+MAX_SUGGESTIONS = 50
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 chat_service = ChatService()
 security = HTTPBearer()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await chat_service.start()
+    yield
+    await chat_service.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -41,10 +57,10 @@ async def get_optional_token(authorization: str = None):
     if authorization and authorization.startswith("Bearer "):
         token = authorization.removeprefix("Bearer ").strip()
         try:
-            if supabase.auth.get_user(token).user:
+            # the Supabase client is synchronous; keep its round-trip off the event loop
+            if (await asyncio.to_thread(supabase.auth.get_user, token)).user:
                 return token
-        except Exception as e:
-            # pass
+        except Exception:
             return None
     return None
 
@@ -71,16 +87,105 @@ async def chat(request: ChatRequest, authorization: str = Header(None)):
         print(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail="Something went wrong.")
 
+async def server_sent_events(events, http_request: Request):
+    """SSE frames of chat events; stops (cancelling the turn) once the client disconnects"""
+    try:
+        async for event in events:
+            if await http_request.is_disconnected():
+                print("[SERVER.PY] Client disconnected, cancelling the chat turn.")
+                break
+            yield f"event: {event['event']}\ndata: {dumps(event)}\n\n"
+    except Exception as e:
+        print(f"Chat stream error: {e}")
+        yield f"event: error\ndata: {dumps({'event': 'error', 'message': 'Something went wrong.'})}\n\n"
+    finally:
+        await events.aclose()
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request, authorization: str = Header(None)):
+    token = await get_optional_token(authorization)
+    if not request.message or not request.session_id:
+        raise HTTPException(status_code=400, detail="Message and session_id are required.")
+    try:
+        events = chat_service.stream_response(request.message, request.session_id, auth_token=token)
+    except StreamingUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return StreamingResponse(
+        server_sent_events(events, http_request),
+        media_type="text/event-stream",
+        # proxies must pass events through as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 class EndSessionRequest(BaseModel):
     session_id: str
 
 @app.delete("/chat/end_session")
 async def end_session(request: EndSessionRequest):
-    if request.session_id in chat_service.memory_savers:
-        del chat_service.memory_savers[request.session_id]
+    if chat_service.sessions.remove(request.session_id):
         return {"message": "Session ended"}
     raise HTTPException(status_code=404, detail="Session not found")
 
+def require_catalog_admin(token):
+    if not CATALOG_ADMIN_TOKEN or not hmac.compare_digest((token or "").encode(), CATALOG_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Catalog updates are not allowed.")
+
+def catalog_path(name):
+    """Path of a file in CATALOG_DIR; None stays None"""
+    if name is None:
+        return None
+    path = os.path.realpath(os.path.join(CATALOG_DIR, name))
+    if os.path.dirname(path) != CATALOG_DIR:
+        raise HTTPException(status_code=400, detail=f"{name} is not a file in the catalog directory.")
+    return path
+
+class CatalogUpdateRequest(BaseModel):
+    upserts: list[dict] = []
+    deletes: list[str] = []
+
+class CatalogReloadRequest(BaseModel):
+    csv_file: Optional[str] = None
+    snapshot_file: Optional[str] = None
+
+# plain def: the index update is CPU work, so FastAPI runs it in its threadpool
+@app.post("/catalog/updates")
+def update_catalog(request: CatalogUpdateRequest, x_admin_token: str = Header(None)):
+    require_catalog_admin(x_admin_token)
+    try:
+        version = chat_service.product_search.apply_updates(request.upserts, request.deletes)
+    except (ValueError, UnsupportedCatalogOperation) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"version": version, **chat_service.product_search.stats()}
+
+@app.post("/catalog/reload")
+def reload_catalog(request: CatalogReloadRequest, x_admin_token: str = Header(None)):
+    require_catalog_admin(x_admin_token)
+    csv_file, snapshot_file = catalog_path(request.csv_file), catalog_path(request.snapshot_file)
+    if not chat_service.product_search.reload(csv_file, snapshot_file):
+        raise HTTPException(status_code=409, detail="A catalog rebuild is already running.")
+    return {"message": "Catalog rebuild started"}
+
+@app.post("/catalog/compact")
+def compact_catalog(x_admin_token: str = Header(None)):
+    require_catalog_admin(x_admin_token)
+    if not chat_service.product_search.compact():
+        raise HTTPException(status_code=409, detail="A catalog rebuild is already running.")
+    return {"message": "Catalog compaction started"}
+
+@app.get("/catalog/status")
+def catalog_status():
+    return chat_service.product_search.stats()
+
+@app.get("/products/suggest")
+def suggest_products(q: str, limit: int = Query(10, ge=1, le=MAX_SUGGESTIONS)):
+    return {"suggestions": chat_service.product_search.suggest(q, limit=limit)}
+
+@app.get("/chat/status")
+def chat_status():
+    retention = chat_service.checkpoint_retention
+    return {"sessions": chat_service.sessions.stats(),
+            "checkpoint_retention": retention.stats() if retention is not None else None}
+
 @app.get("/chat")
 async def chat_root():
     return {"message": "Chat API is running"}
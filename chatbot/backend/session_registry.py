@@ -0,0 +1,106 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class Session:
+    __slots__ = ('session_id', 'created', 'last_seen', 'turns')
+
+    def __init__(self, session_id, now):
+        self.session_id = session_id
+        self.created = now
+        self.last_seen = now
+        self.turns = 0
+
+
+class SessionRegistry:
+    """Bounded registry of live chat sessions.
+
+    Sessions are kept in least recently used order. A session idle for more
+    than ttl seconds is dropped, and beyond maxsize sessions the least
+    recently used one is, so abandoned sessions never pile up. Only the
+    registry entry goes away: the conversation stays in the checkpointer,
+    and a returning session is registered again.
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.started = 0
+        self.ended = 0
+        self.expired = 0
+        self.evicted = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, session_id):
+        """Register a turn of session_id, starting the session if it isn't live"""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session(session_id, now)
+                self.started += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            session.turns += 1
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            return session
+
+    def remove(self, session_id):
+        """End a session; False when it isn't live"""
+        with self._lock:
+            self._expire(self.clock())
+            if self._sessions.pop(session_id, None) is None:
+                return False
+            self.ended += 1
+            return True
+
+    def _expire(self, now):
+        # the least recently seen sessions are first, so stop at the first live one
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_seen <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def sweep(self):
+        """Drop idle sessions now rather than on the next touch"""
+        with self._lock:
+            self._expire(self.clock())
+
+    def __contains__(self, session_id):
+        with self._lock:
+            self._expire(self.clock())
+            return session_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def nbytes(self):
+        """Approximate memory held by the registry"""
+        with self._lock:
+            return sys.getsizeof(self._sessions) + sum(
+                sys.getsizeof(session_id) + sys.getsizeof(session)
+                for session_id, session in self._sessions.items())
+
+    def stats(self):
+        self.sweep()
+        return {
+            'live': len(self._sessions),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'started': self.started,
+            'ended': self.ended,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'memory_bytes': self.nbytes(),
+        }
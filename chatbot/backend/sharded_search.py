@@ -0,0 +1,416 @@
+"""Product search over a catalog partitioned across worker processes.
+
+Each worker process holds a ProductSearchTool for one contiguous slice of
+the catalog. At start-up the coordinator merges every shard's vocabulary
+and document frequencies and sends the corpus-wide BM25 statistics back,
+so a shard scores its documents exactly as one big index would. A query is
+fanned out to all shards; each returns its local top-k results plus the
+largest gaps between its distinct scores, from which the coordinator
+merges the global top-k and applies the same largest-score-drop cutoff as
+ProductSearchTool.search.
+
+Every worker serves several pipes, each on its own thread, and a query
+checks out one pipe per shard for its round-trip, so up to
+connections_per_shard queries are in flight at once.
+"""
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import numpy as np
+from product_search_tool import (ProductSearchTool, UnsupportedCatalogOperation, DEFAULT_MAX_RESULTS,
+                                 DEFAULT_SUGGESTIONS,
+                                 normalize_sku, compact_sku, normalize_ranges, range_targets, fuzzy_vocabulary,
+                                 read_catalog)
+from search_index import TermTable, TrigramIndex, top_k, largest_score_drop, drop_cutoff
+
+# queries a shard can work on at once
+DEFAULT_SHARD_CONNECTIONS = 4
+# gaps between neighbouring scores a shard reports for the largest-drop cutoff
+SCORE_GAPS = 32
+
+
+def score_gaps(scores, count=SCORE_GAPS):
+    """What the merged largest score drop needs to know about one shard's scores.
+
+    The highest and lowest distinct score, the count largest gaps between
+    neighbouring distinct scores as (low, high) pairs, and the length of the
+    largest gap left out (0 when none was). None when nothing was scored.
+    """
+    distinct = np.unique(scores)
+    if not len(distinct):
+        return None
+    gaps = distinct[1:] - distinct[:-1]
+    floor = 0.0
+    keep = np.arange(len(gaps))
+    if len(gaps) > count:
+        keep = np.argpartition(gaps, len(gaps) - count)[len(gaps) - count:]
+        floor = float(np.delete(gaps, keep).max())
+        keep.sort()
+    return {
+        'high': float(distinct[-1]),
+        'low': float(distinct[0]),
+        'gaps': [(float(distinct[i]), float(distinct[i + 1])) for i in keep.tolist()],
+        'floor': floor,
+    }
+
+
+def _intersect(intervals, others):
+    """Overlaps of two sorted lists of disjoint open intervals"""
+    overlaps, i, j = [], 0, 0
+    while i < len(intervals) and j < len(others):
+        low = max(intervals[i][0], others[j][0])
+        high = min(intervals[i][1], others[j][1])
+        if low < high:
+            overlaps.append((low, high))
+        if intervals[i][1] < others[j][1]:
+            i += 1
+        else:
+            j += 1
+    return overlaps
+
+
+def merged_largest_drop(summaries, with_zero):
+    """largest_score_drop of every shard's scores together, from their score_gaps.
+
+    A gap between neighbouring scores of all shards is free of every shard's
+    scores, so it lies in a gap (or beyond the ends) of each shard: the
+    overlaps of the reported gaps are gaps of the merged scores. One hidden
+    in a gap a shard left out is no longer than that shard's floor, so when
+    the largest overlap is at least every floor it is the largest drop.
+    Otherwise the summaries can't tell and None is returned. with_zero adds
+    the 0 that unscored documents rank with.
+    """
+    summaries = [summary for summary in summaries if summary is not None]
+    free = [(-math.inf, math.inf)]
+    for summary in summaries:
+        free = _intersect(free, [(-math.inf, summary['low'])] + summary['gaps'] +
+                          [(summary['high'], math.inf)])
+    if with_zero:
+        free = _intersect(free, [(-math.inf, 0.0), (0.0, math.inf)])
+    largest = max((high - low for low, high in free if math.isfinite(low) and math.isfinite(high)),
+                  default=0)
+    if largest >= max((summary['floor'] for summary in summaries), default=0):
+        return largest
+    return None
+
+
+class SearchShard:
+    """One slice of the catalog, living in a worker process"""
+
+    def __init__(self, df, offset):
+        self.tool = ProductSearchTool.from_frame(df)
+        # global id of this shard's first product
+        self.offset = offset
+
+    def statistics(self):
+        index = self.tool.index
+        return {
+            'terms': np.asarray(index.terms.keys),
+            'doc_freq': np.asarray(index.doc_freq),
+            'corpus_size': index.corpus_size,
+            'total_length': int(np.asarray(index.doc_len).sum()),
+        }
+
+    def use_global_statistics(self, doc_freq, corpus_size, avgdl, average_idf):
+        self.tool.index.use_global_statistics(doc_freq, corpus_size, avgdl, average_idf)
+
+    def find_sku(self, sku):
+        """(key kind, is alias, global row, product) of the product a SKU lookup finds here, or None.
+
+        Kind 0 is a match on the normalized SKU and 1 on the compact form; the
+        coordinator prefers the lower kind, then real SKUs over aliases, then
+        the lowest shard, which is the precedence of a single SKU table.
+        """
+        for kind, key in enumerate((normalize_sku(sku), compact_sku(sku))):
+            row = self.tool._sku_lookup(key)
+            if row is not None:
+                product = self.tool.store.row(row)
+                own_sku = product.get('SKU', '')
+                is_alias = key not in (normalize_sku(own_sku), compact_sku(own_sku))
+                return kind, is_alias, row + self.offset, product
+        return None
+
+    def max_dim_score(self, targets):
+        return self.tool.max_dim_score(targets)
+
+    def suggest(self, prefix, limit):
+        """(rank key, suggestion) of the local top suggestions; keys order them across shards"""
+        suggestions = self.tool.suggestions
+        doc_ids = self.tool.suggest_ids(prefix, limit)
+        return [((not suggestions.boost[i], -float(suggestions.weight[i]), i + self.offset),
+                 {'name': product.get('Name', ''), 'sku': product.get('SKU', '')})
+                for i, product in zip(doc_ids.tolist(), self.tool.store.rows(doc_ids))]
+
+    def search(self, query_tokens, targets, has_dim_params, max_results, max_dim_score=None,
+               ranges=None, all_scores=False):
+        """Local top results (with global ids) and the score_gaps of all matches,
+        or with all_scores their distinct scores"""
+        doc_ids, combined_scores, text_scores, dim_scores = self.tool.score_products(
+            query_tokens, targets, has_dim_params, max_dim_score, ranges)
+        ranked = top_k(doc_ids, combined_scores, max_results)
+        ranked = ranked[combined_scores[ranked] > 0]
+        results = self.tool.build_results(query_tokens, doc_ids[ranked], combined_scores[ranked],
+                                          text_scores[ranked],
+                                          None if dim_scores is None else dim_scores[ranked],
+                                          targets)
+        return {
+            'doc_ids': doc_ids[ranked] + self.offset,
+            'results': results,
+            'scores': np.unique(combined_scores) if all_scores else None,
+            'gaps': None if all_scores else score_gaps(combined_scores),
+            'num_scored': len(combined_scores),
+        }
+
+
+def _serve_shard(conns, df, offset):
+    """Worker process: build the shard, then answer method calls on every pipe until told to stop"""
+    try:
+        shard = SearchShard(df, offset)
+    except Exception as e:
+        for conn in conns:
+            conn.send(('error', repr(e)))
+        return
+    del df
+    for conn in conns:
+        conn.send(('ok', None))
+
+    threads = [threading.Thread(target=_serve_connection, args=(shard, conn), daemon=True)
+               for conn in conns[1:]]
+    for thread in threads:
+        thread.start()
+    _serve_connection(shard, conns[0])
+    for thread in threads:
+        thread.join()
+
+
+def _serve_connection(shard, conn):
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        method, args = message
+        try:
+            conn.send(('ok', getattr(shard, method)(*args)))
+        except Exception as e:
+            conn.send(('error', repr(e)))
+
+
+class ShardedSearchTool(ProductSearchTool):
+    """ProductSearchTool whose index is split across num_shards worker processes.
+
+    search() and get_response() return what ProductSearchTool over the same
+    catalog returns. Products cannot be updated in place; reload instead.
+    """
+
+    def __init__(self, csv_file="data.csv", num_shards=None, df=None, start_method="spawn",
+                 connections_per_shard=DEFAULT_SHARD_CONNECTIONS):
+        if df is None:
+            df = read_catalog(csv_file)
+        # fill on the whole catalog so every shard sees the same column types
+        df = df.fillna('')
+        num_shards = max(1, min(num_shards or os.cpu_count() or 1, len(df)))
+
+        context = multiprocessing.get_context(start_method)
+        bounds = np.linspace(0, len(df), num_shards + 1).astype(int)
+        # channel c is the c-th pipe of every shard; a call holds one channel
+        self._channels = [[] for _ in range(max(1, connections_per_shard))]
+        self._processes = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            pipes = [context.Pipe() for _ in self._channels]
+            process = context.Process(
+                target=_serve_shard,
+                args=([child_conn for _, child_conn in pipes],
+                      df.iloc[start:end].reset_index(drop=True), int(start)),
+                daemon=True)
+            process.start()
+            for channel, (parent_conn, child_conn) in zip(self._channels, pipes):
+                child_conn.close()
+                channel.append(parent_conn)
+            self._processes.append(process)
+        # searches whose cutoff needed every shard's full scores
+        self.full_score_searches = 0
+        self._free_channels = queue.SimpleQueue()
+        for channel in self._channels:
+            self._free_channels.put(channel)
+
+        try:
+            for channel in self._channels:
+                self._receive_all(channel)
+            self._share_statistics()
+        except Exception:
+            self.close()
+            raise
+
+    def _receive_all(self, channel):
+        """Replies of every shard on a channel; all are read before a failure is raised"""
+        replies = []
+        for i, (conn, process) in enumerate(zip(channel, self._processes)):
+            # a worker that died never answers, and its pipe may not report EOF
+            while not conn.poll(1.0):
+                if not process.is_alive():
+                    raise RuntimeError(f"Search shard {i} exited with code {process.exitcode}")
+            replies.append(conn.recv())
+        for status, value in replies:
+            if status != 'ok':
+                raise RuntimeError(f"Search shard failed: {value}")
+        return [value for _, value in replies]
+
+    def _call_all(self, method, *args, per_shard_args=None):
+        """Call a SearchShard method on every shard in parallel, returning the results in shard order"""
+        channel = self._free_channels.get()
+        try:
+            for i, conn in enumerate(channel):
+                conn.send((method, per_shard_args[i] if per_shard_args else args))
+            return self._receive_all(channel)
+        finally:
+            self._free_channels.put(channel)
+
+    def _share_statistics(self):
+        """Merge shard vocabularies into corpus-wide document frequencies and send them back"""
+        stats = self._call_all('statistics')
+        self.corpus_size = sum(s['corpus_size'] for s in stats)
+        avgdl = sum(s['total_length'] for s in stats) / self.corpus_size
+
+        terms, inverse = np.unique(np.concatenate([s['terms'] for s in stats]),
+                                   return_inverse=True)
+        # misspelled query terms are corrected here, against the whole vocabulary
+        self.vocabulary = TermTable(terms)
+        self.fuzzy_terms = TrigramIndex.build(fuzzy_vocabulary(self.vocabulary))
+        doc_freq = np.bincount(inverse, weights=np.concatenate([s['doc_freq'] for s in stats]),
+                               minlength=len(terms))
+        idf = np.log(self.corpus_size - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        present = doc_freq > 0
+        average_idf = math.fsum(idf[present]) / int(present.sum()) if present.any() else 0.0
+
+        bounds = np.cumsum([0] + [len(s['terms']) for s in stats])
+        self._call_all('use_global_statistics', per_shard_args=[
+            (doc_freq[inverse[start:end]], self.corpus_size, avgdl, average_idf)
+            for start, end in zip(bounds[:-1], bounds[1:])])
+
+    @property
+    def num_shards(self):
+        return len(self._processes)
+
+    @property
+    def num_products(self):
+        return self.corpus_size
+
+    @property
+    def has_updates(self):
+        return False
+
+    def with_updates(self, upserts=(), deletes=()):
+        raise UnsupportedCatalogOperation("Sharded catalogs are updated by reloading them")
+
+    def compacted(self):
+        return self
+
+    def save_snapshot(self, snapshot_file):
+        raise UnsupportedCatalogOperation("Sharded catalogs are built from the CSV")
+
+    def _sku_match(self, sku):
+        """(global row, product) a SKU lookup finds, or None"""
+        matches = [match for match in self._call_all('find_sku', sku) if match is not None]
+        if not matches:
+            return None
+        # global rows grow with the shard, so they break ties as the lowest shard would
+        return min(matches, key=lambda match: match[:3])[2:]
+
+    def find_sku_row(self, sku):
+        """Global row of the product with this SKU (or alias), or None"""
+        match = self._sku_match(sku)
+        return match[0] if match is not None else None
+
+    def _sku_product(self, sku):
+        match = self._sku_match(sku)
+        return match[1] if match is not None else None
+
+    def _has_term(self, term):
+        return term in self.vocabulary
+
+    def search(self, query, weight=None, height=None, width=None, length=None, sku=None,
+               max_results=DEFAULT_MAX_RESULTS, ranges=None):
+        """Search products using BM25 ranking and dimensional parameters"""
+        query_tokens = self.tokenize_query(query)
+        ranges = normalize_ranges(ranges)
+        weight, height, width, length = range_targets(ranges, weight, height, width, length)
+
+        has_dim_params = any(param is not None for param in [
+                             weight, width, length, height, sku])
+
+        if has_dim_params and sku is not None:
+            product_dict = self._sku_product(sku)
+            if product_dict is not None:
+                return [self._sku_result(product_dict, query, weight, height, width, length)]
+
+        targets = {'weight': weight, 'width': width,
+                   'length': length, 'height': height}
+        max_dim_score = None
+        if has_dim_params:
+            # the low dimension score penalty is relative to the best product anywhere
+            max_dim_score = max(self._call_all('max_dim_score', targets))
+
+        shards = self._call_all('search', query_tokens, targets, has_dim_params,
+                                max_results, max_dim_score, ranges)
+        doc_ids = np.concatenate([shard['doc_ids'] for shard in shards])
+        scores = np.array([result['score'] for shard in shards for result in shard['results']])
+        results = [result for shard in shards for result in shard['results']]
+
+        ranked = top_k(doc_ids, scores, max_results)
+        num_scored = sum(shard['num_scored'] for shard in shards)
+        largest_drop = merged_largest_drop([shard['gaps'] for shard in shards],
+                                           with_zero=num_scored < self.corpus_size)
+        if largest_drop is None:
+            # rare: a gap some shard left out may be the largest; score again for every score
+            self.full_score_searches += 1
+            shards = self._call_all('search', query_tokens, targets, has_dim_params,
+                                    max_results, max_dim_score, ranges, True)
+            largest_drop = largest_score_drop(
+                np.unique(np.concatenate([shard['scores'] for shard in shards])),
+                self.corpus_size, num_scored=num_scored)
+        ranked = ranked[:drop_cutoff(scores[ranked], largest_drop)]
+        return [results[rank] for rank in ranked]
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        suggestions = [suggestion for shard in self._call_all('suggest', prefix, limit)
+                       for suggestion in shard]
+        return [suggestion for _, suggestion in sorted(suggestions, key=lambda s: s[0])[:limit]]
+
+    def search_many(self, queries, max_results=DEFAULT_MAX_RESULTS):
+        queries = [{'query': query} if isinstance(query, str) else query
+                   for query in queries]
+        return [self.search(**{'max_results': max_results, **query}) for query in queries]
+
+    def close(self):
+        """Stop the worker processes once the running searches are done"""
+        if not self._processes:
+            return
+        # holding every channel means no call is in flight
+        for _ in self._channels:
+            self._free_channels.get()
+        for channel in self._channels:
+            for conn in channel:
+                try:
+                    conn.send(None)
+                    conn.close()
+                except OSError:
+                    pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        # a search still holding this tool fails on the closed pipes instead of waiting forever
+        for channel in self._channels:
+            self._free_channels.put(channel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
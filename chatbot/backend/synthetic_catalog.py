@@ -0,0 +1,94 @@
+"""Synthetic product catalogs shaped like data.csv, for tests and benchmarks.
+
+Names, descriptions and categories are drawn from a fixed electrical-supply
+vocabulary with a skewed (Zipf-like) word distribution, so posting list
+lengths look like a real catalog's. Output is deterministic for a seed.
+
+    python synthetic_catalog.py 100000 synthetic.csv
+"""
+import sys
+import numpy as np
+import pandas as pd
+
+MATERIALS = ["Aluminum", "Copper", "Tinned Copper", "Steel", "PVC", "HDPE", "Nylon", "XLPE"]
+PRODUCT_TYPES = ["Cable", "Wire", "Conduit", "Motor Drop", "Tray Cable", "Building Wire",
+                 "Feeder", "Control Cable", "Service Drop", "Jumper", "Connector", "Splice Kit"]
+STYLES = ["Quadruplex", "Triplex", "Duplex", "Shielded", "Armored", "Direct Burial",
+          "UF/NMC-B", "THHN", "XHHW", "USE-2", "SER", "MC", "Submersible", "Flat"]
+CATEGORIES = ["Electrical > Cable & Accessories", "Electrical > Wire", "Electrical > Conduit",
+              "Irrigation > Pump Cable", "Solar > PV Wire", "Electrical > Connectors"]
+WORDS = ("cable wire conductor conductors volt 600 insulated insulation jacket underground "
+         "secondary distribution phase neutral polyethylene direct burial duct installation "
+         "shielded motor drop irrigation pump submersible copper aluminum stranded solid "
+         "awg gauge rated temperature sunlight resistant wet dry locations ul listed "
+         "residential commercial industrial feeder branch circuit service entrance rodent "
+         "protection conduit hdpe pvc schedule 40 flexible armored grounding bare tinned "
+         "overhead aerial messenger tray control signal instrumentation flame retardant").split()
+SHORT_DESCRIPTION_WORDS = 24
+DESCRIPTION_WORDS = 60
+
+
+def _zipf_choice(rng, values, size):
+    # word i is drawn with probability proportional to 1 / (i + 1)
+    weights = 1.0 / np.arange(1, len(values) + 1)
+    return rng.choice(len(values), size=size, p=weights / weights.sum())
+
+
+def generate_catalog(num_products, seed=0):
+    """DataFrame of num_products synthetic products with the data.csv columns search uses"""
+    rng = np.random.default_rng(seed)
+    n = num_products
+    ids = np.arange(1, n + 1)
+    skus = 100000 + rng.permutation(n * 9)[:n]
+
+    styles = np.array(STYLES)[rng.integers(len(STYLES), size=n)]
+    materials = np.array(MATERIALS)[rng.integers(len(MATERIALS), size=n)]
+    types = np.array(PRODUCT_TYPES)[rng.integers(len(PRODUCT_TYPES), size=n)]
+    gauges = rng.choice([2, 4, 6, 8, 10, 12, 14, 16], size=n)
+    conductors = rng.integers(1, 6, size=n)
+
+    short_words = _zipf_choice(rng, WORDS, (n, SHORT_DESCRIPTION_WORDS)).tolist()
+    long_words = _zipf_choice(rng, WORDS, (n, DESCRIPTION_WORDS)).tolist()
+
+    names = [f"{style} {material} {kind} ({sku})" for style, material, kind, sku
+             in zip(styles.tolist(), materials.tolist(), types.tolist(), skus.tolist())]
+    short_descriptions = [f"{gauge} AWG {count}-conductor {' '.join([WORDS[w] for w in row])}."
+                          for gauge, count, row in zip(gauges.tolist(), conductors.tolist(), short_words)]
+    descriptions = [' '.join([WORDS[w] for w in row]) for row in long_words]
+
+    # about a third of the products have no height, like the real catalog
+    heights = np.round(rng.uniform(0.2, 4.0, size=n), 2)
+    heights[rng.random(n) < 0.3] = np.nan
+    parents = rng.integers(1, max(n // 4, 1) + 1, size=n)
+
+    return pd.DataFrame({
+        "ID": ids,
+        "Type": "simple",
+        "SKU": skus,
+        "GTIN, UPC, EAN, or ISBN": np.where(rng.random(n) < 0.2, 7000000000000 + ids, np.nan),
+        "Name": names,
+        "Published": 1,
+        "Is featured?": 0,
+        "Visibility in catalog": "visible",
+        "Short description": short_descriptions,
+        "Description": descriptions,
+        "Tax status": "taxable",
+        "In stock?": 1,
+        "Stock": rng.integers(0, 5000, size=n),
+        "Weight (lbs)": rng.integers(5, 2000, size=n),
+        "Length (in)": rng.choice([500, 1000, 3000, 6000, 12000], size=n),
+        "Width (in)": np.round(rng.uniform(0.1, 3.0, size=n), 2),
+        "Height (in)": heights,
+        "Regular price": np.round(rng.uniform(5, 5000, size=n), 2),
+        "Categories": np.array(CATEGORIES)[rng.integers(len(CATEGORIES), size=n)],
+        "Supabase_ID": [f"http://localhost:5173/product/{parent}?variant={sku}"
+                        for parent, sku in zip(parents.tolist(), skus.tolist())],
+    })
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python synthetic_catalog.py <number of products> <output csv>")
+        sys.exit(1)
+
+    generate_catalog(int(sys.argv[1])).to_csv(sys.argv[2], index=False)
@@ -0,0 +1,86 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel, GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.prebuilt import create_react_agent
+from chat_history import SUMMARY_PROMPT, ChatState, ConversationWindow, split_turns, tool_reference
+
+
+def lookup_turn(i):
+    products = [{"Name": f"Cable {i}-{j}", "SKU": 1000 * i + j, "Description": "x" * 500}
+                for j in range(8)]
+    return [
+        HumanMessage(f"cable {i}", id=f"h{i}"),
+        AIMessage("", id=f"a{i}", tool_calls=[{"name": "lookup", "args": {"query": f"cable {i}"}, "id": f"c{i}"}]),
+        ToolMessage("x" * 5000, id=f"t{i}", name="lookup", tool_call_id=f"c{i}",
+                    artifact={"status": "8 products found", "products": products}),
+        AIMessage(f"Here are cables {i}", id=f"r{i}"),
+    ]
+
+
+def test_tool_outputs_collapse_to_references():
+    reference = tool_reference(lookup_turn(1)[2])
+    assert reference.startswith("[earlier result] 8 products found: Cable 1-0 (SKU 1000)")
+    assert "and 3 more" in reference
+    assert len(reference) < 250
+
+
+def test_window_summarizes_turns_in_batches():
+    summarizer = FakeListChatModel(responses=["summary one", "summary two"])
+    window = ConversationWindow(summarizer, turns=2, batch_turns=2)
+    messages = [m for i in range(3) for m in lookup_turn(i)]
+
+    # one turn outside the window is not worth a summary yet
+    update = window.update({"messages": messages})
+    assert "summary" not in update
+    assert len(split_turns(update["llm_input_messages"])) == 3
+    # only the current turn keeps its full tool output
+    tool_outputs = [m.content for m in update["llm_input_messages"] if isinstance(m, ToolMessage)]
+    assert [len(c) > 1000 for c in tool_outputs] == [False, False, True]
+
+    messages += lookup_turn(3)
+    update = window.update({"messages": messages})
+    assert update["summary"] == "summary one"
+    assert update["summarized_through"] == "r1"
+    assert update["llm_input_messages"][0] == SystemMessage("Summary of the earlier conversation: summary one")
+    assert [m.id for m in update["llm_input_messages"][1:]] == [m.id for i in (2, 3) for m in lookup_turn(i)]
+
+    state = {"messages": messages + lookup_turn(4), "summary": update["summary"],
+             "summarized_through": update["summarized_through"]}
+    assert "summary" not in window.update(state)
+
+
+class ScriptedModel(GenericFakeChatModel):
+    """Looks something up on every user message, then answers; records its input sizes"""
+    input_sizes: list = []
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if messages[0].content == SUMMARY_PROMPT:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage("shopper wants cables"))])
+        self.input_sizes.append(sum(len(str(m.content)) for m in messages))
+        if isinstance(messages[-1], HumanMessage):
+            call = {"name": "lookup", "args": {"query": messages[-1].content}, "id": f"call{len(self.input_sizes)}"}
+            return ChatResult(generations=[ChatGeneration(message=AIMessage("", tool_calls=[call]))])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage("Found some cables"))])
+
+
+def test_agent_prompt_stays_bounded_over_long_sessions():
+    def lookup(query: str) -> str:
+        """Look up products"""
+        return "x" * 2000
+
+    model = ScriptedModel(messages=iter(()))
+    agent = create_react_agent(model, tools=[lookup], state_schema=ChatState, checkpointer=InMemorySaver(),
+                               pre_model_hook=ConversationWindow(model, turns=2, batch_turns=2).as_hook())
+    config = {"configurable": {"thread_id": "t"}}
+    for i in range(30):
+        agent.invoke({"messages": [HumanMessage(f"cable {i}")]}, config)
+
+    state = agent.get_state(config).values
+    assert len(state["messages"]) == 120
+    assert state["summary"] == "shopper wants cables"
+    # full history would be 30 tool outputs of 2000 characters
+    assert max(model.input_sizes) < 3 * 2000
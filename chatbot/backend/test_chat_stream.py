@@ -0,0 +1,180 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+import react_chat
+from react_chat import ChatService
+from session_registry import SessionRegistry
+
+# a turn with one product lookup, as agent.astream(stream_mode=["messages", "updates"]) yields it
+TURN = [
+    ("updates", {"agent": {"messages": [AIMessage("", tool_calls=[
+        {"name": "product_lookup", "args": {"query": "cable"}, "id": "c1"}])]}}),
+    ("messages", (ToolMessage("2 cables", name="product_lookup", tool_call_id="c1"), {"langgraph_node": "tools"})),
+    ("updates", {"tools": {"messages": [ToolMessage("2 cables", name="product_lookup", tool_call_id="c1",
+                                                    artifact={"status": "2 products found"})]}}),
+    ("messages", (AIMessageChunk("Here are "), {"langgraph_node": "agent"})),
+    ("messages", (AIMessageChunk("two cables"), {"langgraph_node": "agent"})),
+    ("updates", {"agent": {"messages": [AIMessage("Here are two cables")]}}),
+]
+
+EVENTS = [
+    {"event": "tool_start", "name": "product_lookup", "args": {"query": "cable"}},
+    {"event": "tool_end", "name": "product_lookup", "status": "2 products found"},
+    {"event": "token", "content": "Here are "},
+    {"event": "token", "content": "two cables"},
+    {"event": "done", "content": "Here are two cables"},
+]
+
+
+class StubAgent:
+    """Agent replaying astream chunks; records whether the stream was closed"""
+
+    def __init__(self, chunks=TURN):
+        self.chunks = chunks
+        self.turns = 0
+        self.closed = False
+
+    async def astream(self, input, config, stream_mode):
+        self.turns += 1
+        try:
+            for chunk in self.chunks:
+                yield chunk
+        finally:
+            self.closed = True
+
+
+def started_service(agent):
+    service = ChatService.__new__(ChatService)
+    service.async_mode = True
+    service._started = True
+    service.sessions = SessionRegistry()
+    service.agent = service.guest_agent = agent
+    return service
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def test_stream_frames_tokens_and_tool_calls():
+    agent = StubAgent()
+    events = asyncio.run(collect(started_service(agent).stream_response("cable", "s1")))
+    assert events == EVENTS
+    assert agent.closed
+
+
+def test_stream_is_unavailable_without_async_pipeline():
+    service = started_service(StubAgent())
+    service.async_mode = False
+    with pytest.raises(react_chat.StreamingUnavailable):
+        service.stream_response("cable", "s1")
+
+
+def test_start_compiles_agents_once(monkeypatch):
+    class Pool:
+        opened = 0
+
+        async def open(self, wait=False):
+            Pool.opened += 1
+
+        @asynccontextmanager
+        async def connection(self):
+            class Connection:
+                async def execute(self, query):
+                    pass
+            yield Connection()
+
+    class Saver:
+        def __init__(self, pool):
+            pass
+
+        async def setup(self):
+            # lets the other start() calls run into the lock
+            await asyncio.sleep(0.01)
+
+    built = []
+    agent = StubAgent()
+    monkeypatch.setattr(react_chat, "PooledAsyncPostgresSaver", Saver)
+    service = ChatService.__new__(ChatService)
+    service.async_mode = True
+    service._started = False
+    service._start_lock = asyncio.Lock()
+    service.postgres_pool = Pool()
+    service.checkpoint_retention = None
+    service.sessions = SessionRegistry()
+    service.build_agent = lambda prompt, authenticated=False: built.append(prompt) or agent
+
+    async def run():
+        await asyncio.gather(*(service.start() for _ in range(5)))
+        for turn in range(3):
+            assert await collect(service.stream_response("cable", f"s{turn}")) == EVENTS
+
+    asyncio.run(run())
+    assert Pool.opened == 1
+    assert built == [react_chat.GUEST_PROMPT, react_chat.AUTHENTICATED_PROMPT]
+    assert agent.turns == 3
+
+
+@pytest.fixture(scope="module")
+def server():
+    # the server module builds its clients and ChatService on import; none of them connects yet
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("SUPABASE_URL", "http://localhost:54321")
+        mp.setenv("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.x")
+        mp.setenv("OPENAI_API_KEY", "unused")
+        mp.setattr(react_chat, "POSTGRES_CONNINFO", "postgresql://localhost/unused")
+        import server
+    return server
+
+
+def sse_events(body):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        name, data = frame.split("\n")
+        event = json.loads(data.removeprefix("data: "))
+        assert name == f"event: {event['event']}"
+        events.append(event)
+    return events
+
+
+def test_chat_stream_endpoint_sends_events(server, monkeypatch):
+    agent = StubAgent()
+    monkeypatch.setattr(server, "chat_service", started_service(agent))
+    response = TestClient(server.app).post("/chat/stream", json={"message": "cable", "session_id": "s1"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert sse_events(response.text) == EVENTS
+
+
+def test_chat_stream_endpoint_without_async_pipeline(server, monkeypatch):
+    service = started_service(StubAgent())
+    service.async_mode = False
+    monkeypatch.setattr(server, "chat_service", service)
+    response = TestClient(server.app).post("/chat/stream", json={"message": "cable", "session_id": "s1"})
+    assert response.status_code == 501
+
+
+def test_client_disconnect_stops_the_turn(server):
+    class Request:
+        def __init__(self):
+            self.checks = 0
+
+        async def is_disconnected(self):
+            # gone after the first event
+            self.checks += 1
+            return self.checks > 1
+
+    agent = StubAgent()
+
+    async def run():
+        frames = await collect(server.server_sent_events(
+            started_service(agent).stream_response("cable", "s1"), Request()))
+        # closed by the server, not when the event loop shuts down
+        assert agent.closed
+        return frames
+
+    frames = asyncio.run(run())
+    assert len(frames) == 1 and frames[0].startswith("event: tool_start")
@@ -0,0 +1,57 @@
+import os
+import pytest
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.postgres import PostgresSaver
+from psycopg_pool import ConnectionPool
+from benchmark_checkpoints import TABLES, build_graph, config
+from checkpoint_retention import CheckpointRetention
+
+# a scratch database; retention prunes every conversation in it
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+if not TEST_POSTGRES_URL:
+    pytest.skip("TEST_POSTGRES_URL is not set", allow_module_level=True)
+
+
+@pytest.fixture
+def pool():
+    with ConnectionPool(TEST_POSTGRES_URL, kwargs={"autocommit": True, "prepare_threshold": None}) as pool:
+        PostgresSaver(pool).setup()
+        with pool.connection() as conn:
+            for table in TABLES:
+                conn.execute(f"delete from {table}")
+        yield pool
+
+
+def count(pool, table, thread_id):
+    with pool.connection() as conn:
+        return conn.execute(f"select count(*) from {table} where thread_id = %s", (thread_id,)).fetchone()[0]
+
+
+def test_retention_keeps_latest_checkpoints_and_drops_idle_threads(pool):
+    checkpointer = PostgresSaver(pool)
+    graph = build_graph(checkpointer)
+    for thread_id in ("a", "b"):
+        for turn in range(6):
+            graph.invoke({"messages": [HumanMessage(f"cable {turn}")]}, config(thread_id))
+    graph.invoke({"messages": [HumanMessage("cable")]}, config("idle"))
+    with pool.connection() as conn:
+        conn.execute("update checkpoints set checkpoint = jsonb_set(checkpoint, '{ts}', "
+                     "to_jsonb((now() - interval '40 days')::text)) where thread_id = 'idle'")
+    blobs_before = count(pool, "checkpoint_blobs", "a")
+
+    # one thread per batch
+    retention = CheckpointRetention(TEST_POSTGRES_URL, keep=3, ttl=30 * 86400, batch_size=1, batch_pause=0)
+    threads, checkpoints, blobs = retention.run_once()
+    assert threads == 1
+    assert all(count(pool, table, "idle") == 0 for table in TABLES)
+    assert count(pool, "checkpoints", "a") == count(pool, "checkpoints", "b") == 3
+    assert 0 < count(pool, "checkpoint_blobs", "a") < blobs_before
+    assert retention.stats()["checkpoints_deleted"] == checkpoints
+
+    # every kept checkpoint still loads, and the conversation carries on
+    history = list(checkpointer.list(config("a")))
+    assert [len(c.checkpoint["channel_values"]["messages"]) for c in history] == [24, 23, 22]
+    graph.invoke({"messages": [HumanMessage("one more")]}, config("a"))
+    assert len(checkpointer.get_tuple(config("a")).checkpoint["channel_values"]["messages"]) == 28
+    # a turn writes five checkpoints: the input, the step taking it, and one per node run
+    assert retention.run_once()[:2] == (0, 5)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from dense_search import HashingEmbedder, VectorIndex, embed_documents, embed_query
+from product_search_tool import ProductSearchTool
+# the catalog fixtures are shared with the lexical search tests
+from test_product_search_tool import PRODUCTS, catalog_csv, search_tool  # noqa: F401
+
+
+@pytest.fixture(scope="module")
+def hybrid_tool(catalog_csv):
+    return ProductSearchTool(csv_file=catalog_csv, embedder=HashingEmbedder())
+
+
+def test_hashing_embedder_is_deterministic():
+    embedder = HashingEmbedder(dimensions=64)
+    vectors = embed_documents(embedder, ["direct burial cable", "direct burial cable", "solar panel"])
+    assert vectors.shape == (3, 64)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, rtol=1e-6)
+    np.testing.assert_array_equal(vectors[0], vectors[1])
+
+    query = embed_query(embedder, "cable for burying")
+    assert query @ vectors[0] > query @ vectors[2]
+
+
+def test_vector_index_probing_every_list_is_exact():
+    rng = np.random.default_rng(0)
+    vectors = embed_documents(HashingEmbedder(dimensions=32), [
+        " ".join(rng.choice(["cable", "wire", "pump", "solar", "copper", "steel"], 4))
+        for _ in range(500)])
+    index = VectorIndex.build(vectors, num_lists=8)
+    assert index.indptr[-1] == len(vectors)
+
+    query = vectors[7]
+    doc_ids, scores = index.search(query, 10, nprobe=8)
+    exact = np.sort(vectors @ query)[::-1][:10]
+    np.testing.assert_allclose(scores, exact, rtol=1e-6)
+    np.testing.assert_allclose(vectors[doc_ids] @ query, scores, rtol=1e-6)
+
+    # appended vectors are always scanned
+    new_vector = embed_documents(HashingEmbedder(dimensions=32), ["quadruplex aluminum"])
+    updated = index.with_vectors(new_vector)
+    assert updated.search(new_vector[0], 1, nprobe=1)[0].tolist() == [len(vectors)]
+
+
+def test_hybrid_search_finds_products_without_shared_terms(search_tool, hybrid_tool):
+    assert search_tool.search("burying") == []
+    assert hybrid_tool.search("burying")[0]["product"]["SKU"] == 240078
+    # lexical matches keep their BM25 score on top of the similarity
+    assert hybrid_tool.search("shielded motor drop")[0]["product"]["SKU"] == 200010
+    assert hybrid_tool.search_many(["burying"]) == [hybrid_tool.search("burying")]
+
+
+def test_hybrid_updates_snapshot_and_compaction(hybrid_tool, catalog_csv, tmp_path):
+    updated = hybrid_tool.with_updates(
+        upserts=[{"SKU": "300001", "Name": "Solar Tray Cable (300001)",
+                  "Description": "photovoltaic sunlight resistant tray cable"}],
+        deletes=["240078"])
+    assert updated.search("sunlit photovoltaics")[0]["product"]["SKU"] == 300001
+    assert all(r["product"]["SKU"] != 240078 for r in updated.search("burying"))
+
+    compacted = updated.compacted()
+    assert len(compacted.dense) == compacted.num_products
+    def ranking(tool, query):
+        return [(r["product"]["SKU"], r["score"]) for r in tool.search(query)]
+
+    assert ranking(compacted, "burying") == ranking(updated, "burying")
+
+    snapshot_file = str(tmp_path / "search_index.snap")
+    compacted.save_snapshot(snapshot_file)
+    loaded = ProductSearchTool(csv_file=catalog_csv, snapshot_file=snapshot_file,
+                               embedder=HashingEmbedder())
+    assert isinstance(loaded.dense.vectors, np.memmap)
+    assert ranking(loaded, "sunlit photovoltaics") == ranking(compacted, "sunlit photovoltaics")
+
+    # vectors from another embedder are not reused
+    rebuilt = ProductSearchTool(csv_file=catalog_csv, snapshot_file=snapshot_file,
+                                embedder=HashingEmbedder(dimensions=64))
+    assert rebuilt.dense.vectors.shape == (len(PRODUCTS), 64)
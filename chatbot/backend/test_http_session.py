@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from http_session import HttpSession
+
+
+def test_session_is_shared_within_an_event_loop():
+    http = HttpSession()
+
+    async def main():
+        first = await http.get()
+        assert await http.get() is first
+        await http.close()
+        assert first.closed
+
+    asyncio.run(main())
+
+
+def test_session_from_a_closed_loop_is_closed_when_replaced():
+    http = HttpSession()
+    first = asyncio.run(http.get())
+    second = asyncio.run(http.get())
+    assert first.closed and second is not first
+    asyncio.run(http.close())
+    assert second.closed
+
+
+def test_session_from_a_running_loop_is_closed_on_that_loop():
+    http = HttpSession()
+    other = asyncio.new_event_loop()
+    thread = threading.Thread(target=other.run_forever, daemon=True)
+    thread.start()
+    try:
+        first = asyncio.run_coroutine_threadsafe(http.get(), other).result(5)
+
+        async def main():
+            session = await http.get()
+            await http.close()
+            return session
+
+        assert asyncio.run(main()) is not first
+        assert first.closed
+    finally:
+        other.call_soon_threadsafe(other.stop)
+        thread.join(5)
+        other.close()
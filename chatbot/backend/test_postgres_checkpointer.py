@@ -0,0 +1,99 @@
+import asyncio
+import inspect
+import os
+from contextlib import asynccontextmanager
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg_pool import AsyncConnectionPool
+from postgres_checkpointer import PooledAsyncPostgresSaver
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def test_saver_operations_still_go_through_cursor():
+    # PooledAsyncPostgresSaver only takes effect while every operation opens _cursor
+    assert list(inspect.signature(AsyncPostgresSaver._cursor).parameters) == ["self", "pipeline"]
+    for method in ("setup", "alist", "aget_tuple", "aput", "aput_writes", "adelete_thread"):
+        assert "self._cursor(" in inspect.getsource(getattr(AsyncPostgresSaver, method)), method
+
+
+class Unlockable:
+    async def __aenter__(self):
+        raise AssertionError("the saver-wide lock was taken")
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+def test_pooled_saver_cursors_are_held_at_once():
+    # a fake pool, so no database is needed
+    open_cursors, most_open = 0, 0
+
+    class Connection:
+        @asynccontextmanager
+        async def cursor(self, binary, row_factory):
+            nonlocal open_cursors, most_open
+            open_cursors += 1
+            most_open = max(most_open, open_cursors)
+            try:
+                yield self
+            finally:
+                open_cursors -= 1
+
+    async def run():
+        pool = AsyncConnectionPool("postgresql://unused", open=False)
+
+        @asynccontextmanager
+        async def connection():
+            yield Connection()
+
+        pool.connection = connection
+        saver = PooledAsyncPostgresSaver(pool)
+        saver.lock = Unlockable()
+
+        async def query():
+            async with saver._cursor():
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(query() for _ in range(5)))
+
+    asyncio.run(run())
+    assert most_open == 5
+
+
+def test_pooled_saver_needs_a_pool():
+    with pytest.raises(TypeError):
+        PooledAsyncPostgresSaver(object())
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+def test_pooled_saver_writes_concurrently_without_the_lock():
+    async def run():
+        pool = AsyncConnectionPool(TEST_POSTGRES_URL, max_size=8, open=False,
+                                   kwargs={"autocommit": True, "prepare_threshold": None})
+        await pool.open()
+        try:
+            saver = PooledAsyncPostgresSaver(pool)
+            saver.lock = Unlockable()
+            await saver.setup()
+
+            async def save(i):
+                config = {"configurable": {"thread_id": f"pooled-{i}", "checkpoint_ns": ""}}
+                checkpoint = empty_checkpoint()
+                checkpoint["channel_values"] = {"messages": [f"hello {i}"]}
+                checkpoint["channel_versions"] = {"messages": "1"}
+                saved = await saver.aput(config, checkpoint, {}, {"messages": "1"})
+                await saver.aput_writes(saved, [("messages", f"pending {i}")], task_id="task")
+                return await saver.aget_tuple(config)
+
+            loaded = await asyncio.gather(*(save(i) for i in range(20)))
+            assert [t.checkpoint["channel_values"]["messages"] for t in loaded] == \
+                [[f"hello {i}"] for i in range(20)]
+            assert all(t.pending_writes for t in loaded)
+            for i in range(20):
+                await saver.adelete_thread(f"pooled-{i}")
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
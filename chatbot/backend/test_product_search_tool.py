@@ -0,0 +1,459 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from rank_bm25 import BM25Okapi
+from product_search_tool import ProductSearchTool, Tokenizer, custom_tokenizer
+from search_index import InvertedIndex, TrigramIndex, edit_distance, top_k
+
+PRODUCTS = [
+    {"ID": 1, "SKU": "230025", "Name": "Quadruplex Aluminum Cable (230025)",
+     "Description": "600 volt secondary UD cable with three phase conductors",
+     "Weight (lbs)": 263, "Length (in)": 12000, "Width (in)": 1.2, "Height (in)": "",
+     "Regular price": 1200, "Categories": "Cable > Aluminum", "Supabase_ID": "1"},
+    {"ID": 2, "SKU": "200010", "Name": "Shielded Motor Drop (200010)",
+     "Description": "14 AWG 4-conductor shielded motor drop cable for irrigation",
+     "Weight (lbs)": 608, "Length (in)": 12000, "Width (in)": 1.5, "Height (in)": "",
+     "Regular price": 900, "Categories": "Cable > Irrigation", "Supabase_ID": "2"},
+    {"ID": 3, "SKU": "170110", "Name": "UF/NMC-B (170110)",
+     "Description": "Underground feeder copper building wire",
+     "Weight (lbs)": 45, "Length (in)": 3000, "Width (in)": 0.5, "Height (in)": "",
+     "Regular price": 150, "Categories": "Wire > Copper", "Supabase_ID": "3"},
+    {"ID": 4, "SKU": "240078", "Name": "Cable in Conduit (240078)",
+     "Description": "Pre-installed cable in HDPE conduit for direct burial",
+     "Weight (lbs)": 600, "Length (in)": 6000, "Width (in)": 1.5, "Height (in)": "",
+     "Regular price": 2000, "Categories": "Conduit", "Supabase_ID": "4"},
+]
+
+
+@pytest.fixture(scope="module")
+def catalog_csv(tmp_path_factory):
+    path = tmp_path_factory.mktemp("catalog") / "catalog.csv"
+    pd.DataFrame(PRODUCTS).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def search_tool(catalog_csv):
+    return ProductSearchTool(csv_file=catalog_csv)
+
+
+def test_index_scores_match_bm25okapi(search_tool):
+    reference = BM25Okapi(search_tool.tokenized)
+    for query in ["cable", "shielded motor drop", "copper wire", "4-conductor cable", "missing"]:
+        tokens = custom_tokenizer(query)
+        doc_ids, scores = search_tool.index.score(tokens)
+        dense = np.zeros(len(search_tool.tokenized))
+        dense[doc_ids] = scores
+        np.testing.assert_allclose(dense, reference.get_scores(tokens))
+
+
+def test_index_only_returns_matching_documents():
+    index = InvertedIndex([["a", "b"], ["b", "c"], ["d"]])
+    doc_ids, scores = index.score(["c", "missing"])
+    assert doc_ids.tolist() == [1]
+    assert len(scores) == 1
+
+    doc_ids, scores = index.score(["missing"])
+    assert len(doc_ids) == 0
+
+
+def test_score_many_matches_score():
+    index = InvertedIndex([["a", "b"], ["b", "c"], ["d", "a", "a"]])
+    queries = [["a"], ["b", "c", "missing"], [], ["a", "a", "d"], ["missing"]]
+    for updated in (index, index.with_updates([["c", "e"]], removed=[0])):
+        for (doc_ids, scores), tokens in zip(updated.score_many(queries), queries):
+            expected_ids, expected_scores = updated.score(tokens)
+            assert doc_ids.tolist() == expected_ids.tolist()
+            np.testing.assert_allclose(scores, expected_scores)
+
+
+def test_top_k_orders_by_score_then_doc():
+    doc_ids = np.array([3, 5, 7, 9])
+    scores = np.array([1.0, 4.0, 4.0, 2.0])
+    assert doc_ids[top_k(doc_ids, scores, 3)].tolist() == [5, 7, 9]
+    assert doc_ids[top_k(doc_ids, scores, 10)].tolist() == [5, 7, 9, 3]
+
+
+def test_search_text_query(search_tool):
+    results = search_tool.search("shielded motor drop")
+    assert results[0]["product"]["SKU"] == 200010
+    assert all(result["score"] > 0 for result in results)
+
+
+def test_search_many_matches_search(search_tool):
+    queries = ["shielded motor drop", "copper wire", "missing",
+               {"query": "cable", "weight": 608}, {"query": "cable", "max_results": 2}]
+    results = search_tool.search_many(queries)
+    assert len(results) == len(queries)
+    for query, result in zip(queries, results):
+        expected = search_tool.search(**query) if isinstance(query, dict) else search_tool.search(query)
+        assert [r["product"]["SKU"] for r in result] == [r["product"]["SKU"] for r in expected]
+        assert [r["score"] for r in result] == pytest.approx([r["score"] for r in expected])
+
+
+def test_search_dimension_query(search_tool):
+    results = search_tool.search("cable", weight=608)
+    assert results[0]["product"]["Name"] == "Shielded Motor Drop (200010)"
+    assert results[0]["dim_score"] > 0
+    assert results[0]["weight_diff"] == 0
+
+
+def test_dimension_range_probe_matches_full_scan(monkeypatch):
+    from synthetic_catalog import generate_catalog
+    tool = ProductSearchTool.from_frame(generate_catalog(2000, seed=3))
+    tool = tool.with_updates(upserts=[{"SKU": "42", "Name": "Copper Feeder (42)", "Weight (lbs)": 61}],
+                             deletes=[str(tool.store.row(0)["SKU"])])
+    queries = [{"query": "copper cable", "weight": 60.0},
+               {"query": "", "weight": 25.0, "length": 500.0},
+               {"query": "armored", "length": 3000.0, "height": 2.0}]
+    targets = {"weight": 60.0, "width": None, "length": None, "height": None}
+    assert tool._dimension_candidates(targets) is not None
+    doc_ids = tool.score_products(custom_tokenizer("copper"), targets, True)[0]
+    assert tool.find_sku_row("42") in doc_ids
+    assert 0 not in doc_ids
+
+    pruned = [tool.search(**query) for query in queries]
+    monkeypatch.setattr(ProductSearchTool, "_dimension_candidates", lambda self, targets: None)
+    assert pruned == [tool.search(**query) for query in queries]
+
+
+def test_search_range_filter(search_tool):
+    results = search_tool.search("cable", ranges={"weight": (500, 700)})
+    assert {r["product"]["SKU"] for r in results} == {200010, 240078}
+    # the middle of the range is the weight target
+    assert results[0]["product"]["SKU"] == 240078
+    assert results[0]["weight_diff"] == 0
+
+    # open ranges only filter
+    results = search_tool.search("cable", ranges={"weight": (None, 300)})
+    assert [r["product"]["SKU"] for r in results] == [230025]
+    assert "dim_score" not in results[0]
+    assert search_tool.search("cable", ranges={"width": (2, 3)}) == []
+
+
+def test_misspelled_terms_expand_to_vocabulary(search_tool):
+    assert "motor" in search_tool.tokenize_query("shielded moter drop")
+    assert search_tool.search("shielded moter drop")[0]["product"]["SKU"] == 200010
+    assert search_tool.search("quadruplx")[0]["product"]["SKU"] == 230025
+    # short words and numbers are never corrected
+    assert search_tool.tokenize_query("cabl 601") == custom_tokenizer("cabl 601")
+
+
+def test_trigram_index_nearest_terms():
+    index = TrigramIndex.build(["motor", "meter", "motors", "quadruplex", "triplex"])
+    assert index.nearest("moter", 1) == ["meter", "motor"]
+    assert index.nearest("quadrpulex", 2) == ["quadruplex"]
+    assert index.nearest("duplex", 1) == []
+    assert edit_distance("conductr", "conductor") == 1
+    assert edit_distance("ab", "ba") == 1
+    assert edit_distance("kitten", "sitting", limit=1) == 2
+
+
+def test_get_matched_terms_uses_vocabulary_and_bigrams(search_tool):
+    matched = search_tool.get_matched_terms("Shielded motor drop widget")
+    assert "shield" in matched
+    assert "widget" not in matched
+    assert "shield motor" in matched
+    assert "motor drop" in matched
+    assert "drop widget" not in matched
+
+
+def test_sku_index_lookups(search_tool):
+    assert search_tool.find_sku_row("200010") == 1
+    assert search_tool.find_sku_row(" 200010 ") == 1
+    assert search_tool.find_sku_row("20-0010") == 1
+    assert search_tool.find_sku_row("999999") is None
+
+    response = search_tool.get_response("", sku="170110")
+    assert response["status"] == "SKU match found"
+    assert response["products"][0]["Name"] == "UF/NMC-B (170110)"
+
+
+def test_sku_lookups_on_shipped_catalog():
+    # data.csv rows end in a trailing comma the header doesn't have
+    search_tool = ProductSearchTool(csv_file=os.path.join(os.path.dirname(__file__), "data.csv"))
+    response = search_tool.get_response("", sku="230025")
+    assert response["status"] == "SKU match found"
+    assert response["products"][0]["Name"] == "Quadruplex Aluminum Cable (230025)"
+    assert search_tool.find_sku_row("55-80-94-05") == search_tool.find_sku_row("55809405") is not None
+
+
+def test_suggest_matches_name_words_and_skus_by_popularity():
+    df = pd.DataFrame(PRODUCTS).assign(**{"Total sales": [5, 40, 12, 40],
+                                          "Is featured?": [0, 0, 1, 0]})
+    tool = ProductSearchTool.from_frame(df)
+
+    def names(prefix, **kwargs):
+        return [s["name"] for s in tool.suggest(prefix, **kwargs)]
+
+    # featured first, then by sales, then catalog order
+    assert names("c") == ["Cable in Conduit (240078)", "Quadruplex Aluminum Cable (230025)"]
+    assert names("  Motor D") == ["Shielded Motor Drop (200010)"]
+    assert names("20-00") == ["Shielded Motor Drop (200010)"]
+    assert names("2", limit=2) == ["Shielded Motor Drop (200010)", "Cable in Conduit (240078)"]
+    assert names("quadruplex aluminum cable (230025) extra") == []
+    assert tool.suggest("") == []
+
+    updated = tool.with_updates(
+        upserts=[{"SKU": "300001", "Name": "Conduit Body (300001)", "Total sales": 99}],
+        deletes=["240078"])
+    assert names("con") == ["Cable in Conduit (240078)"]
+    assert [s["name"] for s in updated.suggest("con")] == ["Conduit Body (300001)"]
+    assert updated.compacted().suggest("c") == updated.suggest("c")
+
+
+def test_tokenizer_keeps_hyphenated_words_and_caches_queries():
+    tokenizer = Tokenizer()
+    tokens = tokenizer.tokenize("Shielded 4-Conductor cables")
+    assert set(tokens) == {"shielded", "shield", "4-conductor", "cables", "cabl"}
+
+    first = tokenizer.tokenize_query("motor drop")
+    first.append("mutated")
+    assert "mutated" not in tokenizer.tokenize_query("motor drop")
+    assert tokenizer._tokenize_query.cache_info().hits == 1
+
+
+def test_snapshot_round_trip(search_tool, tmp_path):
+    snapshot_file = str(tmp_path / "search_index.snap")
+    search_tool.save_snapshot(snapshot_file)
+    loaded = ProductSearchTool(csv_file="missing.csv", snapshot_file=snapshot_file)
+
+    assert isinstance(loaded.index.postings, np.memmap)
+    for query in ["cable", "shielded motor drop", "4-conductor"]:
+        expected = search_tool.search(query)
+        actual = loaded.search(query)
+        assert [r["product"] for r in actual] == [r["product"] for r in expected]
+        assert [r["score"] for r in actual] == [r["score"] for r in expected]
+    assert loaded.get_response("", sku="20-0010")["products"][0]["SKU"] == 200010
+    assert loaded.get_matched_terms("motor drop") == search_tool.get_matched_terms("motor drop")
+    ranges = {"weight": (500, 700)}
+    assert loaded.search("cable", ranges=ranges) == search_tool.search("cable", ranges=ranges)
+    assert loaded.suggest("ca") == search_tool.suggest("ca")
+
+
+def test_snapshot_with_other_tokenizer_version_is_rebuilt(search_tool, catalog_csv, tmp_path, monkeypatch):
+    snapshot_file = str(tmp_path / "search_index.snap")
+    search_tool.save_snapshot(snapshot_file)
+    monkeypatch.setattr("product_search_tool.TOKENIZER_VERSION", -1)
+
+    rebuilt = ProductSearchTool(csv_file=catalog_csv, snapshot_file=snapshot_file)
+    assert not isinstance(rebuilt.index.postings, np.memmap)
+
+
+def test_updates_upsert_and_delete_products(search_tool):
+    updated = search_tool.with_updates(
+        upserts=[{"SKU": "200010", "Regular price": 950},
+                 {"SKU": "300001", "Name": "Solar Tray Cable (300001)",
+                  "Description": "photovoltaic tray cable", "Weight (lbs)": 120}],
+        deletes=["170110"])
+
+    assert updated.search("photovoltaic")[0]["product"]["SKU"] == 300001
+    assert updated.find_sku_row("300001") is not None
+    assert updated.find_sku_row("170110") is None
+    assert updated.search("underground feeder") == []
+
+    motor_drop = updated.search("shielded motor drop")[0]["product"]
+    assert motor_drop["Regular price"] == 950
+    assert motor_drop["Name"] == "Shielded Motor Drop (200010)"
+    assert updated.search("cable", weight=120)[0]["product"]["SKU"] == 300001
+    assert "photovolta tray" in updated.get_matched_terms("photovoltaic tray")
+
+    # the original catalog is untouched
+    assert search_tool.find_sku_row("170110") == 2
+    assert search_tool.search("photovoltaic") == []
+
+
+def test_compacted_updates_match_fresh_build(search_tool, tmp_path):
+    new_product = {"ID": 5, "SKU": "300001", "Name": "Solar Tray Cable (300001)",
+                   "Description": "photovoltaic tray cable", "Weight (lbs)": 120,
+                   "Length (in)": 1000, "Width (in)": 0.4, "Height (in)": "",
+                   "Regular price": 300, "Categories": "Cable > Solar", "Supabase_ID": "5"}
+    updated = search_tool.with_updates(upserts=[new_product], deletes=["230025"]).compacted()
+    assert not updated.has_updates
+
+    csv_file = tmp_path / "catalog.csv"
+    pd.DataFrame(PRODUCTS[1:] + [new_product]).to_csv(csv_file, index=False)
+    fresh = ProductSearchTool(csv_file=str(csv_file))
+
+    for query in ["cable", "photovoltaic tray", "shielded motor drop"]:
+        expected = fresh.search(query)
+        actual = updated.search(query)
+        assert [r["product"]["SKU"] for r in actual] == [r["product"]["SKU"] for r in expected]
+        np.testing.assert_allclose([r["score"] for r in actual], [r["score"] for r in expected])
+    assert updated.find_sku_row("300001") == fresh.find_sku_row("300001")
+
+
+def test_partial_update_indexes_like_fresh_build(tmp_path):
+    # columns that are indexed but not served, and an empty numeric field
+    products = [dict(product, **{"Type": "simple", "Visibility in catalog": "visible",
+                                 "GTIN, UPC, EAN, or ISBN": f"400638133393{i}", "Is featured?": int(i == 2),
+                                 "Stock": 100 * (i + 1), "Supabase_ID": f"/product/{i}?variant=V{i}"})
+                for i, product in enumerate(PRODUCTS)]
+    csv_file = tmp_path / "catalog.csv"
+    pd.DataFrame(products).to_csv(csv_file, index=False)
+    updated = ProductSearchTool(csv_file=str(csv_file)).with_updates(
+        upserts=[{"SKU": "230025", "Regular price": 1250}])
+
+    # the updated product is appended, so it goes last in the edited catalog
+    edited = products[1:] + [dict(products[0], **{"Regular price": 1250})]
+    pd.DataFrame(edited).to_csv(csv_file, index=False)
+    fresh = ProductSearchTool(csv_file=str(csv_file))
+
+    for tool in (updated, updated.compacted()):
+        row = tool.find_sku_row("230025")
+        assert tool.index.document_terms(row) == fresh.index.document_terms(fresh.find_sku_row("230025"))
+        assert "nan" not in tool.store.row(row)["search_text"].split()
+        for query in ["cable", "simple visible cable", "aluminum 1250"]:
+            expected = fresh.search(query)
+            actual = tool.search(query)
+            assert [r["product"]["SKU"] for r in actual] == [r["product"]["SKU"] for r in expected]
+            np.testing.assert_allclose([r["score"] for r in actual], [r["score"] for r in expected])
+        assert tool.find_sku_row("4006381333930") == tool.find_sku_row("v0") == row
+        assert tool.suggest("c") == fresh.suggest("c")
+
+
+def test_catalog_manager_swaps_catalogs(catalog_csv, tmp_path):
+    from catalog_manager import CatalogManager
+
+    manager = CatalogManager(csv_file=catalog_csv)
+    before = manager.search_tool
+    manager.apply_updates(deletes=["240078"])
+    assert manager.version == 1
+    assert manager.search_tool.find_sku_row("240078") is None
+    assert before.find_sku_row("240078") == 3
+
+    snapshot_file = str(tmp_path / "search_index.snap")
+    manager.search_tool.save_snapshot(snapshot_file)
+    assert manager.reload(snapshot_file=snapshot_file)
+    assert manager.wait(timeout=30)
+    assert manager.version == 2
+    assert manager.search_tool.find_sku_row("240078") is None
+    assert manager.stats()["products"] == 3
+
+
+def test_catalog_manager_compaction_keeps_concurrent_updates(catalog_csv):
+    from catalog_manager import CatalogManager
+
+    manager = CatalogManager(csv_file=catalog_csv)
+    manager.apply_updates(deletes=["240078"])
+    assert manager.compact()
+    # lands while compacting: replayed onto the compacted catalog
+    manager.apply_updates(deletes=["170110"])
+    assert manager.wait(timeout=30)
+    assert manager.search_tool.find_sku_row("240078") is None
+    assert manager.search_tool.find_sku_row("170110") is None
+    assert manager.stats()["products"] == 2
+
+
+def test_catalog_manager_caches_responses_per_version(catalog_csv):
+    from catalog_manager import CatalogManager
+
+    manager = CatalogManager(csv_file=catalog_csv)
+    first = manager.get_response("Shielded motor drop")
+    assert manager.get_response("  shielded MOTOR drop!") == first
+    assert manager.get_response("", sku="200010") == manager.get_response("", sku=" 200010")
+    assert manager.get_response("cable", weight=608) == manager.get_response("cable", weight=608.0)
+    assert manager.cache.stats()["hits"] == 3
+    assert manager.cache.stats()["misses"] == 3
+    # a cached response pages and renders like a fresh one
+    from tool_payloads import fit_token_budget, render_for_llm
+    fresh = manager.search_tool.get_response("Shielded motor drop")
+    assert render_for_llm(fit_token_budget(first, 2000)) == render_for_llm(fit_token_budget(fresh, 2000))
+
+    manager.apply_updates(upserts=[{"SKU": "200010", "Regular price": 950}])
+    assert manager.get_response("shielded motor drop")["products"][0]["Regular price"] == 950
+    assert manager.cache.stats()["misses"] == 4
+
+
+def test_result_cache_expires_and_evicts():
+    from result_cache import ResultCache
+
+    now = [0.0]
+    cache = ResultCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1, {"products": [{"SKU": 1}]})
+    # hits share one read-only value instead of copying it
+    assert cache.get("a", 1) is cache.get("a", 1)
+    with pytest.raises(TypeError):
+        cache.get("a", 1)["products"][0]["SKU"] = 2
+    with pytest.raises(AttributeError):
+        cache.get("a", 1)["products"].append("mutated")
+    assert cache.get("a", 1) == {"products": ({"SKU": 1},)}
+    assert cache.get("a", 2) is None
+
+    cache.put("a", 1, "x")
+    cache.put("b", 1, "y")
+    cache.put("c", 1, "z")
+    assert cache.get("a", 1) is None
+    assert cache.stats()["evictions"] == 1
+
+    now[0] = 11.0
+    assert cache.get("b", 1) is None
+    assert cache.stats()["hits"] == 5
+
+
+def test_product_store_interns_repeated_text_and_narrows_ints():
+    from product_store import CategoricalColumn, ProductStore, StringColumn
+
+    df = pd.DataFrame({"SKU": [230025, 200010, 170110, 240078],
+                       "Name": ["a", "b", "c", "d"],
+                       "Categories": ["Cable", "Cable", "Wire", "Cable"]})
+    store = ProductStore.from_frame(df, ["SKU", "Name", "Categories", "Missing"])
+    assert list(store.columns) == ["SKU", "Name", "Categories"]
+    assert store.columns["SKU"].dtype == np.uint32
+    assert isinstance(store.columns["Name"], StringColumn)
+    assert isinstance(store.columns["Categories"], CategoricalColumn)
+    assert store.row(2) == {"SKU": 170110, "Name": "c", "Categories": "Wire"}
+    assert store.rows([3, 0]) == [store.row(3), store.row(0)]
+
+    arrays, layout = store.to_arrays()
+    assert ProductStore.from_arrays(arrays, layout).rows(range(4)) == store.rows(range(4))
+
+
+def test_get_response_payload_renders_compactly_for_the_model(search_tool):
+    import json
+    from tool_payloads import dumps, render_for_llm
+
+    response = search_tool.get_response("cable", weight=608)
+    assert isinstance(response, dict)
+    assert json.loads(dumps(response))["status"] == response["status"]
+
+    rendered = json.loads(render_for_llm(response))
+    product = rendered["products"][0]
+    assert "search_text" not in product
+    assert product["target_weight"] == 608
+    assert product["score"] == round(response["products"][0]["score"], 3)
+    assert render_for_llm("plain text") == "plain text"
+    assert dumps({"score": np.float64(1.5), "ids": np.arange(2)}) == '{"score":1.5,"ids":[0,1]}'
+
+
+def test_fit_token_budget_pages_trimmed_products(search_tool):
+    from tool_payloads import count_tokens, dedupe_categories, fit_token_budget, render_for_llm
+
+    response = search_tool.get_response("cable")
+    products = response["products"]
+    assert len(products) > 2
+    budget = count_tokens(render_for_llm(products[0])) + 60
+
+    pages, cursor = [], 0
+    while cursor is not None:
+        page = fit_token_budget(response, budget, cursor)
+        assert count_tokens(render_for_llm(page)) <= budget
+        pages.append(page)
+        cursor = page.get("next_cursor")
+    assert len(pages) > 1
+    assert pages[0]["remaining"] == len(products) - len(pages[0]["products"])
+    assert pages[0]["status"].startswith(f"{len(products)} products found, showing 1-")
+    assert [p["SKU"] for page in pages for p in page["products"]] == [p["SKU"] for p in products]
+    # a negative cursor from the model starts at the beginning
+    assert fit_token_budget(response, budget, -2) == pages[0]
+
+    # everything fits a large budget, and the response is only trimmed
+    page = fit_token_budget(response, 100_000)
+    assert "next_cursor" not in page and page["status"] == response["status"]
+    long_product = dict(products[0], Description="<p>" + "copper " * 200 + "</p>")
+    trimmed = fit_token_budget({"status": "ok", "products": [long_product]}, 10)["products"][0]
+    assert trimmed["Description"].startswith("copper copper") and trimmed["Description"].endswith("…")
+    assert len(trimmed["Description"]) <= 301
+    assert dedupe_categories("Electrical, Electrical > Wire,Electrical>Wire") == "Electrical > Wire"
+    assert fit_token_budget({"status": "error", "message": "x"}, 10) == {"status": "error", "message": "x"}
@@ -0,0 +1,36 @@
+from session_registry import SessionRegistry
+
+
+def test_sessions_expire_when_idle_and_evict_least_recent():
+    now = [0.0]
+    sessions = SessionRegistry(maxsize=2, ttl=10, clock=lambda: now[0])
+    sessions.touch("a")
+    sessions.touch("b")
+    now[0] = 5.0
+    assert sessions.touch("a").turns == 2
+    sessions.touch("c")
+    # b was the least recently used
+    assert "b" not in sessions
+    assert sessions.stats()["evicted"] == 1
+
+    now[0] = 14.0
+    assert "a" in sessions
+    assert sessions.remove("c")
+    assert not sessions.remove("c")
+
+    now[0] = 16.0
+    stats = sessions.stats()
+    assert stats["live"] == 0
+    assert stats["expired"] == 1
+    assert (stats["started"], stats["ended"]) == (3, 1)
+    # a returning session starts over
+    assert sessions.touch("a").turns == 1
+
+
+def test_registry_memory_stays_bounded():
+    sessions = SessionRegistry(maxsize=100, ttl=3600)
+    for i in range(10_000):
+        sessions.touch(f"session-{i}")
+    assert len(sessions) == 100
+    assert sessions.stats()["evicted"] == 9_900
+    assert sessions.nbytes() < 100_000
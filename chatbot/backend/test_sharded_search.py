@@ -0,0 +1,91 @@
+import contextlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from product_search_tool import ProductSearchTool
+from search_index import largest_score_drop
+from sharded_search import ShardedSearchTool, merged_largest_drop, score_gaps
+from synthetic_catalog import generate_catalog
+
+QUERIES = [
+    ("shielded copper cable", {}),
+    ("pump", {}),
+    ("missing", {}),
+    ("flame retardant tray", {"max_results": 5}),
+    ("cable", {"weight": 600}),
+    ("wire", {"weight": 100, "width": 1.0}),
+    ("submersable pump cabel", {}),
+    ("cable", {"ranges": {"weight": (500, 700)}}),
+]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return generate_catalog(1500, seed=1)
+
+
+@pytest.fixture(scope="module")
+def single(catalog):
+    return ProductSearchTool.from_frame(catalog)
+
+
+@pytest.fixture(scope="module")
+def sharded(catalog):
+    with ShardedSearchTool(df=catalog, num_shards=3) as tool:
+        yield tool
+
+
+def test_sharded_search_matches_single_index(single, sharded):
+    assert sharded.num_shards == 3
+    assert sharded.num_products == single.num_products
+    for query, params in QUERIES:
+        # the dimension path prints its parameters
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = single.search(query, **params)
+            actual = sharded.search(query, **params)
+        assert repr(actual) == repr(expected)
+
+
+def test_merged_largest_drop_from_score_gaps():
+    rng = np.random.default_rng(0)
+    decided = 0
+    for _ in range(500):
+        scores = np.round(rng.exponential(2.0, rng.integers(1, 200)), 2) + 0.01
+        shards = np.array_split(rng.permutation(scores), rng.integers(1, 5))
+        with_zero = bool(rng.integers(2))
+        expected = largest_score_drop(np.unique(scores), len(scores) + with_zero, num_scored=len(scores))
+        drop = merged_largest_drop([score_gaps(shard, count=4) for shard in shards], with_zero)
+        # None when a gap a shard left out could be the largest
+        if drop is not None:
+            decided += 1
+            assert drop == expected
+    assert decided > 400
+    # the largest drop, 1 to 2, is a gap the first shard leaves out
+    dense = score_gaps(np.arange(2.5, 10, 0.5))
+    assert merged_largest_drop([score_gaps(np.array([1.0, 2.0, 10.0]), count=1), dense],
+                               with_zero=False) is None
+    assert merged_largest_drop([score_gaps(np.array([1.0, 2.0, 10.0]), count=2), dense],
+                               with_zero=False) == 1.0
+
+
+def test_concurrent_sharded_searches(single, sharded):
+    queries = [query for query, params in QUERIES if not params] * 8
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(sharded.search, queries))
+    assert [repr(r) for r in results] == [repr(single.search(query)) for query in queries]
+
+
+def test_sharded_suggest_matches_single_index(single, sharded):
+    for prefix in ["c", "shielded co", "12", "zzz"]:
+        assert sharded.suggest(prefix, limit=7) == single.suggest(prefix, limit=7)
+
+
+def test_sharded_sku_lookup(catalog, single, sharded):
+    sku = str(catalog["SKU"][1200])
+    response = sharded.get_response("", sku=sku)
+    assert response == single.get_response("", sku=sku)
+    assert response["products"][0]["SKU"] == int(sku)
+    assert sharded.find_sku_row(sku) == single.find_sku_row(sku) == 1200
+    assert sharded.find_sku_row("999") is None
+    assert sharded.get_response("", sku="999") == single.get_response("", sku="999")
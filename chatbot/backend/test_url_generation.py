@@ -116,7 +116,7 @@ async def test_url_generation():
             print(f"Expected URL: {test['expected']}")
             try:
                 result = await chat_service._get_product_url_by_name(test['input'], auth_token)
-                actual_response = result["messages"][0].content
+                actual_response = result.get("url") or result["message"]
                 print(f"Actual Response: {actual_response}")
                 if actual_response.startswith("http://"):
                     actual_variant = actual_response.split("variant=")[-1] if "variant=" in actual_response else None
@@ -0,0 +1,162 @@
+"""Serialization of tool payloads.
+
+Tools return plain JSON-serializable dicts. dumps() is the one serializer
+for them (orjson, NumPy aware); render_for_llm() is the compact text the
+model sees, which leaves out empty fields and fields that only repeat
+others, and rounds scores. fit_token_budget() cuts a product search
+payload down to a page whose rendering fits a token budget, counted with
+the model's own tokenizer.
+"""
+import math
+import re
+from functools import lru_cache
+import numpy as np
+import orjson
+import tiktoken
+
+# search_text is every indexed column joined together, so it only repeats the other fields
+LLM_OMITTED_FIELDS = frozenset({"search_text"})
+LLM_FLOAT_DIGITS = 3
+
+# the chat model; token budgets are counted with its tokenizer
+DEFAULT_MODEL = "gpt-4o-mini"
+FALLBACK_ENCODING = "o200k_base"
+# rough size of a token when the tokenizer can't be loaded
+CHARS_PER_TOKEN = 4
+DESCRIPTION_FIELDS = ("Short description", "Description")
+LLM_DESCRIPTION_CHARS = 300
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """Compact JSON text of a payload"""
+    return orjson.dumps(payload, default=_default,
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+
+
+def _is_empty(value):
+    if value is None or value == '':
+        return True
+    return isinstance(value, float) and math.isnan(value)
+
+
+def _compact(value):
+    if isinstance(value, dict):
+        return {key: _compact(item) for key, item in value.items()
+                if key not in LLM_OMITTED_FIELDS and not _is_empty(item)}
+    if isinstance(value, (list, tuple)):
+        return [_compact(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return round(value, LLM_FLOAT_DIGITS)
+    return value
+
+
+def render_for_llm(payload):
+    """Text sent to the model for a tool payload"""
+    if isinstance(payload, str):
+        return payload
+    return dumps(_compact(payload))
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        # the encoding files are downloaded on first use
+        print(f"Estimating token counts, tokenizer for {model} unavailable: {e}")
+        return None
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    """Number of tokens text takes for the model"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_text(text, max_chars):
+    """text without HTML tags and runs of whitespace, cut at a word boundary to max_chars"""
+    text = WHITESPACE_PATTERN.sub(' ', HTML_TAG_PATTERN.sub(' ', text)).strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip(' ,.;:') + '…'
+
+
+def dedupe_categories(categories):
+    """Category list without repeats and without parents of other listed
+    categories: "Electrical, Electrical > Wire" becomes "Electrical > Wire"."""
+    paths = []
+    for category in categories.split(','):
+        path = ' > '.join(part.strip() for part in category.split('>'))
+        if path and path not in paths:
+            paths.append(path)
+    return ', '.join(path for path in paths
+                     if not any(other.startswith(path + ' > ') for other in paths))
+
+
+def trim_product(product, description_chars=LLM_DESCRIPTION_CHARS):
+    """Product fields as the model should see them: short descriptions and categories"""
+    product = dict(product)
+    for field in DESCRIPTION_FIELDS:
+        if isinstance(product.get(field), str):
+            product[field] = truncate_text(product[field], description_chars)
+    if isinstance(product.get('Categories'), str):
+        product['Categories'] = dedupe_categories(product['Categories'])
+    return product
+
+
+def fit_token_budget(payload, token_budget, cursor=0, model=DEFAULT_MODEL):
+    """Page of a product search payload that renders in at most token_budget tokens.
+
+    Products are trimmed with trim_product() and kept in rank order starting
+    at position cursor, but the first one is always included. When products
+    are left over, next_cursor is the position to continue from. Payloads
+    without a product list are returned as they are.
+    """
+    products = payload.get('products')
+    # cached results hold their products in a tuple
+    if not isinstance(products, (list, tuple)):
+        return payload
+
+    # the cursor comes from the model; a negative one would slice from the end
+    cursor = max(0, int(cursor))
+    total = len(products)
+    page = {key: value for key, value in payload.items() if key != 'products'}
+    page['products'] = []
+    # the page without products, plus room for the cursor fields
+    used = count_tokens(render_for_llm(page), model) + \
+        count_tokens(render_for_llm({'next_cursor': total, 'remaining': total}), model)
+    end = cursor
+    for product in products[cursor:]:
+        product = trim_product(product)
+        # one more token for the separating comma
+        cost = count_tokens(render_for_llm(product), model) + 1
+        if page['products'] and used + cost > token_budget:
+            break
+        page['products'].append(product)
+        used += cost
+        end += 1
+
+    if end < total:
+        page['next_cursor'] = end
+        page['remaining'] = total - end
+    if cursor or end < total:
+        page['status'] = (f"{total} products found, showing {cursor + 1}-{end}" if end > cursor
+                          else f"No more products, all {total} were shown")
+    return page
@@ -62,30 +62,12 @@ export default function Chatbot() {
     return () => window.removeEventListener('beforeunload', handleUnload);
   }, [sessionId, accessToken]);
 
-  const handleFakeStreaming = (fullResponse: string) => {
-    const chunkSize = 5;
-    const totalChunks = Math.ceil(fullResponse.length / chunkSize);
-    let currentChunk = 0;
-    const interval = setInterval(() => {
-      if (currentChunk < totalChunks) {
-        setMessages((prev) => {
-          const lastMessage = prev[prev.length - 1];
-          if (lastMessage.sender === 'SwishBot') {
-            const start = currentChunk * chunkSize;
-            const end = Math.min(start + chunkSize, fullResponse.length);
-            const updatedMessage = {
-              ...lastMessage,
-              content: fullResponse.slice(0, end),
-            };
-            return [...prev.slice(0, -1), updatedMessage];
-          }
-          return prev;
-        });
-        currentChunk++;
-      } else {
-        clearInterval(interval);
-      }
-    }, 50);
+  const appendToMessage = (id: number, text: string) => {
+    setMessages((prev) =>
+      prev.map((message) =>
+        message.id === id ? { ...message, content: message.content + text } : message
+      )
+    );
   };
 
   const handleSubmit = async (e: React.FormEvent<HTMLFormElement>) => {
@@ -97,10 +79,12 @@ export default function Chatbot() {
       content: input,
       sender: 'You',
     };
+    const botMessageId = messages.length + 2;
     setMessages([...messages, userMessage]);
     setInput('');
     setThinking(true);
 
+    let started = false;
     try {
       const headers: Record<string, string> = {
         'Content-Type': 'application/json',
@@ -110,30 +94,52 @@ export default function Chatbot() {
         headers['Authorization'] = `Bearer ${accessToken}`;
       }
 
-      const response = await fetch('http://localhost:8081/chat', {
+      // the reply streams in as server-sent events while the bot is still working
+      const response = await fetch('http://localhost:8081/chat/stream', {
         method: 'POST',
         headers,
         body: JSON.stringify({ message: input, session_id: sessionId }),
       });
 
-      const data = await response.json();
-      setThinking(false);
-      
-      if (!data.response) {
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
         throw new Error(data.detail || 'No response received from server');
       }
 
-      const botMessage: Message = {
-        id: messages.length + 2,
-        content: '',
-        sender: 'SwishBot',
-      };
-      setMessages((prev) => [...prev, botMessage]);
-      handleFakeStreaming(data.response);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop() ?? '';
+        for (const frame of frames) {
+          const data = frame.split('\n').find((line) => line.startsWith('data: '));
+          if (!data) continue;
+          const event = JSON.parse(data.slice('data: '.length));
+          if (event.event === 'error') {
+            throw new Error(event.message);
+          }
+          if (event.event !== 'token') continue;
+          if (!started) {
+            started = true;
+            setThinking(false);
+            setMessages((prev) => [...prev, { id: botMessageId, content: '', sender: 'SwishBot' }]);
+          }
+          appendToMessage(botMessageId, event.content);
+        }
+      }
+
+      setThinking(false);
+      if (!started) {
+        throw new Error('No response received from server');
+      }
     } catch (error) {
       setThinking(false);
       const errorMessage: Message = {
-        id: messages.length + 2,
+        id: started ? botMessageId + 1 : botMessageId,
         content:
           "Sorry, I couldn't process your request at this time. Error: " +
           (error instanceof Error ? error.message : String(error)),